@@ -1,11 +1,13 @@
 # modified from https://github.com/yangdongchao/SoundStorm/blob/master/soundstorm/s1/AR/models/t2s_model.py
 # reference: https://github.com/lifeiteng/vall-e
 import math
+import time
 from typing import List, Optional
 
 import torch
 from torch import nn
 from torch.nn import functional as F
+from torch.profiler import record_function
 from torchmetrics.classification import MulticlassAccuracy
 from tqdm import tqdm
 
@@ -257,6 +259,13 @@ class T2STransformer:
         return x, k_cache, v_cache
 
 
+def _add_decode_stats(stats: dict, t_start: float, t_prefill: float, idx: int):
+    stats["prefill"] = stats.get("prefill", 0.0) + t_prefill - t_start
+    stats["decode"] = stats.get("decode", 0.0) + time.perf_counter() - t_prefill
+    # 不含 prefill 的解码步数
+    stats["steps"] = stats.get("steps", 0) + idx
+
+
 class Text2SemanticDecoder(nn.Module):
     def __init__(self, config, norm_first=False, top_k=3):
         super(Text2SemanticDecoder, self).__init__()
@@ -608,6 +617,10 @@ class Text2SemanticDecoder(nn.Module):
             )
 
         max_len = kwargs.get("max_len", x_lens.max())
+        # 每个token检查一次, 返回True时提前结束解码 (请求被取消)
+        should_stop = kwargs.get("should_stop", None)
+        # 可选, 累加 prefill/decode 用时、解码步数和达到最大长度的次数, 见 TTS_infer_pack.metrics.observe_t2s
+        stats = kwargs.get("stats", None)
         x_list = []
         for x_item, bert_item in zip(x, bert_feature):
             # max_len = max(max_len, x_item.shape[0], bert_item.shape[1])
@@ -698,12 +711,17 @@ class Text2SemanticDecoder(nn.Module):
         y_list = [None] * y.shape[0]
         batch_idx_map = list(range(y.shape[0]))
         idx_list = [None] * y.shape[0]
+        t_start = time.perf_counter()
+        t_prefill = t_start
         for idx in tqdm(range(1500)):
-            if idx == 0:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
-            else:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
-            logits = self.ar_predict_layer(xy_dec[:, -1])
+            with record_function("t2s_prefill" if idx == 0 else "t2s_decode"):
+                if idx == 0:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+                else:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(
+                        xy_pos, k_cache, v_cache, attn_mask
+                    )
+                logits = self.ar_predict_layer(xy_dec[:, -1])
 
             if idx == 0:
                 attn_mask = F.pad(attn_mask[:, :, -1].unsqueeze(-2), (0, 1), value=False)
@@ -711,9 +729,10 @@ class Text2SemanticDecoder(nn.Module):
             else:
                 attn_mask = F.pad(attn_mask, (0, 1), value=False)
 
-            samples = sample(
-                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
-            )[0]
+            with record_function("t2s_sample"):
+                samples = sample(
+                    logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
+                )[0]
 
             y = torch.concat([y, samples], dim=1)
 
@@ -744,8 +763,16 @@ class Text2SemanticDecoder(nn.Module):
                         k_cache[i] = torch.index_select(k_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
                         v_cache[i] = torch.index_select(v_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
 
-            if (early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num) or idx == 1499:
-                print("use early stop num:", early_stop_num)
+            if idx == 0:
+                t_prefill = time.perf_counter()
+            cancelled = should_stop is not None and should_stop()
+            if cancelled or (early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num) or idx == 1499:
+                if cancelled:
+                    print("T2S Decoding cancelled")
+                else:
+                    print("use early stop num:", early_stop_num)
+                    if stats is not None:
+                        stats["early_stop"] = stats.get("early_stop", 0) + len(batch_idx_map)
                 stop = True
                 for i, batch_index in enumerate(batch_idx_map):
                     batch_index = batch_idx_map[i]
@@ -760,6 +787,8 @@ class Text2SemanticDecoder(nn.Module):
                     y = torch.concat([y, torch.zeros_like(samples)], dim=1)
                     print("bad zero prediction")
                 print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                if stats is not None:
+                    _add_decode_stats(stats, t_start, t_prefill, idx)
                 break
 
             ####################### update next step ###################################
@@ -824,6 +853,8 @@ class Text2SemanticDecoder(nn.Module):
         repetition_penalty: float = 1.35,
         **kwargs,
     ):
+        should_stop = kwargs.get("should_stop", None)
+        stats = kwargs.get("stats", None)
         x = self.ar_text_embedding(x)
         x = x + self.bert_proj(bert_feature.transpose(1, 2))
         x = self.ar_text_position(x)
@@ -875,36 +906,49 @@ class Text2SemanticDecoder(nn.Module):
             .to(device=x.device, dtype=torch.bool)
         )
 
+        t_start = time.perf_counter()
+        t_prefill = t_start
         for idx in tqdm(range(1500)):
-            if xy_attn_mask is not None:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
-            else:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache)
+            with record_function("t2s_prefill" if xy_attn_mask is not None else "t2s_decode"):
+                if xy_attn_mask is not None:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+                else:
+                    xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache)
 
-            logits = self.ar_predict_layer(xy_dec[:, -1])
+                logits = self.ar_predict_layer(xy_dec[:, -1])
 
             if idx == 0:
                 xy_attn_mask = None
             if idx < 11:  ###至少预测出10个token不然不给停止（0.4s）
                 logits = logits[:, :-1]
 
-            samples = sample(
-                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
-            )[0]
+            with record_function("t2s_sample"):
+                samples = sample(
+                    logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
+                )[0]
 
             y = torch.concat([y, samples], dim=1)
 
             if early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num:
                 print("use early stop num:", early_stop_num)
                 stop = True
+                if stats is not None:
+                    stats["early_stop"] = stats.get("early_stop", 0) + 1
 
             if torch.argmax(logits, dim=-1)[0] == self.EOS or samples[0, 0] == self.EOS:
                 stop = True
+            if idx == 0:
+                t_prefill = time.perf_counter()
+            if should_stop is not None and should_stop():
+                print("T2S Decoding cancelled")
+                stop = True
             if stop:
                 if y.shape[1] == 0:
                     y = torch.concat([y, torch.zeros_like(samples)], dim=1)
                     print("bad zero prediction")
                 print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                if stats is not None:
+                    _add_decode_stats(stats, t_start, t_prefill, idx)
                 break
 
             ####################### update next step ###################################
@@ -5,6 +5,7 @@ import random
 import sys
 import time
 import traceback
+import weakref
 from copy import deepcopy
 
 import torchaudio
@@ -13,28 +14,39 @@ from tqdm import tqdm
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 import os
-from typing import List, Tuple, Union
+from typing import Callable, Dict, List, Tuple, Union
 
 import ffmpeg
-import librosa
 import numpy as np
 import torch
 import torch.nn.functional as F
 import yaml
+from torch.profiler import record_function
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
 from BigVGAN.bigvgan import BigVGAN
 from feature_extractor.cnhubert import CNHubert
 from module.mel_processing import mel_spectrogram_torch, spectrogram_torch
 from module.models import SynthesizerTrn, SynthesizerTrnV3, Generator
 from peft import LoraConfig, get_peft_model
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import (
+    get_sovits_version_from_path_fast,
+    load_gpt_new,
+    load_sovits_new,
+    load_state_dict_assign,
+    skip_random_init,
+)
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 
 from tools.audio_sr import AP_BWE
 from tools.i18n.i18n import I18nAuto, scan_language_list
 from TTS_infer_pack.text_segmentation_method import splits
 from TTS_infer_pack.TextPreprocessor import TextPreprocessor
-from sv import SV
+from TTS_infer_pack.request_context import RequestContext
+from TTS_infer_pack import metrics, profiling
+from TTS_infer_pack.voice_cache import VoiceCache
+from TTS_infer_pack.voice_profile import load_voice_profile, save_voice_profile
+from sv import SV, sv_path
+from text.cleaner import warmup_texts
 
 resample_transform_dict = {}
 
@@ -47,6 +59,43 @@ def resample(audio_tensor, sr0, sr1, device):
     return resample_transform_dict[key](audio_tensor)
 
 
+class ReferenceAudio:
+    """
+    A reference audio decoded once, every model input is derived from the native rate waveform through the
+    cached resamplers of resample(), each rate at most once: HuBERT and the speaker verification model share
+    the 16 kHz signal, the SoVITS spectrogram and the v3/v4 mel prompt share theirs when the rates match.
+    """
+
+    def __init__(self, raw_audio: torch.Tensor, raw_sr: int, device):
+        """
+        Args:
+            raw_audio: torch.Tensor, (channels, T) float waveform at raw_sr, as returned by torchaudio.load.
+        """
+        self.raw_audio = raw_audio.to(device).float()
+        self.raw_sr = raw_sr
+        self.device = device
+        self._resampled: Dict[int, torch.Tensor] = {}
+
+    @classmethod
+    def load(cls, path: str, device) -> "ReferenceAudio":
+        raw_audio, raw_sr = torchaudio.load(path)
+        return cls(raw_audio, raw_sr, device)
+
+    def at(self, sr: int) -> torch.Tensor:
+        """
+        Mono (1, T) waveform at sr, shared by the callers: it must not be modified in place.
+        """
+        audio = self._resampled.get(sr)
+        if audio is None:
+            audio = self.raw_audio
+            if audio.shape[0] > 1:
+                audio = audio.mean(0, keepdim=True)
+            if sr != self.raw_sr:
+                audio = resample(audio, self.raw_sr, sr, self.device)
+            self._resampled[sr] = audio
+        return audio
+
+
 language = os.environ.get("language", "Auto")
 language = sys.argv[-1] if sys.argv[-1] in scan_language_list() else language
 i18n = I18nAuto(language=language)
@@ -326,6 +375,11 @@ class TTS_Config:
         self.vits_weights_path = self.configs.get("vits_weights_path", None)
         self.bert_base_path = self.configs.get("bert_base_path", None)
         self.cnhuhbert_base_path = self.configs.get("cnhuhbert_base_path", None)
+        # 参考音色缓存的字节预算, 总预算 / 驻留在推理设备上的预算
+        self.voice_cache_max_bytes: int = int(self.configs.get("voice_cache_max_bytes", 1 << 30))
+        self.voice_cache_max_gpu_bytes: int = int(self.configs.get("voice_cache_max_gpu_bytes", 512 << 20))
+        # 只使用预编译音色 (voice_profile) 时不加载 CNHuBERT 和 SV 模型
+        self.profile_only: bool = bool(self.configs.get("profile_only", False))
         self.languages = self.v1_languages if self.version == "v1" else self.v2_languages
 
         self.use_vocoder: bool = False
@@ -372,6 +426,9 @@ class TTS_Config:
 
         if configs_path is None:
             configs_path = self.configs_path
+        if configs_path is None:
+            # 例如模型注册表中的条目, 不写回配置文件
+            return
         with open(configs_path, "w") as f:
             yaml.dump(configs, f)
 
@@ -384,6 +441,9 @@ class TTS_Config:
             "vits_weights_path": self.vits_weights_path,
             "bert_base_path": self.bert_base_path,
             "cnhuhbert_base_path": self.cnhuhbert_base_path,
+            "voice_cache_max_bytes": self.voice_cache_max_bytes,
+            "voice_cache_max_gpu_bytes": self.voice_cache_max_gpu_bytes,
+            "profile_only": self.profile_only,
         }
         return self.config
 
@@ -410,7 +470,13 @@ class TTS_Config:
 
 
 class TTS:
-    def __init__(self, configs: Union[dict, str, TTS_Config]):
+    def __init__(self, configs: Union[dict, str, TTS_Config], shared: "TTS" = None):
+        """
+        Args:
+            configs: TTS_Config, or a dict/path to build one from.
+            shared: TTS, (optional) reuse its BERT, CNHuBERT, SV, super-resolution model, vocoders,
+                text frontend and voice cache, only the GPT and SoVITS weights are loaded (see ModelRegistry).
+        """
         if isinstance(configs, TTS_Config):
             self.configs = configs
         else:
@@ -433,12 +499,26 @@ class TTS:
             "upsample_rate": None,
             "overlapped_len": None,
         }
-
-        self._init_models()
-
-        self.text_preprocessor: TextPreprocessor = TextPreprocessor(
-            self.bert_model, self.bert_tokenizer, self.configs.device
-        )
+        # 版本 -> (vocoder, vocoder_configs), 多个 TTS 共享时使用, 见 enable_component_sharing
+        self._vocoder_pool: dict = None
+
+        if shared is not None:
+            shared.enable_component_sharing()
+            self.bert_tokenizer = shared.bert_tokenizer
+            self.bert_model = shared.bert_model
+            self.cnhuhbert_model = shared.cnhuhbert_model
+            self.sv_model = shared.sv_model
+            self.sr_model = shared.sr_model
+            self.sr_model_not_exist = shared.sr_model_not_exist
+            self._vocoder_pool = shared._vocoder_pool
+            self.init_t2s_weights(self.configs.t2s_weights_path)
+            self.init_vits_weights(self.configs.vits_weights_path)
+            self.text_preprocessor: TextPreprocessor = shared.text_preprocessor
+        else:
+            self._init_models()
+            self.text_preprocessor: TextPreprocessor = TextPreprocessor(
+                self.bert_model, self.bert_tokenizer, self.configs.device
+            )
 
         self.prompt_cache: dict = {
             "ref_audio_path": None,
@@ -450,9 +530,20 @@ class TTS:
             "bert_features": None,
             "norm_text": None,
             "aux_ref_audio_paths": [],
+            "sv_emb": None,
+            "prompt_mel": None,
         }
+        if shared is not None:
+            # 缓存键包含模型版本和 SoVITS 权重路径, 可以安全共享
+            self.voice_cache: VoiceCache = shared.voice_cache
+        else:
+            self.voice_cache: VoiceCache = VoiceCache(
+                max_bytes=self.configs.voice_cache_max_bytes,
+                max_gpu_bytes=self.configs.voice_cache_max_gpu_bytes,
+            )
 
-        self.stop_flag: bool = False
+        # 正在进行的请求, stop() 取消全部
+        self._active_contexts: "weakref.WeakSet[RequestContext]" = weakref.WeakSet()
         self.precision: torch.dtype = torch.float16 if self.configs.is_half else torch.float32
 
     def _init_models(
@@ -461,7 +552,8 @@ class TTS:
         self.init_t2s_weights(self.configs.t2s_weights_path)
         self.init_vits_weights(self.configs.vits_weights_path)
         self.init_bert_weights(self.configs.bert_base_path)
-        self.init_cnhuhbert_weights(self.configs.cnhuhbert_base_path)
+        if not self.configs.profile_only:
+            self.init_cnhuhbert_weights(self.configs.cnhuhbert_base_path)
         # self.enable_half_precision(self.configs.is_half)
 
     def init_cnhuhbert_weights(self, base_path: str):
@@ -484,7 +576,7 @@ class TTS:
     def init_vits_weights(self, weights_path: str):
         self.configs.vits_weights_path = weights_path
         version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(weights_path)
-        if "Pro" in model_version:
+        if "Pro" in model_version and not self.configs.profile_only:
             self.init_sv_model()
         path_sovits = self.configs.default_configs[model_version]["vits_weights_path"]
 
@@ -526,22 +618,25 @@ class TTS:
 
         # print(f"model_version:{model_version}")
         # print(f'hps["model"]["version"]:{hps["model"]["version"]}')
+        # 权重随后整体载入, 跳过随机初始化
         if model_version not in v3v4set:
-            vits_model = SynthesizerTrn(
-                self.configs.filter_length // 2 + 1,
-                self.configs.segment_size // self.configs.hop_length,
-                n_speakers=self.configs.n_speakers,
-                **kwargs,
-            )
+            with skip_random_init():
+                vits_model = SynthesizerTrn(
+                    self.configs.filter_length // 2 + 1,
+                    self.configs.segment_size // self.configs.hop_length,
+                    n_speakers=self.configs.n_speakers,
+                    **kwargs,
+                )
             self.configs.use_vocoder = False
         else:
             kwargs["version"] = model_version
-            vits_model = SynthesizerTrnV3(
-                self.configs.filter_length // 2 + 1,
-                self.configs.segment_size // self.configs.hop_length,
-                n_speakers=self.configs.n_speakers,
-                **kwargs,
-            )
+            with skip_random_init():
+                vits_model = SynthesizerTrnV3(
+                    self.configs.filter_length // 2 + 1,
+                    self.configs.segment_size // self.configs.hop_length,
+                    n_speakers=self.configs.n_speakers,
+                    **kwargs,
+                )
             self.configs.use_vocoder = True
             self.init_vocoder(model_version)
             if "pretrained" not in weights_path and hasattr(vits_model, "enc_q"):
@@ -550,12 +645,15 @@ class TTS:
         self.is_v2pro = model_version in {"v2Pro", "v2ProPlus"}
 
         if if_lora_v3 == False:
+            if self.configs.is_half and str(self.configs.device) != "cpu":
+                # 先转成半精度, 半精度权重(如内存映射的 safetensors)可直接使用而不复制
+                vits_model = vits_model.half()
             print(
-                f"Loading VITS weights from {weights_path}. {vits_model.load_state_dict(dict_s2['weight'], strict=False)}"
+                f"Loading VITS weights from {weights_path}. {load_state_dict_assign(vits_model, dict_s2['weight'], strict=False)}"
             )
         else:
             print(
-                f"Loading VITS pretrained weights from {weights_path}. {vits_model.load_state_dict(load_sovits_new(path_sovits)['weight'], strict=False)}"
+                f"Loading VITS pretrained weights from {weights_path}. {load_state_dict_assign(vits_model, load_sovits_new(path_sovits)['weight'], strict=False)}"
             )
             lora_rank = dict_s2["lora_rank"]
             lora_config = LoraConfig(
@@ -580,25 +678,44 @@ class TTS:
 
         self.configs.save_configs()
 
-
-
     def init_t2s_weights(self, weights_path: str):
         print(f"Loading Text2Semantic weights from {weights_path}")
         self.configs.t2s_weights_path = weights_path
         self.configs.save_configs()
         self.configs.hz = 50
-        dict_s1 = torch.load(weights_path, map_location=self.configs.device, weights_only=False)
+        dict_s1 = load_gpt_new(weights_path)
         config = dict_s1["config"]
         self.configs.max_sec = config["data"]["max_sec"]
-        t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
-        t2s_model.load_state_dict(dict_s1["weight"])
+        with skip_random_init():
+            t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
+        if self.configs.is_half and str(self.configs.device) != "cpu":
+            t2s_model = t2s_model.half()
+        load_state_dict_assign(t2s_model, dict_s1["weight"])
         t2s_model = t2s_model.to(self.configs.device)
         t2s_model = t2s_model.eval()
         self.t2s_model = t2s_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.t2s_model = self.t2s_model.half()
 
+    def enable_component_sharing(self):
+        """
+        Keep every loaded vocoder in a pool shared with the pipelines created with TTS(configs, shared=self),
+        instead of freeing the previous vocoder when the version changes.
+        """
+        if self._vocoder_pool is not None:
+            return
+        self._vocoder_pool = {}
+        if self.vocoder is not None and self.configs.version in ["v3", "v4"]:
+            self._vocoder_pool[self.configs.version] = (self.vocoder, dict(self.vocoder_configs))
+
     def init_vocoder(self, version: str):
+        if self._vocoder_pool is not None:
+            if version in self._vocoder_pool:
+                self.vocoder, vocoder_configs = self._vocoder_pool[version]
+                self.vocoder_configs.update(vocoder_configs)
+                return
+            # 共享的声码器由池持有, 不能在这里释放
+            self.vocoder = None
         if version == "v3":
             if self.vocoder is not None and self.vocoder.__class__.__name__ == "BigVGAN":
                 return
@@ -658,6 +775,8 @@ class TTS:
             self.vocoder = self.vocoder.half().to(self.configs.device)
         else:
             self.vocoder = self.vocoder.to(self.configs.device)
+        if self._vocoder_pool is not None:
+            self._vocoder_pool[version] = (self.vocoder, dict(self.vocoder_configs))
 
     def init_sr_model(self):
         if self.sr_model is not None:
@@ -736,44 +855,244 @@ class TTS:
 
     def set_ref_audio(self, ref_audio_path: str):
         """
-        To set the reference audio for the TTS model,
+        To set the default reference audio for the TTS model,
             including the prompt_semantic and refer_spepc.
+            It is used by run() when no ref_audio_path is given.
         Args:
             ref_audio_path: str, the path of the reference audio.
         """
-        self._set_prompt_semantic(ref_audio_path)
-        self._set_ref_spec(ref_audio_path)
-        self._set_ref_audio_path(ref_audio_path)
-
-    def _set_ref_audio_path(self, ref_audio_path):
+        voice = self.get_voice(ref_audio_path)
+        for key in ["prompt_semantic", "raw_audio", "raw_sr", "sv_emb", "prompt_mel"]:
+            self.prompt_cache[key] = voice[key]
+        self.prompt_cache["refer_spec"] = list(voice["refer_spec"])
         self.prompt_cache["ref_audio_path"] = ref_audio_path
 
-    def _set_ref_spec(self, ref_audio_path):
-        spec_audio = self._get_ref_spec(ref_audio_path)
-        if self.prompt_cache["refer_spec"] in [[], None]:
-            self.prompt_cache["refer_spec"] = [spec_audio]
-        else:
-            self.prompt_cache["refer_spec"][0] = spec_audio
-
-    def _get_ref_spec(self, ref_audio_path):
-        raw_audio, raw_sr = torchaudio.load(ref_audio_path)
-        raw_audio = raw_audio.to(self.configs.device).float()
-        self.prompt_cache["raw_audio"] = raw_audio
-        self.prompt_cache["raw_sr"] = raw_sr
-
-        if raw_sr != self.configs.sampling_rate:
-            audio = raw_audio.to(self.configs.device)
-            if audio.shape[0] == 2:
-                audio = audio.mean(0).unsqueeze(0)
-            audio = resample(audio, raw_sr, self.configs.sampling_rate, self.configs.device)
-        else:
-            audio = raw_audio.to(self.configs.device)
-            if audio.shape[0] == 2:
-                audio = audio.mean(0).unsqueeze(0)
+    def _voice_model_version(self) -> tuple:
+        # prompt_semantic/refer_spec 取决于 SoVITS 权重和精度, 音素取决于版本
+        return (self.configs.version, self.configs.vits_weights_path, self.configs.is_half)
+
+    def get_voice(
+        self,
+        ref_audio_path: str,
+        aux_ref_audio_paths: list = None,
+        prompt_text: str = None,
+        prompt_lang: str = None,
+    ) -> dict:
+        """
+        Get the reference voice features from the voice cache, extract and cache them on a miss.
+        The returned dict has the same fields as prompt_cache and must not be modified.
+        Args:
+            ref_audio_path: str, the path of the reference audio.
+            aux_ref_audio_paths: list, auxiliary reference audio paths for multi-speaker tone fusion.
+            prompt_text: str, prompt text for the reference audio, already normalized by run().
+            prompt_lang: str, language of the prompt text.
+        """
+        aux_paths = []
+        for path in aux_ref_audio_paths or []:
+            if path in [None, ""]:
+                continue
+            if not os.path.exists(path):
+                print(i18n("音频文件不存在，跳过："), path)
+                continue
+            aux_paths.append(path)
+        if prompt_text in [None, ""]:
+            prompt_text, prompt_lang = None, None
+
+        key = self.voice_cache.make_key(
+            ref_audio_path, aux_paths, prompt_text, prompt_lang, self._voice_model_version()
+        )
+        voice = self.voice_cache.get(key, self.configs.device)
+        if voice is not None:
+            return voice
+        if self.cnhuhbert_model is None:
+            raise ValueError(i18n("CNHuBERT 未加载 (profile_only), 请使用预编译的音色文件 voice_profile"))
+
+        # 参考音频只解码一次, 各模型需要的采样率由它重采样得到
+        ref_audio = ReferenceAudio.load(ref_audio_path, self.configs.device)
+        voice = {
+            "ref_audio_path": ref_audio_path,
+            "prompt_semantic": self._get_prompt_semantic(ref_audio),
+            "refer_spec": [self._get_ref_spec(ref_audio)],
+            "raw_audio": ref_audio.raw_audio,
+            "raw_sr": ref_audio.raw_sr,
+            "prompt_text": prompt_text,
+            "prompt_lang": prompt_lang,
+            "phones": None,
+            "bert_features": None,
+            "norm_text": None,
+            "aux_ref_audio_paths": aux_paths,
+            "sv_emb": None,
+            "prompt_mel": None,
+        }
+        for path in aux_paths:
+            voice["refer_spec"].append(self._get_ref_spec(ReferenceAudio.load(path, self.configs.device)))
+        if self.is_v2pro:
+            voice["sv_emb"] = [
+                self.sv_model.compute_embedding3(audio_tensor) for _, audio_tensor in voice["refer_spec"]
+            ]
+        if self.configs.use_vocoder:
+            voice["prompt_mel"] = self._get_prompt_mel(ref_audio)
+        if prompt_text is not None:
+            phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
+                prompt_text, prompt_lang, self.configs.version
+            )
+            voice["phones"] = phones
+            voice["bert_features"] = bert_features
+            voice["norm_text"] = norm_text
+        return self.voice_cache.put(key, voice, self.configs.device)
+
+    def prepare_voice(
+        self,
+        ref_audio_path: str = None,
+        aux_ref_audio_paths: list = None,
+        prompt_text: str = None,
+        prompt_lang: str = None,
+        voice_profile: str = None,
+    ) -> Tuple[dict, bool]:
+        """
+        Resolve the reference voice of a request, see run() for the arguments.
+        Returns:
+            voice: dict, reference voice features (read-only).
+            no_prompt_text: bool, whether the voice has no prompt text.
+        """
+        voice: dict = None
+        if voice_profile not in [None, ""]:
+            # 预编译的音色, 参考文本也来自音色文件
+            voice = self.load_voice_profile(voice_profile)
+            prompt_text, prompt_lang = voice["prompt_text"], voice["prompt_lang"]
+
+        no_prompt_text = False
+        if prompt_text in [None, ""]:
+            no_prompt_text = True
+
+        if not no_prompt_text:
+            assert prompt_lang in self.configs.languages
+
+        if no_prompt_text and self.configs.use_vocoder:
+            raise NO_PROMPT_ERROR("prompt_text cannot be empty when using SoVITS_V3")
+
+        if voice is None:
+            if ref_audio_path in [None, ""]:
+                if self.prompt_cache["ref_audio_path"] is None:
+                    raise ValueError(
+                        "ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()"
+                    )
+                ref_audio_path = self.prompt_cache["ref_audio_path"]
+            if not os.path.exists(ref_audio_path):
+                raise ValueError(f"{ref_audio_path} not exists")
+
+            if not no_prompt_text:
+                prompt_text = self._normalize_prompt_text(prompt_text, prompt_lang)
+                print(i18n("实际输入的参考文本:"), prompt_text)
+
+            # 从音色缓存取参考音频和参考文本的特征, 不修改共享的 prompt_cache
+            voice = self.get_voice(
+                ref_audio_path,
+                aux_ref_audio_paths,
+                prompt_text if not no_prompt_text else None,
+                prompt_lang if not no_prompt_text else None,
+            )
+
+        return voice, no_prompt_text
+
+    def _normalize_prompt_text(self, prompt_text: str, prompt_lang: str) -> str:
+        prompt_text = prompt_text.strip("\n")
+        if prompt_text[-1] not in splits:
+            prompt_text += "。" if prompt_lang != "en" else "."
+        return prompt_text
+
+    def _voice_profile_meta(self) -> dict:
+        return {
+            "version": self.configs.version,
+            "vits_weights_path": self.configs.vits_weights_path,
+            "vits_weights_sha1": self.voice_cache.hash_file(self.configs.vits_weights_path),
+            "cnhuhbert_base_path": self.configs.cnhuhbert_base_path,
+            "cnhuhbert_sha1": self.voice_cache.hash_path(self.configs.cnhuhbert_base_path),
+            "bert_base_path": self.configs.bert_base_path,
+            "bert_sha1": self.voice_cache.hash_path(self.configs.bert_base_path),
+            "sv_sha1": self.voice_cache.hash_path(sv_path) if self.is_v2pro else None,
+            "sampling_rate": self.configs.sampling_rate,
+        }
+
+    def compile_voice_profile(
+        self,
+        output_path: str,
+        ref_audio_path: str,
+        aux_ref_audio_paths: list = None,
+        prompt_text: str = None,
+        prompt_lang: str = None,
+    ) -> None:
+        """
+        Extract all the reference features and write them to a voice profile (.npz),
+            see voice_profile.py.
+        Args:
+            output_path: str, path of the voice profile.
+            ref_audio_path: str, the path of the reference audio.
+            aux_ref_audio_paths: list, auxiliary reference audio paths for multi-speaker tone fusion.
+            prompt_text: str, prompt text for the reference audio.
+            prompt_lang: str, language of the prompt text.
+        """
+        if prompt_text not in [None, ""]:
+            assert prompt_lang in self.configs.languages
+            prompt_text = self._normalize_prompt_text(prompt_text, prompt_lang)
+        voice = self.get_voice(ref_audio_path, aux_ref_audio_paths, prompt_text, prompt_lang)
+        save_voice_profile(output_path, voice, self._voice_profile_meta())
 
+    def load_voice_profile(self, profile_path: str) -> dict:
+        """
+        Load a voice profile written by compile_voice_profile, through the voice cache.
+        The profile must have been compiled with the SoVITS weights currently loaded, and with the same
+        CNHuBERT, BERT and (v2Pro) SV model files when they are present on this node.
+        Args:
+            profile_path: str, path of the voice profile.
+        """
+        if not os.path.exists(profile_path):
+            raise ValueError(f"{profile_path} not exists")
+        key = self.voice_cache.make_profile_key(profile_path, self._voice_model_version())
+        voice = self.voice_cache.get(key, self.configs.device)
+        if voice is not None:
+            return voice
+
+        voice, meta = load_voice_profile(profile_path)
+        expected = self._voice_profile_meta()
+        for name in ["version", "vits_weights_sha1"]:
+            if meta.get(name) != expected[name]:
+                raise ValueError(
+                    f"{profile_path} was compiled for {name}={meta.get(name)}, current model has {expected[name]}"
+                )
+        # 旧版音色文件没有记录, profile_only 的节点可能没有 CNHuBERT/SV 模型文件, 这两种情况无法比较
+        for name in ["cnhuhbert_sha1", "bert_sha1", "sv_sha1"]:
+            if meta.get(name) is None or expected[name] is None:
+                continue
+            if meta[name] != expected[name]:
+                raise ValueError(
+                    f"{profile_path} was compiled for {name}={meta[name]}, current model has {expected[name]}"
+                )
+        if self.is_v2pro and voice["sv_emb"] is None:
+            raise ValueError(f"{profile_path} has no sv_emb, recompile it with a v2Pro model")
+        if self.configs.use_vocoder and voice["prompt_mel"] is None:
+            raise ValueError(f"{profile_path} has no mel prompt, recompile it with a v3/v4 model")
+
+        precision = self.precision
+        device = self.configs.device
+        voice["prompt_semantic"] = voice["prompt_semantic"].to(device)
+        voice["refer_spec"] = [(spec.to(dtype=precision, device=device), None) for spec, _ in voice["refer_spec"]]
+        if voice["sv_emb"] is not None:
+            voice["sv_emb"] = [sv_emb.to(dtype=precision, device=device) for sv_emb in voice["sv_emb"]]
+        if voice["prompt_mel"] is not None:
+            voice["prompt_mel"] = voice["prompt_mel"].to(device)
+        return self.voice_cache.put(key, voice, device)
+
+    @staticmethod
+    def _limit_peak(audio: torch.Tensor) -> torch.Tensor:
+        # 不原地修改, ReferenceAudio 的各采样率共用
         maxx = audio.abs().max()
         if maxx > 1:
-            audio /= min(2, maxx)
+            audio = audio / min(2, maxx)
+        return audio
+
+    def _get_ref_spec(self, ref_audio: ReferenceAudio):
+        audio = self._limit_peak(ref_audio.at(self.configs.sampling_rate))
         spec = spectrogram_torch(
             audio,
             self.configs.filter_length,
@@ -785,25 +1104,24 @@ class TTS:
         if self.configs.is_half:
             spec = spec.half()
         if self.is_v2pro == True:
-            audio = resample(audio, self.configs.sampling_rate, 16000, self.configs.device)
+            # 与 HuBERT 共用 16k 信号, 不再从 SoVITS 采样率重采样
+            audio = self._limit_peak(ref_audio.at(16000))
             if self.configs.is_half:
                 audio = audio.half()
         else:
             audio = None
         return spec, audio
 
-    def _set_prompt_semantic(self, ref_wav_path: str):
+    def _get_prompt_semantic(self, ref_audio: ReferenceAudio) -> torch.Tensor:
         zero_wav = np.zeros(
             int(self.configs.sampling_rate * 0.3),
             dtype=np.float16 if self.configs.is_half else np.float32,
         )
         with torch.no_grad():
-            wav16k, sr = librosa.load(ref_wav_path, sr=16000)
+            wav16k = ref_audio.at(16000)[0]
             if wav16k.shape[0] > 160000 or wav16k.shape[0] < 48000:
                 raise OSError(i18n("参考音频在3~10秒范围外，请更换！"))
-            wav16k = torch.from_numpy(wav16k)
             zero_wav_torch = torch.from_numpy(zero_wav)
-            wav16k = wav16k.to(self.configs.device)
             zero_wav_torch = zero_wav_torch.to(self.configs.device)
             if self.configs.is_half:
                 wav16k = wav16k.half()
@@ -816,7 +1134,7 @@ class TTS:
             codes = self.vits_model.extract_latent(hubert_feature)
 
             prompt_semantic = codes[0, 0].to(self.configs.device)
-            self.prompt_cache["prompt_semantic"] = prompt_semantic
+        return prompt_semantic
 
     def batch_sequences(self, sequences: List[torch.Tensor], axis: int = 0, pad_value: int = 0, max_length: int = None):
         seq = sequences[0]
@@ -972,16 +1290,45 @@ class TTS:
                 _data[index] = data[i][j]
         return _data
 
+    def warmup(self, voices: List[dict], languages: List[str] = None) -> dict:
+        """
+        Synthesize a short sentence per voice and language through every stage (text frontend, BERT, T2S, SoVITS,
+        vocoder), so lazily loaded frontends, ONNX sessions, JIT compilation and allocator pools are ready before
+        the first request.
+        Args:
+            voices: list of dict, reference inputs of run() (ref_audio_path/prompt_text/prompt_lang or voice_profile).
+            languages: list of text languages, default: the prompt language of each voice.
+        Returns:
+            dict: {"<voice> <language>": seconds}, in the order they ran.
+        """
+        timings = {}
+        for voice in voices:
+            name = voice.get("voice_profile") or voice.get("ref_audio_path")
+            for language in languages or [voice.get("prompt_lang") or "zh"]:
+                if language not in self.configs.languages:
+                    print(f"Skip warm-up of unsupported language: {language}")
+                    continue
+                # auto/auto_yue 使用中文句子
+                text = warmup_texts.get(language.replace("all_", ""), warmup_texts["zh"])
+                inputs = {**voice, "text": text, "text_lang": language, "text_split_method": "cut0"}
+                t0 = time.perf_counter()
+                for _ in self.run(inputs):
+                    pass
+                timings[f"{name} {language}"] = time.perf_counter() - t0
+        return timings
+
     def stop(
         self,
     ):
         """
-        Stop the inference process.
+        Stop the inference process of every running request.
+        To stop a single request, pass a RequestContext to run() and cancel it.
         """
-        self.stop_flag = True
+        for context in list(self._active_contexts):
+            context.cancel()
 
     @torch.no_grad()
-    def run(self, inputs: dict):
+    def run(self, inputs: dict, context: RequestContext = None):
         """
         Text to speech inference.
 
@@ -990,10 +1337,12 @@ class TTS:
                 {
                     "text": "",                   # str.(required) text to be synthesized
                     "text_lang: "",               # str.(required) language of the text to be synthesized
+                    "text_stream": None,          # Iterable[str].(optional) text deltas, used instead of "text" for incremental input, implies return_fragment.
                     "ref_audio_path": "",         # str.(required) reference audio path
                     "aux_ref_audio_paths": [],    # list.(optional) auxiliary reference audio paths for multi-speaker tone fusion
                     "prompt_text": "",            # str.(optional) prompt text for the reference audio
                     "prompt_lang": "",            # str.(required) language of the prompt text for the reference audio
+                    "voice_profile": None,        # str.(optional) precompiled voice profile (.npz), used instead of ref_audio_path/aux_ref_audio_paths/prompt_text/prompt_lang
                     "top_k": 5,                   # int. top k sampling
                     "top_p": 1,                   # float. top p sampling
                     "temperature": 1,             # float. temperature for sampling
@@ -1009,18 +1358,49 @@ class TTS:
                     "repetition_penalty": 1.35    # float. repetition penalty for T2S model.
                     "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
                     "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+                    "profile": False,             # bool|str.(optional) profile this request, True/"torch" for a Chrome trace, "sampling" for collapsed Python stacks, see profiling.py.
+                    "trace_id": None,             # str.(optional) id the trace is stored under, generated if not given.
                 }
+            context (RequestContext): (optional) cancel token and timings of this request.
         returns:
             Tuple[int, np.ndarray]: sampling rate and audio data.
         """
+        if context is None:
+            context = RequestContext()
+        profile = inputs.get("profile", False)
+        if not profile:
+            yield from self._run(inputs, context)
+            return
+
+        profiler = profiling.RequestProfiler("torch" if profile is True else profile, inputs.get("trace_id", None))
+        if profiler.start():
+            context.trace_id = profiler.trace_id
+        else:
+            # 已有请求在做 torch 分析, 本请求不分析
+            context.trace_skipped = True
+        # 非分段返回时只输出一次, 交出结果前就写入 trace, 不必等生成器被关闭
+        single_output = not inputs.get("return_fragment", False) and inputs.get("text_stream", None) is None
+        try:
+            for item in self._run(inputs, context):
+                if single_output:
+                    context.trace_path = profiler.stop()
+                yield item
+                profiler.track_thread()
+        finally:
+            context.trace_path = profiler.stop()
+
+    @torch.no_grad()
+    def _run(self, inputs: dict, context: RequestContext):
         ########## variables initialization ###########
-        self.stop_flag: bool = False
+        self._active_contexts.add(context)
         text: str = inputs.get("text", "")
+        text_stream = inputs.get("text_stream", None)
         text_lang: str = inputs.get("text_lang", "")
         ref_audio_path: str = inputs.get("ref_audio_path", "")
         aux_ref_audio_paths: list = inputs.get("aux_ref_audio_paths", [])
         prompt_text: str = inputs.get("prompt_text", "")
         prompt_lang: str = inputs.get("prompt_lang", "")
+        voice_profile: str = inputs.get("voice_profile", None)
         top_k: int = inputs.get("top_k", 5)
         top_p: float = inputs.get("top_p", 1)
         temperature: float = inputs.get("temperature", 1)
@@ -1029,7 +1409,7 @@ class TTS:
         batch_threshold = inputs.get("batch_threshold", 0.75)
         speed_factor = inputs.get("speed_factor", 1.0)
         split_bucket = inputs.get("split_bucket", True)
-        return_fragment = inputs.get("return_fragment", False)
+        return_fragment = inputs.get("return_fragment", False) or text_stream is not None
         fragment_interval = inputs.get("fragment_interval", 0.3)
         seed = inputs.get("seed", -1)
         seed = -1 if seed in ["", None] else seed
@@ -1038,13 +1418,12 @@ class TTS:
         repetition_penalty = inputs.get("repetition_penalty", 1.35)
         sample_steps = inputs.get("sample_steps", 32)
         super_sampling = inputs.get("super_sampling", False)
+        context.parallel_infer = parallel_infer
 
         if parallel_infer:
             print(i18n("并行推理模式已开启"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_batch_infer
         else:
             print(i18n("并行推理模式已关闭"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_naive_batched
 
         if return_fragment:
             print(i18n("分段返回模式已开启"))
@@ -1067,61 +1446,13 @@ class TTS:
             fragment_interval = 0.01
             print(i18n("分段间隔过小，已自动设置为0.01"))
 
-        no_prompt_text = False
-        if prompt_text in [None, ""]:
-            no_prompt_text = True
-
-        assert text_lang in self.configs.languages
-        if not no_prompt_text:
-            assert prompt_lang in self.configs.languages
-
-        if no_prompt_text and self.configs.use_vocoder:
-            raise NO_PROMPT_ERROR("prompt_text cannot be empty when using SoVITS_V3")
-
-        if ref_audio_path in [None, ""] and (
-            (self.prompt_cache["prompt_semantic"] is None) or (self.prompt_cache["refer_spec"] in [None, []])
-        ):
-            raise ValueError(
-                "ref_audio_path cannot be empty, when the reference audio is not set using set_ref_audio()"
-            )
-
         ###### setting reference audio and prompt text preprocessing ########
         t0 = time.perf_counter()
-        if (ref_audio_path is not None) and (
-            ref_audio_path != self.prompt_cache["ref_audio_path"]
-            or (self.is_v2pro and self.prompt_cache["refer_spec"][0][1] is None)
-        ):
-            if not os.path.exists(ref_audio_path):
-                raise ValueError(f"{ref_audio_path} not exists")
-            self.set_ref_audio(ref_audio_path)
-
-        aux_ref_audio_paths = aux_ref_audio_paths if aux_ref_audio_paths is not None else []
-        paths = set(aux_ref_audio_paths) & set(self.prompt_cache["aux_ref_audio_paths"])
-        if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
-            self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
-            self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
-            for path in aux_ref_audio_paths:
-                if path in [None, ""]:
-                    continue
-                if not os.path.exists(path):
-                    print(i18n("音频文件不存在，跳过："), path)
-                    continue
-                self.prompt_cache["refer_spec"].append(self._get_ref_spec(path))
-
-        if not no_prompt_text:
-            prompt_text = prompt_text.strip("\n")
-            if prompt_text[-1] not in splits:
-                prompt_text += "。" if prompt_lang != "en" else "."
-            print(i18n("实际输入的参考文本:"), prompt_text)
-            if self.prompt_cache["prompt_text"] != prompt_text:
-                phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
-                    prompt_text, prompt_lang, self.configs.version
-                )
-                self.prompt_cache["prompt_text"] = prompt_text
-                self.prompt_cache["prompt_lang"] = prompt_lang
-                self.prompt_cache["phones"] = phones
-                self.prompt_cache["bert_features"] = bert_features
-                self.prompt_cache["norm_text"] = norm_text
+        assert text_lang in self.configs.languages
+        with record_function("ref"):
+            voice, no_prompt_text = self.prepare_voice(
+                ref_audio_path, aux_ref_audio_paths, prompt_text, prompt_lang, voice_profile
+            )
 
         ###### text preprocessing ########
         t1 = time.perf_counter()
@@ -1135,7 +1466,7 @@ class TTS:
             batch_index_list: list = None
             data, batch_index_list = self.to_batch(
                 data,
-                prompt_data=self.prompt_cache if not no_prompt_text else None,
+                prompt_data=voice if not no_prompt_text else None,
                 batch_size=batch_size,
                 threshold=batch_threshold,
                 split_bucket=split_bucket,
@@ -1144,12 +1475,22 @@ class TTS:
             )
         else:
             print(f"############ {i18n('切分文本')} ############")
-            texts = self.text_preprocessor.pre_seg_text(text, text_lang, text_split_method)
-            data = []
-            for i in range(len(texts)):
-                if i % batch_size == 0:
-                    data.append([])
-                data[-1].append(texts[i])
+            if text_stream is not None:
+                texts = self.text_preprocessor.pre_seg_text_stream(text_stream, text_lang, text_split_method)
+            else:
+                texts = self.text_preprocessor.pre_seg_text(text, text_lang, text_split_method)
+
+            def batch_texts_generator(texts):
+                batch_texts = []
+                for text in texts:
+                    batch_texts.append(text)
+                    if len(batch_texts) == batch_size:
+                        yield batch_texts
+                        batch_texts = []
+                if len(batch_texts) > 0:
+                    yield batch_texts
+
+            data = batch_texts_generator(texts)
 
             def make_batch(batch_texts):
                 batch_data = []
@@ -1170,7 +1511,7 @@ class TTS:
                     return None
                 batch, _ = self.to_batch(
                     batch_data,
-                    prompt_data=self.prompt_cache if not no_prompt_text else None,
+                    prompt_data=voice if not no_prompt_text else None,
                     batch_size=batch_size,
                     threshold=batch_threshold,
                     split_bucket=False,
@@ -1180,11 +1521,12 @@ class TTS:
                 return batch[0]
 
         t2 = time.perf_counter()
+        context.add_timing("ref", t1 - t0)
+        context.add_timing("text", t2 - t1)
         try:
             print("############ 推理 ############")
             ###### inference ######
-            t_34 = 0.0
-            t_45 = 0.0
+            audio_seconds = 0.0
             audio = []
             output_sr = self.configs.sampling_rate if not self.configs.use_vocoder else self.vocoder_configs["sr"]
             for item in data:
@@ -1194,131 +1536,39 @@ class TTS:
                     if item is None:
                         continue
 
-                batch_phones: List[torch.LongTensor] = item["phones"]
-                # batch_phones:torch.LongTensor = item["phones"]
-                batch_phones_len: torch.LongTensor = item["phones_len"]
-                all_phoneme_ids: torch.LongTensor = item["all_phones"]
-                all_phoneme_lens: torch.LongTensor = item["all_phones_len"]
-                all_bert_features: torch.LongTensor = item["all_bert_features"]
-                norm_text: str = item["norm_text"]
-                max_len = item["max_len"]
-
-                print(i18n("前端处理后的文本(每句):"), norm_text)
-                if no_prompt_text:
-                    prompt = None
-                else:
-                    prompt = (
-                        self.prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
-                    )
-
-                print(f"############ {i18n('预测语义Token')} ############")
-                pred_semantic_list, idx_list = self.t2s_model.model.infer_panel(
-                    all_phoneme_ids,
-                    all_phoneme_lens,
-                    prompt,
-                    all_bert_features,
-                    # prompt_phone_len=ph_offset,
+                pred_semantic_list, idx_list = self._predict_semantic(
+                    item,
+                    voice if not no_prompt_text else None,
                     top_k=top_k,
                     top_p=top_p,
                     temperature=temperature,
-                    early_stop_num=self.configs.hz * self.configs.max_sec,
-                    max_len=max_len,
                     repetition_penalty=repetition_penalty,
+                    parallel_infer=parallel_infer,
+                    should_stop=context.is_cancelled,
                 )
                 t4 = time.perf_counter()
-                t_34 += t4 - t3
-
-                refer_audio_spec = []
-                if self.is_v2pro:
-                    sv_emb = []
-                for spec, audio_tensor in self.prompt_cache["refer_spec"]:
-                    spec = spec.to(dtype=self.precision, device=self.configs.device)
-                    refer_audio_spec.append(spec)
-                    if self.is_v2pro:
-                        sv_emb.append(self.sv_model.compute_embedding3(audio_tensor))
-
-                batch_audio_fragment = []
-
-                # ## vits并行推理 method 1
-                # pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
-                # pred_semantic_len = torch.LongTensor([item.shape[0] for item in pred_semantic_list]).to(self.configs.device)
-                # pred_semantic = self.batch_sequences(pred_semantic_list, axis=0, pad_value=0).unsqueeze(0)
-                # max_len = 0
-                # for i in range(0, len(batch_phones)):
-                #     max_len = max(max_len, batch_phones[i].shape[-1])
-                # batch_phones = self.batch_sequences(batch_phones, axis=0, pad_value=0, max_length=max_len)
-                # batch_phones = batch_phones.to(self.configs.device)
-                # batch_audio_fragment = (self.vits_model.batched_decode(
-                #         pred_semantic, pred_semantic_len, batch_phones, batch_phones_len,refer_audio_spec
-                #     ))
-                print(f"############ {i18n('合成音频')} ############")
-                if not self.configs.use_vocoder:
-                    if speed_factor == 1.0:
-                        print(f"{i18n('并行合成中')}...")
-                        # ## vits并行推理 method 2
-                        pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
-                        upsample_rate = math.prod(self.vits_model.upsample_rates)
-                        audio_frag_idx = [
-                            pred_semantic_list[i].shape[0] * 2 * upsample_rate
-                            for i in range(0, len(pred_semantic_list))
-                        ]
-                        audio_frag_end_idx = [sum(audio_frag_idx[: i + 1]) for i in range(0, len(audio_frag_idx))]
-                        all_pred_semantic = (
-                            torch.cat(pred_semantic_list).unsqueeze(0).unsqueeze(0).to(self.configs.device)
-                        )
-                        _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
-                        if self.is_v2pro != True:
-                            _batch_audio_fragment = self.vits_model.decode(
-                                all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor
-                            ).detach()[0, 0, :]
-                        else:
-                            _batch_audio_fragment = self.vits_model.decode(
-                                all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb
-                            ).detach()[0, 0, :]
-                        audio_frag_end_idx.insert(0, 0)
-                        batch_audio_fragment = [
-                            _batch_audio_fragment[audio_frag_end_idx[i - 1] : audio_frag_end_idx[i]]
-                            for i in range(1, len(audio_frag_end_idx))
-                        ]
-                    else:
-                        # ## vits串行推理
-                        for i, idx in enumerate(tqdm(idx_list)):
-                            phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
-                            _pred_semantic = (
-                                pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
-                            )  # .unsqueeze(0)#mq要多unsqueeze一次
-                            if self.is_v2pro != True:
-                                audio_fragment = self.vits_model.decode(
-                                    _pred_semantic, phones, refer_audio_spec, speed=speed_factor
-                                ).detach()[0, 0, :]
-                            else:
-                                audio_fragment = self.vits_model.decode(
-                                    _pred_semantic, phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb
-                                ).detach()[0, 0, :]
-                            batch_audio_fragment.append(audio_fragment)  ###试试重建不带上prompt部分
-                else:
-                    if parallel_infer:
-                        print(f"{i18n('并行合成中')}...")
-                        audio_fragments = self.using_vocoder_synthesis_batched_infer(
-                            idx_list, pred_semantic_list, batch_phones, speed=speed_factor, sample_steps=sample_steps
-                        )
-                        batch_audio_fragment.extend(audio_fragments)
-                    else:
-                        for i, idx in enumerate(tqdm(idx_list)):
-                            phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
-                            _pred_semantic = (
-                                pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
-                            )  # .unsqueeze(0)#mq要多unsqueeze一次
-                            audio_fragment = self.using_vocoder_synthesis(
-                                _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps
-                            )
-                            batch_audio_fragment.append(audio_fragment)
+                context.add_timing("t2s", t4 - t3)
+                if context.is_cancelled():
+                    break
+
+                batch_audio_fragment = self._decode_semantic(
+                    item,
+                    pred_semantic_list,
+                    idx_list,
+                    voice,
+                    speed_factor=speed_factor,
+                    parallel_infer=parallel_infer,
+                    sample_steps=sample_steps,
+                    should_stop=context.is_cancelled,
+                )
 
                 t5 = time.perf_counter()
-                t_45 += t5 - t4
+                context.add_timing("vits", t5 - t4)
+                if context.is_cancelled():
+                    break
                 if return_fragment:
-                    print("%.3f\t%.3f\t%.3f\t%.3f" % (t1 - t0, t2 - t1, t4 - t3, t5 - t4))
-                    yield self.audio_postprocess(
+                    print("ref: %.3f\ttext: %.3f\tt2s: %.3f\tvits: %.3f" % (t1 - t0, t2 - t1, t4 - t3, t5 - t4))
+                    sr, fragment = self.audio_postprocess(
                         [batch_audio_fragment],
                         output_sr,
                         None,
@@ -1327,19 +1577,25 @@ class TTS:
                         fragment_interval,
                         super_sampling if self.configs.use_vocoder and self.configs.version == "v3" else False,
                     )
+                    context.add_timing("post", time.perf_counter() - t5)
+                    audio_seconds += len(fragment) / sr
+                    yield sr, fragment
                 else:
                     audio.append(batch_audio_fragment)
 
-                if self.stop_flag:
-                    yield 16000, np.zeros(int(16000), dtype=np.int16)
-                    return
+            if context.is_cancelled():
+                print(f"############ 推理已取消 ({time.perf_counter() - context.start_time:.3f}s) ############")
+                metrics.observe_request(0.0, 0.0, "cancelled")
+                yield 16000, np.zeros(int(16000), dtype=np.int16)
+                return
 
             if not return_fragment:
-                print("%.3f\t%.3f\t%.3f\t%.3f" % (t1 - t0, t2 - t1, t_34, t_45))
+                print("\t".join(f"{stage}: {seconds:.3f}" for stage, seconds in context.timings.items()))
                 if len(audio) == 0:
                     yield 16000, np.zeros(int(16000), dtype=np.int16)
                     return
-                yield self.audio_postprocess(
+                t6 = time.perf_counter()
+                sr, audio = self.audio_postprocess(
                     audio,
                     output_sr,
                     batch_index_list,
@@ -1348,9 +1604,17 @@ class TTS:
                     fragment_interval,
                     super_sampling if self.configs.use_vocoder and self.configs.version == "v3" else False,
                 )
+                context.add_timing("post", time.perf_counter() - t6)
+                audio_seconds = len(audio) / sr
+                metrics.observe_request(audio_seconds, sum(context.timings.values()))
+                yield sr, audio
+            else:
+                metrics.observe_request(audio_seconds, sum(context.timings.values()))
 
         except Exception as e:
+            metrics.observe_request(0.0, 0.0, "error")
             traceback.print_exc()
+            context.failed = True
             # 必须返回一个空音频, 否则会导致显存不释放。
             yield 16000, np.zeros(int(16000), dtype=np.int16)
             # 重置模型, 否则会导致显存释放不完全。
@@ -1362,8 +1626,182 @@ class TTS:
             self.init_vits_weights(self.configs.vits_weights_path)
             raise e
         finally:
+            self._active_contexts.discard(context)
             self.empty_cache()
 
+    def _predict_semantic(
+        self,
+        item: dict,
+        voice: Union[dict, None],
+        top_k: int = 5,
+        top_p: float = 1,
+        temperature: float = 1,
+        repetition_penalty: float = 1.35,
+        parallel_infer: bool = True,
+        should_stop: Callable[[], bool] = None,
+    ):
+        """
+        T2S stage for one batch built by to_batch.
+        Args:
+            item: dict, one batch returned by to_batch.
+            voice: dict, reference voice from get_voice/load_voice_profile, None when there is no prompt text.
+            parallel_infer: bool, batched decoding, otherwise the sentences are decoded one by one.
+            should_stop: callable, checked every token, decoding ends early when it returns True.
+        Returns:
+            pred_semantic_list, idx_list
+        """
+        all_phoneme_ids: torch.LongTensor = item["all_phones"]
+        all_phoneme_lens: torch.LongTensor = item["all_phones_len"]
+        all_bert_features: torch.LongTensor = item["all_bert_features"]
+        norm_text: str = item["norm_text"]
+        max_len = item["max_len"]
+
+        print(i18n("前端处理后的文本(每句):"), norm_text)
+        if voice is None:
+            prompt = None
+        else:
+            prompt = voice["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
+
+        if parallel_infer:
+            infer_panel = self.t2s_model.model.infer_panel_batch_infer
+        else:
+            infer_panel = self.t2s_model.model.infer_panel_naive_batched
+
+        print(f"############ {i18n('预测语义Token')} ############")
+        stats = {}
+        pred_semantic_list, idx_list = infer_panel(
+            all_phoneme_ids,
+            all_phoneme_lens,
+            prompt,
+            all_bert_features,
+            # prompt_phone_len=ph_offset,
+            top_k=top_k,
+            top_p=top_p,
+            temperature=temperature,
+            early_stop_num=self.configs.hz * self.configs.max_sec,
+            max_len=max_len,
+            repetition_penalty=repetition_penalty,
+            should_stop=should_stop,
+            stats=stats,
+        )
+        stats["tokens"] = sum(int(idx) for idx in idx_list)
+        metrics.observe_t2s(stats, len(all_phoneme_ids))
+        return pred_semantic_list, idx_list
+
+    def _decode_semantic(
+        self,
+        item: dict,
+        pred_semantic_list: List[torch.Tensor],
+        idx_list: List[int],
+        voice: dict,
+        speed_factor: float = 1.0,
+        parallel_infer: bool = True,
+        sample_steps: int = 32,
+        should_stop: Callable[[], bool] = None,
+    ) -> List[torch.Tensor]:
+        """
+        SoVITS (and vocoder) stage for one batch, returns one audio fragment per sentence.
+        When should_stop returns True the remaining sentences are skipped, so fewer fragments may be returned.
+        """
+        batch_phones: List[torch.LongTensor] = item["phones"]
+        refer_audio_spec = []
+        for spec, audio_tensor in voice["refer_spec"]:
+            spec = spec.to(dtype=self.precision, device=self.configs.device)
+            refer_audio_spec.append(spec)
+        sv_emb = voice["sv_emb"]
+
+        batch_audio_fragment = []
+
+        # ## vits并行推理 method 1
+        # pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
+        # pred_semantic_len = torch.LongTensor([item.shape[0] for item in pred_semantic_list]).to(self.configs.device)
+        # pred_semantic = self.batch_sequences(pred_semantic_list, axis=0, pad_value=0).unsqueeze(0)
+        # max_len = 0
+        # for i in range(0, len(batch_phones)):
+        #     max_len = max(max_len, batch_phones[i].shape[-1])
+        # batch_phones = self.batch_sequences(batch_phones, axis=0, pad_value=0, max_length=max_len)
+        # batch_phones = batch_phones.to(self.configs.device)
+        # batch_audio_fragment = (self.vits_model.batched_decode(
+        #         pred_semantic, pred_semantic_len, batch_phones, batch_phones_len,refer_audio_spec
+        #     ))
+        print(f"############ {i18n('合成音频')} ############")
+        if not self.configs.use_vocoder:
+            if speed_factor == 1.0:
+                print(f"{i18n('并行合成中')}...")
+                # ## vits并行推理 method 2
+                pred_semantic_list = [item[-idx:] for item, idx in zip(pred_semantic_list, idx_list)]
+                upsample_rate = math.prod(self.vits_model.upsample_rates)
+                audio_frag_idx = [
+                    pred_semantic_list[i].shape[0] * 2 * upsample_rate for i in range(0, len(pred_semantic_list))
+                ]
+                audio_frag_end_idx = [sum(audio_frag_idx[: i + 1]) for i in range(0, len(audio_frag_idx))]
+                all_pred_semantic = torch.cat(pred_semantic_list).unsqueeze(0).unsqueeze(0).to(self.configs.device)
+                _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
+                with record_function("vits_decode"):
+                    if self.is_v2pro != True:
+                        _batch_audio_fragment = self.vits_model.decode(
+                            all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor
+                        ).detach()[0, 0, :]
+                    else:
+                        _batch_audio_fragment = self.vits_model.decode(
+                            all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb
+                        ).detach()[0, 0, :]
+                audio_frag_end_idx.insert(0, 0)
+                batch_audio_fragment = [
+                    _batch_audio_fragment[audio_frag_end_idx[i - 1] : audio_frag_end_idx[i]]
+                    for i in range(1, len(audio_frag_end_idx))
+                ]
+            else:
+                # ## vits串行推理
+                for i, idx in enumerate(tqdm(idx_list)):
+                    if should_stop is not None and should_stop():
+                        break
+                    phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
+                    _pred_semantic = (
+                        pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
+                    )  # .unsqueeze(0)#mq要多unsqueeze一次
+                    with record_function("vits_decode"):
+                        if self.is_v2pro != True:
+                            audio_fragment = self.vits_model.decode(
+                                _pred_semantic, phones, refer_audio_spec, speed=speed_factor
+                            ).detach()[0, 0, :]
+                        else:
+                            audio_fragment = self.vits_model.decode(
+                                _pred_semantic, phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb
+                            ).detach()[0, 0, :]
+                    batch_audio_fragment.append(audio_fragment)  ###试试重建不带上prompt部分
+        else:
+            if parallel_infer:
+                print(f"{i18n('并行合成中')}...")
+                audio_fragments = self.using_vocoder_synthesis_batched_infer(
+                    idx_list,
+                    pred_semantic_list,
+                    batch_phones,
+                    speed=speed_factor,
+                    sample_steps=sample_steps,
+                    prompt_data=voice,
+                )
+                batch_audio_fragment.extend(audio_fragments)
+            else:
+                for i, idx in enumerate(tqdm(idx_list)):
+                    if should_stop is not None and should_stop():
+                        break
+                    phones = batch_phones[i].unsqueeze(0).to(self.configs.device)
+                    _pred_semantic = (
+                        pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
+                    )  # .unsqueeze(0)#mq要多unsqueeze一次
+                    audio_fragment = self.using_vocoder_synthesis(
+                        _pred_semantic,
+                        phones,
+                        speed=speed_factor,
+                        sample_steps=sample_steps,
+                        prompt_data=voice,
+                        should_stop=should_stop,
+                    )
+                    batch_audio_fragment.append(audio_fragment)
+
+        return batch_audio_fragment
+
     def empty_cache(self):
         try:
             gc.collect()  # 触发gc的垃圾回收。避免内存一直增长。
@@ -1428,30 +1866,42 @@ class TTS:
 
         return sr, audio
 
+    def _get_prompt_mel(self, ref_audio: ReferenceAudio) -> torch.Tensor:
+        """
+        Normalized mel spectrogram of the reference audio, the prompt of the v3/v4 CFM.
+        """
+        # tgt_sr = self.vocoder_configs["sr"]
+        tgt_sr = 24000 if self.configs.version == "v3" else 32000
+        ref_audio = ref_audio.at(tgt_sr)
+
+        mel2 = mel_fn(ref_audio) if self.configs.version == "v3" else mel_fn_v4(ref_audio)
+        mel2 = norm_spec(mel2)
+        return mel2
+
     def using_vocoder_synthesis(
-        self, semantic_tokens: torch.Tensor, phones: torch.Tensor, speed: float = 1.0, sample_steps: int = 32
+        self,
+        semantic_tokens: torch.Tensor,
+        phones: torch.Tensor,
+        speed: float = 1.0,
+        sample_steps: int = 32,
+        prompt_data: dict = None,
+        should_stop: Callable[[], bool] = None,
     ):
-        prompt_semantic_tokens = self.prompt_cache["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
-        prompt_phones = torch.LongTensor(self.prompt_cache["phones"]).unsqueeze(0).to(self.configs.device)
-        raw_entry = self.prompt_cache["refer_spec"][0]
+        prompt_data = self.prompt_cache if prompt_data is None else prompt_data
+        prompt_semantic_tokens = prompt_data["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
+        prompt_phones = torch.LongTensor(prompt_data["phones"]).unsqueeze(0).to(self.configs.device)
+        raw_entry = prompt_data["refer_spec"][0]
         if isinstance(raw_entry, tuple):
             raw_entry = raw_entry[0]
         refer_audio_spec = raw_entry.to(dtype=self.precision, device=self.configs.device)
 
         fea_ref, ge = self.vits_model.decode_encp(prompt_semantic_tokens, prompt_phones, refer_audio_spec)
-        ref_audio: torch.Tensor = self.prompt_cache["raw_audio"]
-        ref_sr = self.prompt_cache["raw_sr"]
-        ref_audio = ref_audio.to(self.configs.device).float()
-        if ref_audio.shape[0] == 2:
-            ref_audio = ref_audio.mean(0).unsqueeze(0)
-
-        # tgt_sr = self.vocoder_configs["sr"]
-        tgt_sr = 24000 if self.configs.version == "v3" else 32000
-        if ref_sr != tgt_sr:
-            ref_audio = resample(ref_audio, ref_sr, tgt_sr, self.configs.device)
-
-        mel2 = mel_fn(ref_audio) if self.configs.version == "v3" else mel_fn_v4(ref_audio)
-        mel2 = norm_spec(mel2)
+        mel2 = prompt_data.get("prompt_mel")
+        if mel2 is None:
+            mel2 = self._get_prompt_mel(
+                ReferenceAudio(prompt_data["raw_audio"], prompt_data["raw_sr"], self.configs.device)
+            )
+        mel2 = mel2.to(self.configs.device)
         T_min = min(mel2.shape[2], fea_ref.shape[2])
         mel2 = mel2[:, :, :T_min]
         fea_ref = fea_ref[:, :, :T_min]
@@ -1472,12 +1922,15 @@ class TTS:
             fea_todo_chunk = fea_todo[:, :, idx : idx + chunk_len]
             if fea_todo_chunk.shape[-1] == 0:
                 break
+            if cfm_resss and should_stop is not None and should_stop():
+                break
             idx += chunk_len
             fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
 
-            cfm_res = self.vits_model.cfm.inference(
-                fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
-            )
+            with record_function("cfm"):
+                cfm_res = self.vits_model.cfm.inference(
+                    fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
+                )
             cfm_res = cfm_res[:, :, mel2.shape[2] :]
 
             mel2 = cfm_res[:, :, -T_min:]
@@ -1487,7 +1940,7 @@ class TTS:
         cfm_res = torch.cat(cfm_resss, 2)
         cfm_res = denorm_spec(cfm_res)
 
-        with torch.inference_mode():
+        with torch.inference_mode(), metrics.stage_timer("vocoder"), record_function("vocoder"):
             wav_gen = self.vocoder(cfm_res)
             audio = wav_gen[0][0]  # .cpu().detach().numpy()
 
@@ -1500,28 +1953,23 @@ class TTS:
         batch_phones: List[torch.Tensor],
         speed: float = 1.0,
         sample_steps: int = 32,
+        prompt_data: dict = None,
     ) -> List[torch.Tensor]:
-        prompt_semantic_tokens = self.prompt_cache["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
-        prompt_phones = torch.LongTensor(self.prompt_cache["phones"]).unsqueeze(0).to(self.configs.device)
-        raw_entry = self.prompt_cache["refer_spec"][0]
+        prompt_data = self.prompt_cache if prompt_data is None else prompt_data
+        prompt_semantic_tokens = prompt_data["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
+        prompt_phones = torch.LongTensor(prompt_data["phones"]).unsqueeze(0).to(self.configs.device)
+        raw_entry = prompt_data["refer_spec"][0]
         if isinstance(raw_entry, tuple):
             raw_entry = raw_entry[0]
         refer_audio_spec = raw_entry.to(dtype=self.precision, device=self.configs.device)
 
         fea_ref, ge = self.vits_model.decode_encp(prompt_semantic_tokens, prompt_phones, refer_audio_spec)
-        ref_audio: torch.Tensor = self.prompt_cache["raw_audio"]
-        ref_sr = self.prompt_cache["raw_sr"]
-        ref_audio = ref_audio.to(self.configs.device).float()
-        if ref_audio.shape[0] == 2:
-            ref_audio = ref_audio.mean(0).unsqueeze(0)
-
-        # tgt_sr = self.vocoder_configs["sr"]
-        tgt_sr = 24000 if self.configs.version == "v3" else 32000
-        if ref_sr != tgt_sr:
-            ref_audio = resample(ref_audio, ref_sr, tgt_sr, self.configs.device)
-
-        mel2 = mel_fn(ref_audio) if self.configs.version == "v3" else mel_fn_v4(ref_audio)
-        mel2 = norm_spec(mel2)
+        mel2 = prompt_data.get("prompt_mel")
+        if mel2 is None:
+            mel2 = self._get_prompt_mel(
+                ReferenceAudio(prompt_data["raw_audio"], prompt_data["raw_sr"], self.configs.device)
+            )
+        mel2 = mel2.to(self.configs.device)
         T_min = min(mel2.shape[2], fea_ref.shape[2])
         mel2 = mel2[:, :, :T_min]
         fea_ref = fea_ref[:, :, :T_min]
@@ -1574,9 +2022,10 @@ class TTS:
         bs = feat_chunks.shape[0]
         fea_ref = fea_ref.repeat(bs, 1, 1)
         fea = torch.cat([fea_ref, feat_chunks], 2).transpose(2, 1)
-        pred_spec = self.vits_model.cfm.inference(
-            fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
-        )
+        with record_function("cfm"):
+            pred_spec = self.vits_model.cfm.inference(
+                fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
+            )
         pred_spec = pred_spec[:, :, -chunk_len:]
         dd = pred_spec.shape[1]
         pred_spec = pred_spec.permute(1, 0, 2).contiguous().view(dd, -1).unsqueeze(0)
@@ -1584,7 +2033,7 @@ class TTS:
 
         pred_spec = denorm_spec(pred_spec)
 
-        with torch.no_grad():
+        with torch.no_grad(), metrics.stage_timer("vocoder"), record_function("vocoder"):
             wav_gen = self.vocoder(pred_spec)
             audio = wav_gen[0][0]  # .cpu().detach().numpy()
 
@@ -10,12 +10,14 @@ sys.path.append(now_dir)
 import re
 import torch
 from text.LangSegmenter import LangSegmenter
-from text import chinese
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Generator, List, Tuple
 from text.cleaner import clean_text
 from text import cleaned_text_to_sequence
+from text.phone_level_feature import expand_to_phone_level, get_zero_feature
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from TTS_infer_pack.text_segmentation_method import split_big_text, splits, get_method as get_seg_method
+from TTS_infer_pack.metrics import stage_timer
+from torch.profiler import record_function
 
 from tools.i18n.i18n import I18nAuto, scan_language_list
 
@@ -23,6 +25,8 @@ language = os.environ.get("language", "Auto")
 language = sys.argv[-1] if sys.argv[-1] in scan_language_list() else language
 i18n = I18nAuto(language=language)
 punctuation = set(["!", "?", "…", ",", ".", "-"])
+# 按整段文本的句数/字数分组的切分方法, 前面的分组会随后续文本变化, 流式输入时只能等文本结束后再切分
+whole_text_methods = set(["cut1", "cut2"])
 
 
 def get_first(text: str) -> str:
@@ -78,19 +82,34 @@ class TextPreprocessor:
         text = text.strip("\n")
         if len(text) == 0:
             return []
-        if text[0] not in splits and len(get_first(text)) < 4:
-            text = "。" + text if lang != "en" else "." + text
+        text = self.add_leading_split(text, lang)
         print(i18n("实际输入的目标文本:"))
         print(text)
 
+        _texts = self.cut_text(text, text_split_method)
+        _texts = self.filter_text(_texts)
+        texts = self.finish_segments(_texts, lang)
+
+        print(i18n("实际输入的目标文本(切句后):"))
+        print(texts)
+        return texts
+
+    def add_leading_split(self, text: str, lang: str) -> str:
+        # 开头过短的句子前面补一个句号
+        if text[0] not in splits and len(get_first(text)) < 4:
+            text = "。" + text if lang != "en" else "." + text
+        return text
+
+    def cut_text(self, text: str, text_split_method: str) -> List[str]:
         seg_method = get_seg_method(text_split_method)
         text = seg_method(text)
 
         while "\n\n" in text:
             text = text.replace("\n\n", "\n")
 
-        _texts = text.split("\n")
-        _texts = self.filter_text(_texts)
+        return text.split("\n")
+
+    def finish_segments(self, _texts: List[str], lang: str) -> List[str]:
         _texts = merge_short_text_in_array(_texts, 5)
         texts = []
 
@@ -109,11 +128,24 @@ class TextPreprocessor:
                 texts.extend(split_big_text(text))
             else:
                 texts.append(text)
-
-        print(i18n("实际输入的目标文本(切句后):"))
-        print(texts)
         return texts
 
+    def pre_seg_text_stream(
+        self, text_stream: Iterable[str], lang: str, text_split_method: str
+    ) -> Generator[str, None, None]:
+        """
+        Incremental version of pre_seg_text, for text that arrives piece by piece (e.g. tokens of an LLM).
+        Sentences are yielded as soon as they are complete.
+        Args:
+            text_stream: iterable of text deltas.
+            lang: language of the text.
+            text_split_method: name of a registered text split method.
+        """
+        segmenter = StreamingTextSegmenter(self, lang, text_split_method)
+        for delta in text_stream:
+            yield from segmenter.push(delta)
+        yield from segmenter.flush()
+
     def segment_and_extract_feature_for_text(
         self, text: str, language: str, version: str = "v1"
     ) -> Tuple[list, torch.Tensor, str]:
@@ -196,28 +228,23 @@ class TextPreprocessor:
             res = self.bert_model(**inputs, output_hidden_states=True)
             res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
         assert len(word2ph) == len(text)
-        phone_level_feature = []
-        for i in range(len(word2ph)):
-            repeat_feature = res[i].repeat(word2ph[i], 1)
-            phone_level_feature.append(repeat_feature)
-        phone_level_feature = torch.cat(phone_level_feature, dim=0)
+        phone_level_feature = expand_to_phone_level(res, word2ph)
         return phone_level_feature.T
 
     def clean_text_inf(self, text: str, language: str, version: str = "v2"):
         language = language.replace("all_", "")
-        phones, word2ph, norm_text = clean_text(text, language, version)
-        phones = cleaned_text_to_sequence(phones, version)
+        with stage_timer("g2p"), record_function("g2p"):
+            phones, word2ph, norm_text = clean_text(text, language, version)
+            phones = cleaned_text_to_sequence(phones, version)
         return phones, word2ph, norm_text
 
     def get_bert_inf(self, phones: list, word2ph: list, norm_text: str, language: str):
         language = language.replace("all_", "")
         if language == "zh":
-            feature = self.get_bert_feature(norm_text, word2ph).to(self.device)
+            with stage_timer("bert"), record_function("bert"):
+                feature = self.get_bert_feature(norm_text, word2ph).to(self.device)
         else:
-            feature = torch.zeros(
-                (1024, len(phones)),
-                dtype=torch.float32,
-            ).to(self.device)
+            feature = get_zero_feature(len(phones), dtype=torch.float32, device=self.device)
 
         return feature
 
@@ -236,4 +263,203 @@ class TextPreprocessor:
         punctuations = "".join(re.escape(p) for p in punctuation)
         pattern = f"([{punctuations}])([{punctuations}])+"
         result = re.sub(pattern, r"\1", text)
-        return result
\ No newline at end of file
+        return result
+
+
+class StreamingTextSegmenter:
+    """
+    Segment text that is received incrementally.
+
+    The selected text split method is run over the buffered text and every segment but the last (possibly
+    incomplete) one is emitted, so the streamed text is cut like the same complete text by
+    TextPreprocessor.pre_seg_text. Segments are only emitted once the merge of short texts (`min_len`) can no
+    longer change them, and the leading "。" of pre_seg_text is only added at the start of the stream. Segments
+    longer than `max_len` are split with split_big_text. The methods in `whole_text_methods` group sentences
+    over the whole text, so with them the text is only segmented by flush.
+    """
+
+    def __init__(self, preprocessor: TextPreprocessor, lang: str, text_split_method: str, min_len: int = 5):
+        get_seg_method(text_split_method)
+        self.preprocessor = preprocessor
+        self.lang = lang
+        self.text_split_method = text_split_method
+        self.min_len = min_len
+        self.max_len = 510
+        self.buffer = ""
+        self.started = False
+        # 缓冲区中已检查过 (没有可输出的段落) 的长度
+        self.checked = 0
+
+    def push(self, delta: str) -> List[str]:
+        """
+        Add a text delta, return the sentences completed by it.
+        """
+        if not delta:
+            return []
+        self.buffer += delta
+        if self.text_split_method in whole_text_methods:
+            return []
+        # 小数点不是句子边界; "3." 后面可能还有小数部分, 等下一个字符到达后再判断
+        if re.search(r"\d\.$", self.buffer):
+            return []
+        if not self._start(final=False):
+            return []
+        # 段落只在符号处结束, 上次检查之后 (连同前一个字符) 没有新的符号时不用重新切分
+        if re.search(r"[\W_]", self.buffer[max(self.checked - 1, 0) :]):
+            segments = self._cut(self.buffer)
+            ready = self._count_ready(segments)
+            if ready > 0:
+                end = self._find_end(segments, ready)
+                if end > 0:
+                    self.buffer = self.buffer[end:]
+                    self.checked = 0
+                    return self.preprocessor.finish_segments(segments[:ready], self.lang)
+        self.checked = len(self.buffer)
+        # 最后一段超过长度上限时, 按 split_big_text 的切法先输出前面的部分
+        if len(self.buffer) > self.max_len:
+            pieces = split_big_text(self.buffer, self.max_len)
+            if len(pieces) > 1:
+                self.buffer = pieces[-1]
+                self.checked = 0
+                return [piece for piece in pieces[:-1] if re.sub(r"\W+", "", piece)]
+        return []
+
+    def flush(self) -> List[str]:
+        """
+        Segment and return everything still buffered, e.g. at the end of the input.
+        """
+        if not self._start(final=True):
+            self.buffer = ""
+            return []
+        segments = self._cut(self.buffer)
+        self.buffer = ""
+        self.checked = 0
+        return self.preprocessor.finish_segments(segments, self.lang)
+
+    def reset(self):
+        """
+        Drop the buffered text, e.g. when the client cancels.
+        """
+        self.buffer = ""
+        self.started = False
+        self.checked = 0
+
+    def _start(self, final: bool) -> bool:
+        # pre_seg_text 的开头补句号只作用于整段文本的开头, 要等第一句完整后才能判断
+        if self.started:
+            return True
+        text = self.buffer.lstrip("\n")
+        if len(text.strip("\n")) == 0:
+            return False
+        if not final and len(get_first(text)) < 4 and not any(char in splits for char in text):
+            return False
+        self.buffer = self.preprocessor.add_leading_split(text, self.lang)
+        self.started = True
+        self.checked = 0
+        return True
+
+    def _cut(self, text: str) -> List[str]:
+        if len(text.strip("\n")) == 0:
+            return []
+        segments = self.preprocessor.cut_text(text, self.text_split_method)
+        return [segment for segment in segments if segment not in (None, " ", "")]
+
+    def _count_ready(self, segments: List[str]) -> int:
+        # 最后一段可能还不完整; 短句要和后面的句子合并, 而文本末尾剩下的短句会并入前一组,
+        # 所以只输出到倒数第二个合并完成的位置
+        ends = [0]
+        text = ""
+        for i, segment in enumerate(segments[:-1]):
+            text += segment
+            if len(text) >= self.min_len:
+                ends.append(i + 1)
+                text = ""
+        return ends[-2] if len(ends) > 1 else 0
+
+    def _find_end(self, segments: List[str], ready: int) -> int:
+        # 找到缓冲区中的位置, 使其前面的文本被切分方法切成的正好是要输出的段落.
+        # 段落按顺序出现在缓冲区中, 只需从最后一个要输出的段落的结尾往后, 检查紧随其后的空白和符号;
+        # 取最靠前的位置, 多余的空白和符号留给下一段, 和整段文本切分的结果一致
+        buffer = self.buffer
+        start = 0
+        for segment in segments[:ready]:
+            start = buffer.find(segment, start)
+            if start < 0:
+                return 0
+            start += len(segment)
+        for end in range(max(start, 1), len(buffer)):
+            if not re.match(r"[\W_]", buffer[end - 1]):
+                if end > start:
+                    break
+                continue
+            if self._is_end(buffer, end, segments, ready):
+                return end
+        return 0
+
+    def _is_end(self, buffer: str, end: int, segments: List[str], ready: int) -> bool:
+        if self._cut(buffer[:end]) != segments[:ready]:
+            return False
+        # 剩下的文本单独切分时, 除了还不完整的最后一段, 结果也要一致
+        rest = self._cut(buffer[end:])
+        return len(rest) == len(segments) - ready and rest[:-1] == segments[ready:-1]
+
+
+if __name__ == "__main__":
+    # 用法 (在 GPT_SoVITS 目录下):
+    #   python -m TTS_infer_pack.TextPreprocessor              逐字流式输入 zh_normalization 的测试语料, 与 pre_seg_text 的切分结果比对
+    #   python -m TTS_infer_pack.TextPreprocessor corpus.txt   使用其他语料, 每行一段
+    import argparse
+    import contextlib
+    import io
+    import time
+
+    parser = argparse.ArgumentParser(description="StreamingTextSegmenter check against pre_seg_text")
+    parser.add_argument(
+        "corpus",
+        type=str,
+        nargs="?",
+        default=os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "text",
+            "zh_normalization",
+            "golden",
+            "corpus.txt",
+        ),
+        help="utf-8 corpus, one paragraph per line, default: the zh_normalization golden corpus",
+    )
+    parser.add_argument("--lang", type=str, default="zh", help="text language")
+    parser.add_argument(
+        "--methods", type=str, default="cut0,cut1,cut2,cut3,cut4,cut5", help="comma separated split methods"
+    )
+    args = parser.parse_args()
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f]
+    # 每行单独检查, 整个语料也作为一段 (含换行) 检查
+    texts = lines + ["\n".join(lines)]
+    preprocessor = TextPreprocessor(None, None, None)
+    mismatches = 0
+    for method in args.methods.split(","):
+        cost = 0.0
+        for text in texts:
+            try:
+                # pre_seg_text 会打印切分结果
+                with contextlib.redirect_stdout(io.StringIO()):
+                    expected = preprocessor.pre_seg_text(text, args.lang, method)
+            except ValueError:
+                # 没有有效文本
+                expected = []
+            t0 = time.perf_counter()
+            segmenter = StreamingTextSegmenter(preprocessor, args.lang, method)
+            streamed = []
+            for char in text:
+                streamed.extend(segmenter.push(char))
+            streamed.extend(segmenter.flush())
+            cost += time.perf_counter() - t0
+            if streamed != expected:
+                mismatches += 1
+                if mismatches <= 20:
+                    print(f"{method}:\n  input   : {text[:200]}\n  expected: {expected}\n  streamed: {streamed}")
+        print(f"{method}: {len(texts)} texts, {sum(len(text) for text in texts)} chars streamed in {cost:.3f}s")
+    print(f"{mismatches} mismatched texts")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+import math
+import re
+import time
+from collections import deque
+from typing import Dict
+
+from TTS_infer_pack.metrics import REGISTRY
+
+PRIORITIES = ["interactive", "batch"]
+# 每个音素的初始推理用时(秒), 运行中按实际用时滑动更新
+DEFAULT_SECONDS_PER_PHONE = {
+    "v1": 0.01,
+    "v2": 0.01,
+    "v2Pro": 0.012,
+    "v2ProPlus": 0.012,
+    "v3": 0.04,
+    "v4": 0.04,
+}
+EWMA_ALPHA = 0.2
+
+SHED = REGISTRY.counter("tts_admission_shed_total", "Requests rejected by admission control", ("reason",))
+QUEUE_SECONDS = REGISTRY.histogram("tts_admission_queue_seconds", "Time spent waiting for admission", ("priority",))
+
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_ALNUM_RE = re.compile(r"[A-Za-z0-9]")
+
+
+def estimate_phones(text: str) -> int:
+    """
+    Rough phoneme count of a text without running G2P: two per CJK character / kana / hangul syllable,
+    one per latin letter or digit.
+    """
+    return 2 * len(_CJK_RE.findall(text)) + len(_ALNUM_RE.findall(text))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, message: str, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class Ticket:
+    def __init__(self, ticket_id: int, tenant: str, priority: str, phones: int, version: str, cost: float):
+        self.ticket_id = ticket_id
+        self.tenant = tenant
+        self.priority = priority
+        self.phones = phones
+        self.version = version
+        self.cost = cost
+        self.enqueue_time = time.perf_counter()
+        self.start_time: float = None
+        self.future: asyncio.Future = None
+
+
+class AdmissionController:
+    """
+    Admission control in front of the inference backend, used from the event loop thread only.
+
+    Every request gets a predicted cost (estimated phonemes x learned seconds per phoneme of the model version).
+    At most max_running requests run at once, the others wait in one FIFO queue per priority, "interactive"
+    queues are always served before "batch" ones. A request is rejected up front (429 + Retry-After) when the
+    predicted queue wait exceeds the deadline supplied by the client or when its tenant already has
+    tenant_limit requests in flight, and shed when it is still queued at its deadline.
+    When max_queue requests are queued, new ones get 503.
+    """
+
+    def __init__(
+        self,
+        max_running: int,
+        max_queue: int,
+        tenant_limit: int = 0,
+        max_phones: int = 0,
+        seconds_per_phone: Dict[str, float] = None,
+    ):
+        """
+        Args:
+            tenant_limit: int, queued + running requests allowed per tenant, 0 for no limit.
+            max_phones: int, requests with more estimated phonemes are rejected with 413, 0 for no limit.
+        """
+        self.max_running = max(1, max_running)
+        self.max_queue = max_queue
+        self.tenant_limit = tenant_limit
+        self.max_phones = max_phones
+        self.seconds_per_phone = dict(DEFAULT_SECONDS_PER_PHONE, **(seconds_per_phone or {}))
+        self.queues: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        self.running: Dict[int, Ticket] = {}
+        self.tenants: Dict[str, int] = {}
+        self.admitted = 0
+        self.shed = 0
+        self._ids = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def estimate(self, phones: int, version: str) -> float:
+        return phones * self.seconds_per_phone.get(version, DEFAULT_SECONDS_PER_PHONE["v2"])
+
+    def predicted_wait(self, priority: str) -> float:
+        """
+        Seconds until a new request of this priority would start: the remaining cost of the running requests
+        and the cost of the requests queued ahead of it, spread over max_running slots.
+        """
+        if len(self.running) < self.max_running and self.queued == 0:
+            return 0.0
+        now = time.perf_counter()
+        work = sum(max(0.0, t.cost - (now - t.start_time)) for t in self.running.values())
+        for queue_priority in PRIORITIES[: PRIORITIES.index(priority) + 1]:
+            work += sum(t.cost for t in self.queues[queue_priority])
+        return work / self.max_running
+
+    def _reject(self, status_code: int, reason: str, message: str, retry_after: float):
+        self.shed += 1
+        SHED.inc(reason=reason)
+        raise AdmissionRejected(status_code, message, retry_after)
+
+    async def acquire(
+        self, text: str, version: str, priority: str = "batch", tenant: str = "", deadline: float = None
+    ) -> Ticket:
+        """
+        Wait until the request may run. Raises AdmissionRejected when it is rejected or shed.
+        Args:
+            deadline: float, (optional) the longest the client accepts to wait in the queue, in seconds.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}, got {priority}")
+        phones = estimate_phones(text)
+        if self.max_phones > 0 and phones > self.max_phones:
+            self._reject(413, "too_long", f"text too long: ~{phones} phonemes, limit {self.max_phones}", 0)
+        cost = self.estimate(phones, version)
+        wait = self.predicted_wait(priority)
+        if self.tenant_limit > 0 and self.tenants.get(tenant, 0) >= self.tenant_limit:
+            self._reject(429, "tenant_limit", f"tenant {tenant!r} has too many requests in flight", wait + cost)
+        if self.queued >= self.max_queue:
+            self._reject(503, "queue_full", "server busy, inference queue is full", wait)
+        if deadline is not None and wait > deadline:
+            self._reject(429, "deadline", f"predicted queue wait {wait:.1f}s exceeds the deadline", wait - deadline)
+
+        ticket = Ticket(next(self._ids), tenant, priority, phones, version, cost)
+        self.tenants[tenant] = self.tenants.get(tenant, 0) + 1
+        if len(self.running) < self.max_running and self.queued == 0:
+            self._start(ticket)
+            return ticket
+
+        ticket.future = asyncio.get_running_loop().create_future()
+        self.queues[priority].append(ticket)
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout=deadline)
+        except asyncio.TimeoutError:
+            self._abandon(ticket)
+            self._reject(429, "deadline", "queue wait exceeded the deadline", self.predicted_wait(priority))
+        except asyncio.CancelledError:
+            # 客户端断开
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def _start(self, ticket: Ticket):
+        ticket.start_time = time.perf_counter()
+        self.running[ticket.ticket_id] = ticket
+        self.admitted += 1
+        QUEUE_SECONDS.observe(ticket.start_time - ticket.enqueue_time, priority=ticket.priority)
+
+    def _abandon(self, ticket: Ticket):
+        if ticket.ticket_id in self.running:
+            # 恰好在超时/取消时被调度
+            self.release(ticket, record=False)
+            return
+        try:
+            self.queues[ticket.priority].remove(ticket)
+        except ValueError:
+            pass
+        self._leave_tenant(ticket)
+
+    def _leave_tenant(self, ticket: Ticket):
+        count = self.tenants.get(ticket.tenant, 0) - 1
+        if count > 0:
+            self.tenants[ticket.tenant] = count
+        else:
+            self.tenants.pop(ticket.tenant, None)
+
+    def release(self, ticket: Ticket, record: bool = True):
+        """
+        Called once the request has finished, updates the learned cost of its model version and starts the
+        next queued request. Calling it again does nothing.
+        """
+        if self.running.pop(ticket.ticket_id, None) is None:
+            return
+        self._leave_tenant(ticket)
+        if record and ticket.phones > 0:
+            elapsed = time.perf_counter() - ticket.start_time
+            old = self.seconds_per_phone.get(ticket.version, DEFAULT_SECONDS_PER_PHONE["v2"])
+            self.seconds_per_phone[ticket.version] = (1 - EWMA_ALPHA) * old + EWMA_ALPHA * elapsed / ticket.phones
+        while len(self.running) < self.max_running:
+            next_ticket = self._pop_next()
+            if next_ticket is None:
+                break
+            self._start(next_ticket)
+            next_ticket.future.set_result(None)
+
+    def _pop_next(self) -> Ticket:
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            while queue:
+                ticket = queue.popleft()
+                if not ticket.future.done():
+                    return ticket
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self.running),
+            "max_running": self.max_running,
+            "max_queue": self.max_queue,
+            "queued": {priority: len(queue) for priority, queue in self.queues.items()},
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "tenants": dict(self.tenants),
+            "seconds_per_phone": dict(self.seconds_per_phone),
+            "predicted_wait": {priority: self.predicted_wait(priority) for priority in PRIORITIES},
+        }
@@ -0,0 +1,342 @@
+"""
+Bulk offline synthesis from a JSONL manifest, used by `inference_cli.py --manifest` and the /jobs endpoint of api_v2.
+
+Manifest, one item per line:
+    {"id": "ch01-0001", "text": "...", "text_lang": "zh", "output_path": "out/ch01/0001.wav",
+     "voice": {"ref_audio_path": "ref.wav", "prompt_text": "...", "prompt_lang": "zh"},
+     "params": {"top_k": 5, "speed_factor": 1.0}}
+"voice" may name a precompiled {"voice_profile": "voices/x.npz"} instead, "params" are any other TTS.run inputs and
+"id" defaults to the line number. The output format follows the extension of output_path (wav/flac/ogg/aac/mp3).
+
+Items are ordered by voice, then by sampling parameters, then by length (longest first), so consecutive items hit the
+voice cache and items running together can share T2S batches. With num_shards > 1 the ordered items are cut into
+contiguous shards (one per machine), which keeps each voice on as few shards as possible.
+
+Every finished item is appended to the progress file (JSONL, synced per line). A job restarted with the same
+progress file skips the items recorded as done whose output still exists, failed items are retried.
+
+With an output root (the /jobs endpoint of api_v2), output_path and the progress file are resolved against it and
+paths outside of it are rejected, so a manifest cannot write anywhere else on the server.
+"""
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from tools.audio_encoder import encode_audio
+from TTS_infer_pack.metrics import REGISTRY
+
+VOICE_KEYS = ["ref_audio_path", "aux_ref_audio_paths", "prompt_text", "prompt_lang", "voice_profile"]
+AUDIO_FORMATS = {".wav": "WAV", ".flac": "FLAC", ".ogg": "ogg", ".aac": "aac", ".mp3": "mp3"}
+
+JOB_ITEMS = REGISTRY.counter("tts_job_items_total", "Bulk job items by status", ("status",))
+JOB_AUDIO_SECONDS = REGISTRY.counter("tts_job_audio_seconds_total", "Seconds of audio written by bulk jobs")
+
+
+class JobItem:
+    def __init__(self, item_id: str, req: dict, output_path: str):
+        self.item_id = item_id
+        # TTS.run 的输入
+        self.req = req
+        self.output_path = output_path
+
+    @property
+    def voice_key(self) -> str:
+        return json.dumps({key: self.req.get(key) for key in VOICE_KEYS}, sort_keys=True, ensure_ascii=False)
+
+    @property
+    def params_key(self) -> str:
+        params = {key: value for key, value in self.req.items() if key not in VOICE_KEYS and key != "text"}
+        return json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def resolve_in_root(path: str, output_root: str) -> str:
+    """
+    Resolve path (relative paths against output_root, symlinks followed), raise ValueError if it is outside output_root.
+    """
+    root = os.path.realpath(output_root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"{path} is outside the output root {output_root}")
+    return resolved
+
+
+def load_manifest(path: str, output_root: str = None) -> List[JobItem]:
+    """
+    Args:
+        output_root: str, (optional) confine every output_path to this directory, see resolve_in_root.
+    """
+    items = []
+    ids = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            req = {**entry.get("params", {}), **entry.get("voice", {})}
+            req.update({k: v for k, v in entry.items() if k not in ["id", "voice", "params", "output_path"]})
+            item_id = str(entry.get("id", line_no))
+            output_path = entry.get("output_path")
+            if req.get("text") in [None, ""] or req.get("text_lang") in [None, ""] or output_path in [None, ""]:
+                raise ValueError(f"{path}:{line_no}: text, text_lang and output_path are required")
+            if req.get("ref_audio_path") in [None, ""] and req.get("voice_profile") in [None, ""]:
+                raise ValueError(f"{path}:{line_no}: voice.ref_audio_path or voice.voice_profile is required")
+            if os.path.splitext(output_path)[1].lower() not in AUDIO_FORMATS:
+                raise ValueError(f"{path}:{line_no}: unsupported output format {output_path}")
+            if output_root is not None:
+                try:
+                    output_path = resolve_in_root(output_path, output_root)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{line_no}: {e}")
+            if item_id in ids:
+                raise ValueError(f"{path}:{line_no}: duplicate id {item_id}")
+            ids.add(item_id)
+            req["text_lang"] = req["text_lang"].lower()
+            if req.get("prompt_lang"):
+                req["prompt_lang"] = req["prompt_lang"].lower()
+            items.append(JobItem(item_id, req, output_path))
+    return items
+
+
+def order_items(items: List[JobItem]) -> List[JobItem]:
+    return sorted(items, key=lambda item: (item.voice_key, item.params_key, -len(item.req["text"])))
+
+
+def shard_items(items: List[JobItem], shard: int, num_shards: int) -> List[JobItem]:
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"shard must be in [0, {num_shards}), got {shard}")
+    size = math.ceil(len(items) / num_shards)
+    return items[shard * size : (shard + 1) * size]
+
+
+def load_progress(path: str) -> Dict[str, dict]:
+    """
+    Last record of every item in a progress file, {} if it does not exist.
+    """
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程崩溃时写了一半的行
+                continue
+            records[record["id"]] = record
+    return records
+
+
+def write_audio(path: str, sr: int, audio: np.ndarray):
+    """
+    Write the audio next to its final path first, so a crash never leaves a truncated output behind.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    audio_format = AUDIO_FORMATS[os.path.splitext(path)[1].lower()]
+    tmp_path = path + ".part"
+    if audio_format in ["WAV", "FLAC"]:
+        sf.write(tmp_path, audio, sr, format=audio_format)
+    else:
+        with open(tmp_path, "wb") as f:
+            f.write(encode_audio(audio_format, audio, sr))
+    os.replace(tmp_path, path)
+
+
+class BulkJob:
+    def __init__(
+        self,
+        manifest_path: str,
+        progress_path: str = None,
+        shard: int = 0,
+        num_shards: int = 1,
+        job_id: str = None,
+        output_root: str = None,
+    ):
+        """
+        Args:
+            progress_path: str, (optional) default: next to the manifest (in output_root if given), one file per shard.
+            output_root: str, (optional) confine the outputs and the progress file to this directory.
+        """
+        if progress_path in [None, ""]:
+            suffix = f".shard{shard}of{num_shards}" if num_shards > 1 else ""
+            progress_path = f"{manifest_path}{suffix}.progress.jsonl"
+            if output_root is not None:
+                progress_path = os.path.basename(progress_path)
+        if output_root is not None:
+            progress_path = resolve_in_root(progress_path, output_root)
+        self.job_id = job_id
+        self.manifest_path = manifest_path
+        self.progress_path = progress_path
+        self.items = shard_items(order_items(load_manifest(manifest_path, output_root)), shard, num_shards)
+        finished = load_progress(progress_path)
+        self.pending = [
+            item
+            for item in self.items
+            if not (finished.get(item.item_id, {}).get("status") == "done" and os.path.exists(item.output_path))
+        ]
+        self.skipped = len(self.items) - len(self.pending)
+        self.status = "pending"
+        self.error: str = None
+        self.done = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.elapsed = 0.0
+        self._start_time: float = None
+
+    async def run(self, synthesize: Callable[[dict], Awaitable[Tuple[int, np.ndarray]]], concurrency: int = 1):
+        """
+        Args:
+            synthesize: async function taking the TTS.run inputs of an item and returning (sr, np.int16 audio).
+            concurrency: int, items in flight at once, e.g. the number of pool workers.
+        """
+        self.status = "running"
+        self._start_time = time.perf_counter()
+        queue = deque(self.pending)
+        loop = asyncio.get_running_loop()
+        partial_line = False
+        if os.path.exists(self.progress_path) and os.path.getsize(self.progress_path) > 0:
+            with open(self.progress_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                partial_line = f.read(1) != b"\n"
+        os.makedirs(os.path.dirname(os.path.abspath(self.progress_path)), exist_ok=True)
+        with open(self.progress_path, "a", encoding="utf-8") as progress:
+            if partial_line:
+                # 上次崩溃时写了一半的行, 新记录另起一行
+                progress.write("\n")
+
+            record_lock = threading.Lock()
+
+            def write_record(entry: dict):
+                with record_lock:
+                    progress.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    progress.flush()
+                    os.fsync(progress.fileno())
+
+            async def record(entry: dict):
+                # fsync 可能耗时较长, 不在事件循环中执行
+                await loop.run_in_executor(None, write_record, entry)
+
+            async def runner():
+                while queue:
+                    item = queue.popleft()
+                    try:
+                        sr, audio = await synthesize(dict(item.req))
+                        await loop.run_in_executor(None, write_audio, item.output_path, sr, audio)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        print(f"job {self.job_id}: item {item.item_id} failed: {e}")
+                        self.failed += 1
+                        JOB_ITEMS.inc(status="failed")
+                        await record({"id": item.item_id, "status": "failed", "error": str(e)})
+                        continue
+                    duration = len(audio) / sr
+                    self.done += 1
+                    self.audio_seconds += duration
+                    JOB_ITEMS.inc(status="done")
+                    JOB_AUDIO_SECONDS.inc(duration)
+                    await record(
+                        {"id": item.item_id, "status": "done", "output_path": item.output_path, "duration": duration}
+                    )
+
+            try:
+                await asyncio.gather(*(runner() for _ in range(max(1, concurrency))))
+                self.status = "finished"
+            except asyncio.CancelledError:
+                self.status = "cancelled"
+                raise
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                raise
+            finally:
+                self.elapsed = time.perf_counter() - self._start_time
+
+    def stats(self) -> dict:
+        elapsed = self.elapsed if self.status != "running" else time.perf_counter() - self._start_time
+        return {
+            "job_id": self.job_id,
+            "manifest_path": self.manifest_path,
+            "progress_path": self.progress_path,
+            "status": self.status,
+            "error": self.error,
+            "total": len(self.items),
+            "skipped": self.skipped,
+            "done": self.done,
+            "failed": self.failed,
+            "remaining": len(self.pending) - self.done - self.failed,
+            "audio_seconds": self.audio_seconds,
+            "elapsed": elapsed,
+            # 每机器小时合成的音频小时数
+            "throughput": self.audio_seconds / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def local_synthesizer(tts, model_budget: int = 8 << 30) -> Callable[[dict], Awaitable[Tuple[int, np.ndarray]]]:
+    """
+    synthesize function of BulkJob.run running the items one at a time on a TTS instance of this process.
+    Args:
+        model_budget: int, memory budget in bytes of the models requested by the items.
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts_job")
+    registry = None
+
+    def run(req: dict):
+        nonlocal registry
+        pipeline = tts
+        if req.get("gpt_weights_path") or req.get("sovits_weights_path"):
+            if registry is None:
+                from TTS_infer_pack.model_registry import ModelRegistry
+
+                registry = ModelRegistry(tts, max_bytes=model_budget)
+            pipeline = registry.get(req.get("gpt_weights_path"), req.get("sovits_weights_path"))
+        # 迭代到结束: 推理失败时 TTS.run 先返回占位的静音, 下一次迭代才抛出异常; return_fragment 时有多段
+        fragments = list(pipeline.run(req))
+        if len(fragments) == 0:
+            raise RuntimeError("tts pipeline returned no audio")
+        return fragments[0][0], np.concatenate([fragment for _, fragment in fragments], 0)
+
+    async def synthesize(req: dict):
+        return await asyncio.get_running_loop().run_in_executor(executor, run, req)
+
+    return synthesize
+
+
+def pool_synthesizer(pool) -> Callable[[dict], Awaitable[Tuple[int, np.ndarray]]]:
+    """
+    synthesize function of BulkJob.run running the items on a WorkerPool.
+    """
+
+    async def synthesize(req: dict):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        fragments = []
+
+        def on_output(item):
+            if item is None or isinstance(item, Exception):
+                loop.call_soon_threadsafe(future.set_result, item)
+            else:
+                fragments.append(item)
+
+        job = pool.submit(req, on_output)
+        try:
+            result = await future
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+        if isinstance(result, Exception):
+            raise result
+        if len(fragments) == 0:
+            raise RuntimeError("tts pipeline returned no audio")
+        return fragments[0][0], np.concatenate([fragment for _, fragment in fragments], 0)
+
+    return synthesize
@@ -0,0 +1,109 @@
+import asyncio
+from typing import AsyncGenerator, Callable, Dict, List, Tuple
+
+from TTS_infer_pack.metrics import REGISTRY
+
+COALESCED = REGISTRY.counter("tts_coalesced_requests_total", "Requests attached to an identical synthesis in flight")
+
+
+class SharedSynthesis:
+    """
+    One synthesis shared by identical concurrent requests, used from the event loop thread only.
+
+    The producer runs in its own task, decoupled from the clients: every caller (the first one included) reads
+    through subscribe(). Late joiners get a replay of the chunks produced so far, then the live chunks.
+    The synthesis is cancelled once the last subscriber has left.
+    """
+
+    def __init__(self, key: str, on_finish: Callable[["SharedSynthesis"], None]):
+        self.key = key
+        self.chunks: List[bytes] = []
+        self.finished = False
+        self.error: BaseException = None
+        self.subscribers = 0
+        # 由调用方设置, 如 RequestContext, 供后加入的请求读取阶段用时
+        self.context = None
+        self.task: asyncio.Task = None
+        self._on_finish = on_finish
+        self._changed = asyncio.Event()
+
+    def start(self, producer: AsyncGenerator):
+        self.task = asyncio.create_task(self._run(producer))
+
+    async def _run(self, producer: AsyncGenerator):
+        try:
+            async for chunk in producer:
+                self.chunks.append(chunk)
+                self._notify()
+        except BaseException as e:
+            self.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self.finished = True
+            self._on_finish(self)
+            self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncGenerator:
+        """
+        Yield every chunk of the synthesis from the start, raises the error of the producer if it failed.
+        """
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished:
+                # 所有请求都已断开, 新的相同请求不再加入这次合成
+                self._on_finish(self)
+                self.task.cancel()
+
+
+class Coalescer:
+    """
+    Registry of the shared syntheses in flight, keyed by the canonical hash of the request.
+    Only deterministic requests (fixed seed) should get a key, other requests never share their output.
+    """
+
+    def __init__(self):
+        self.inflight: Dict[str, SharedSynthesis] = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(
+        self, key: str, producer_factory: Callable[[SharedSynthesis], AsyncGenerator]
+    ) -> Tuple[SharedSynthesis, bool]:
+        """
+        Attach to the synthesis of key in flight, or start it with producer_factory(synthesis).
+        Returns the synthesis and whether an existing one was joined.
+        """
+        synthesis = self.inflight.get(key)
+        if synthesis is not None:
+            self.joined += 1
+            COALESCED.inc()
+            return synthesis, True
+        synthesis = SharedSynthesis(key, self._finish)
+        self.inflight[key] = synthesis
+        self.started += 1
+        synthesis.start(producer_factory(synthesis))
+        return synthesis, False
+
+    def _finish(self, synthesis: SharedSynthesis):
+        if self.inflight.get(synthesis.key) is synthesis:
+            del self.inflight[synthesis.key]
+
+    def stats(self) -> dict:
+        return {"inflight": len(self.inflight), "started": self.started, "joined": self.joined}
@@ -0,0 +1,281 @@
+"""
+Process-wide metrics of the TTS pipeline, rendered in the Prometheus text format (no client library needed).
+
+Stages observed in tts_stage_seconds:
+    ref         reference audio / voice profile preparation
+    text        text segmentation + G2P + BERT of a request (or of a streaming batch)
+    g2p, bert   the two halves of text, per sentence
+    t2s_prefill T2S prompt processing (first decoding step)
+    t2s         whole T2S decoding of a batch
+    vits        SoVITS decode, or CFM + vocoder for v3/v4
+    vocoder     vocoder alone (v3/v4)
+    post        audio post-processing (normalisation, concatenation, super sampling)
+    encode      audio encoding in the serving layer
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labels: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        raise NotImplementedError
+
+    def subtract(self, after: dict, before: dict) -> dict:
+        """
+        Changes between two snapshots, the unchanged label sets are left out.
+        """
+        raise NotImplementedError
+
+    def merge(self, values: dict):
+        """
+        Add the values of a snapshot or of a subtract() result, e.g. recorded in another process.
+        """
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def subtract(self, after: dict, before: dict) -> dict:
+        return {key: value - before.get(key, 0.0) for key, value in after.items() if value != before.get(key, 0.0)}
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [每个桶的计数..., 总数, 总和]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += 1
+            data[-1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: list(data) for key, data in self._values.items()}
+
+    def subtract(self, after: dict, before: dict) -> dict:
+        delta = {}
+        for key, data in after.items():
+            old = before.get(key)
+            if old is None:
+                delta[key] = list(data)
+            elif data[-2] != old[-2]:
+                delta[key] = [value - old_value for value, old_value in zip(data, old)]
+        return delta
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, delta in values.items():
+                data = self._values.get(key)
+                if data is None:
+                    data = self._values[key] = [0] * len(self.buckets) + [0, 0.0]
+                for i, value in enumerate(delta):
+                    data[i] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(data)) for key, data in self._values.items()]
+        lines = []
+        for key, data in items:
+            for bound, count in zip(self.buckets + ("+Inf",), data):
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {data[-2]}")
+            lines.append(f"{self.name}_sum{labels} {data[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]):
+        """
+        collector() returns {gauge name: value}, called on every render (e.g. cache/queue statistics).
+        """
+        self.collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def delta_since(self, before: Dict[str, dict]) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+        """
+        Returns the changes of every metric since the snapshot before, and the current snapshot.
+        Used by the pool workers to report what they recorded to the parent process (see worker_pool.py).
+        """
+        after = self.snapshot()
+        delta = {}
+        for metric in self.metrics:
+            changes = metric.subtract(after[metric.name], before.get(metric.name, {}))
+            if changes:
+                delta[metric.name] = changes
+        return delta, after
+
+    def merge(self, delta: Dict[str, dict]):
+        for metric in self.metrics:
+            if metric.name in delta:
+                metric.merge(delta[metric.name])
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                print(f"metrics collector failed: {e}")
+                continue
+            for name, value in values.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("tts_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+T2S_TOKEN_SECONDS = REGISTRY.histogram(
+    "tts_t2s_token_seconds", "Mean T2S decoding latency per step after the prefill", buckets=TOKEN_BUCKETS
+)
+T2S_TOKENS = REGISTRY.counter("tts_t2s_tokens_total", "Semantic tokens generated by T2S")
+T2S_EARLY_STOPS = REGISTRY.counter("tts_t2s_early_stop_total", "T2S decodings stopped at the maximum length")
+BATCH_SENTENCES = REGISTRY.histogram(
+    "tts_batch_sentences", "Sentences per T2S batch (batch occupancy)", buckets=BATCH_BUCKETS
+)
+AUDIO_SECONDS = REGISTRY.counter("tts_audio_seconds_total", "Seconds of audio produced")
+REAL_TIME_FACTOR = REGISTRY.histogram(
+    "tts_real_time_factor", "Synthesis time divided by the audio duration, per request", buckets=RTF_BUCKETS
+)
+REQUESTS = REGISTRY.counter("tts_requests_total", "Finished requests by status", ("status",))
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def observe_t2s(stats: dict, batch_size: int):
+    """
+    Record the stats filled by Text2SemanticDecoder.infer_panel_* (see stats kwarg).
+    """
+    BATCH_SENTENCES.observe(batch_size)
+    if "prefill" in stats:
+        observe_stage("t2s_prefill", stats["prefill"])
+    if stats.get("steps", 0) > 0:
+        T2S_TOKEN_SECONDS.observe(stats["decode"] / stats["steps"])
+    T2S_TOKENS.inc(stats.get("tokens", 0))
+    if stats.get("early_stop"):
+        T2S_EARLY_STOPS.inc(stats["early_stop"])
+
+
+def observe_request(audio_seconds: float, elapsed: float, status: str = "ok"):
+    REQUESTS.inc(status=status)
+    if audio_seconds > 0:
+        AUDIO_SECONDS.inc(audio_seconds)
+        REAL_TIME_FACTOR.observe(elapsed / audio_seconds)
+
+
+def server_timing(timings: dict) -> str:
+    """
+    Server-Timing header value of the per-request stage timings (RequestContext.timings), in milliseconds.
+    """
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
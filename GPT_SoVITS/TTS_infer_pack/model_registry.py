@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from copy import deepcopy
+from typing import Dict, Union
+
+import torch
+
+from process_ckpt import get_sovits_version_from_path_fast
+
+
+def module_nbytes(module: torch.nn.Module) -> int:
+    if module is None:
+        return 0
+    nbytes = sum(p.numel() * p.element_size() for p in module.parameters())
+    nbytes += sum(b.numel() * b.element_size() for b in module.buffers())
+    return nbytes
+
+
+class ModelRegistry:
+    """
+    Several GPT/SoVITS weight pairs served from one process.
+
+    Every entry is a TTS pipeline keyed by (gpt path, sovits path, sovits model version). Entries are created
+    from the default pipeline with TTS(configs, shared=default), so BERT, CNHuBERT, SV, the super-resolution
+    model, vocoders, the text frontend and the voice cache are loaded once and shared by all entries.
+
+    Weights are loaded on a dedicated loader thread, requests on models that are already loaded keep running
+    meanwhile. When the T2S + SoVITS weights of the entries exceed max_bytes, the least recently used entries
+    are dropped (the default pipeline is never dropped). A dropped pipeline stays usable by requests that
+    already hold it and is freed once they finish.
+    """
+
+    def __init__(self, default_tts, max_bytes: int = 8 << 30):
+        self.default_tts = default_tts
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self.loads = 0
+        self.evictions = 0
+        self._loading: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model_load")
+        default_tts.enable_component_sharing()
+
+    def make_key(self, gpt_path: Union[str, None], sovits_path: Union[str, None]) -> tuple:
+        """
+        Missing paths fall back to the weights of the default pipeline.
+        """
+        configs = self.default_tts.configs
+        gpt_path = configs.t2s_weights_path if gpt_path in [None, ""] else gpt_path
+        sovits_path = configs.vits_weights_path if sovits_path in [None, ""] else sovits_path
+        for path in [gpt_path, sovits_path]:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"weights not found: {path}")
+        _, model_version, _ = get_sovits_version_from_path_fast(sovits_path)
+        return (os.path.abspath(gpt_path), os.path.abspath(sovits_path), model_version)
+
+    def _default_key(self) -> tuple:
+        configs = self.default_tts.configs
+        return (os.path.abspath(configs.t2s_weights_path), os.path.abspath(configs.vits_weights_path))
+
+    def get_loaded(self, key: tuple):
+        """
+        Return the pipeline for key if it is loaded, else None.
+        """
+        if key[:2] == self._default_key():
+            return self.default_tts
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            entry["hits"] += 1
+            entry["last_used"] = time.time()
+            self.entries.move_to_end(key)
+            return entry["tts"]
+
+    def load_async(self, gpt_path: Union[str, None] = None, sovits_path: Union[str, None] = None) -> Future:
+        """
+        Return a Future of the pipeline for these weights, loading them on the loader thread if needed.
+        Concurrent calls for the same weights share one load.
+        """
+        key = self.make_key(gpt_path, sovits_path)
+        tts = self.get_loaded(key)
+        if tts is not None:
+            future = Future()
+            future.set_result(tts)
+            return future
+        with self._lock:
+            future = self._loading.get(key)
+            if future is None:
+                future = self._loader.submit(self._load, key)
+                self._loading[key] = future
+        return future
+
+    def get(self, gpt_path: Union[str, None] = None, sovits_path: Union[str, None] = None):
+        """
+        Blocking version of load_async.
+        """
+        return self.load_async(gpt_path, sovits_path).result()
+
+    def _load(self, key: tuple):
+        try:
+            tts = self.get_loaded(key)
+            if tts is not None:
+                return tts
+            t0 = time.perf_counter()
+            configs = deepcopy(self.default_tts.configs)
+            # 注册表中的条目不写回配置文件
+            configs.configs_path = None
+            configs.t2s_weights_path = key[0]
+            configs.vits_weights_path = key[1]
+            tts = type(self.default_tts)(configs, shared=self.default_tts)
+            nbytes = module_nbytes(tts.t2s_model) + module_nbytes(tts.vits_model)
+            now = time.time()
+            with self._lock:
+                self.entries[key] = {
+                    "tts": tts,
+                    "nbytes": nbytes,
+                    "hits": 0,
+                    "created": now,
+                    "last_used": now,
+                    "load_time": time.perf_counter() - t0,
+                }
+                self.loads += 1
+                self._enforce_budget()
+            print(f"Model registry: loaded {key[0]} + {key[1]} ({key[2]}, {nbytes / (1 << 20):.1f} MB)")
+            return tts
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def _enforce_budget(self):
+        # 保留最近加载/使用的一个条目, 即使它本身超出预算
+        nbytes = sum(entry["nbytes"] for entry in self.entries.values())
+        evicted = False
+        while nbytes > self.max_bytes and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            nbytes -= entry["nbytes"]
+            self.evictions += 1
+            evicted = True
+            print(f"Model registry: evicted {key[0]} + {key[1]}")
+        if evicted:
+            self.default_tts.empty_cache()
+
+    def unload(self, gpt_path: Union[str, None] = None, sovits_path: Union[str, None] = None) -> bool:
+        key = self.make_key(gpt_path, sovits_path)
+        with self._lock:
+            entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.default_tts.empty_cache()
+        return True
+
+    def stats(self) -> dict:
+        configs = self.default_tts.configs
+        with self._lock:
+            return {
+                "default": {
+                    "gpt_weights_path": configs.t2s_weights_path,
+                    "sovits_weights_path": configs.vits_weights_path,
+                    "version": configs.version,
+                },
+                "entries": len(self.entries),
+                "bytes": sum(entry["nbytes"] for entry in self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "loading": len(self._loading),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "models": [
+                    {
+                        "gpt_weights_path": key[0],
+                        "sovits_weights_path": key[1],
+                        "version": key[2],
+                        "bytes": entry["nbytes"],
+                        "hits": entry["hits"],
+                        "created": entry["created"],
+                        "last_used": entry["last_used"],
+                        "load_time": entry["load_time"],
+                    }
+                    for key, entry in self.entries.items()
+                ],
+            }
@@ -0,0 +1,179 @@
+"""
+Per-request profiling of TTS.run (inputs["profile"]), the result is stored under TRACE_DIR/<trace_id>.<ext>.
+
+"torch"     torch.profiler over the request, exported as a Chrome trace (.json, open in https://ui.perfetto.dev or
+            chrome://tracing). The stages are named record_function regions: g2p, g2pw, bert, ref, t2s_prefill,
+            t2s_decode, t2s_sample, vits_decode, cfm, vocoder.
+"sampling"  in-process sampling of the Python stack of the thread running the request, written as collapsed stacks
+            (.txt, the format of `py-spy record --format raw`), for flamegraph.pl / speedscope / inferno.
+
+Both cover the whole process while the request runs: in streaming mode, requests interleaved on the same inference
+thread show up in the trace too. Only one torch profile can run at a time.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Union
+
+import torch
+
+PROFILE_MODES = ["torch", "sampling"]
+TRACE_DIR = "traces"
+# 超过该数量时删除最旧的 trace 文件
+MAX_TRACES = 100
+SAMPLING_INTERVAL = 0.005
+
+_TRACE_ID_RE = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+_TRACE_EXTS = {"torch": ".json", "sampling": ".txt"}
+_torch_profile_lock = threading.Lock()
+
+
+def new_trace_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+
+
+def check_trace_id(trace_id: str) -> bool:
+    return isinstance(trace_id, str) and _TRACE_ID_RE.match(trace_id) is not None
+
+
+def find_trace(trace_id: str) -> Union[str, None]:
+    """
+    Path of the trace stored under trace_id, or None.
+    """
+    if not check_trace_id(trace_id):
+        return None
+    for ext in _TRACE_EXTS.values():
+        path = os.path.join(TRACE_DIR, trace_id + ext)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _prune_traces():
+    try:
+        names = [name for name in os.listdir(TRACE_DIR) if os.path.splitext(name)[1] in _TRACE_EXTS.values()]
+    except FileNotFoundError:
+        return
+    if len(names) <= MAX_TRACES:
+        return
+    paths = sorted((os.path.join(TRACE_DIR, name) for name in names), key=os.path.getmtime)
+    for path in paths[: len(paths) - MAX_TRACES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class StackSampler:
+    """
+    Samples the Python stack of one thread every interval seconds (sys._current_frames, no external tool needed).
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLING_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="tts_stack_sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread.join()
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """
+    Profiler of one request. start() and stop() are called by TTS.run, track_thread() whenever the request
+    generator is resumed, so the sampler follows the thread actually running it.
+    """
+
+    def __init__(self, mode: str = "torch", trace_id: str = None):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"profile mode must be one of {PROFILE_MODES}, got {mode}")
+        if trace_id is None:
+            trace_id = new_trace_id()
+        elif not check_trace_id(trace_id):
+            raise ValueError(f"invalid trace_id: {trace_id}")
+        self.mode = mode
+        self.trace_id = trace_id
+        self.path = os.path.join(TRACE_DIR, trace_id + _TRACE_EXTS[mode])
+        self._profile: torch.profiler.profile = None
+        self._sampler: StackSampler = None
+        self._running = False
+        self._saved_path: str = None
+
+    def start(self) -> bool:
+        """
+        Returns False (and the request runs unprofiled) if another torch profile is running.
+        """
+        if self.mode == "torch":
+            if not _torch_profile_lock.acquire(blocking=False):
+                print(f"profile: another request is being profiled, {self.trace_id} is skipped")
+                return False
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._profile = torch.profiler.profile(activities=activities, record_shapes=True, with_stack=True)
+            try:
+                self._profile.start()
+            except Exception:
+                _torch_profile_lock.release()
+                raise
+        else:
+            self._sampler = StackSampler(threading.get_ident())
+            self._sampler.start()
+        self._running = True
+        return True
+
+    def track_thread(self):
+        if self._sampler is not None:
+            self._sampler.thread_id = threading.get_ident()
+
+    def stop(self) -> Union[str, None]:
+        """
+        Stop profiling and write the trace, returns its path (None if the request was not profiled).
+        Calling it again only returns the path.
+        """
+        if not self._running:
+            return self._saved_path
+        self._running = False
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        if self._profile is not None:
+            try:
+                self._profile.stop()
+                self._profile.export_chrome_trace(self.path)
+                print(self._profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=15))
+            finally:
+                self._profile = None
+                _torch_profile_lock.release()
+        else:
+            self._sampler.stop()
+            self._sampler.write(self.path)
+        self._saved_path = self.path
+        _prune_traces()
+        print(f"profile: trace {self.trace_id} saved to {self.path}")
+        return self.path
@@ -0,0 +1,42 @@
+import threading
+import time
+
+from TTS_infer_pack.metrics import observe_stage
+
+
+class RequestContext:
+    """
+    Per-request state of TTS.run, so concurrent requests do not share flags on the TTS object.
+
+    cancel() may be called from any thread: the T2S decode loop checks it every token,
+    the SoVITS/vocoder stages every fragment/chunk, and run() stops at the next check.
+    Attributes:
+        parallel_infer: bool, T2S sampling mode used by this request.
+        timings: dict, seconds spent in each stage ("ref", "text", "t2s", "vits", "post"),
+            also observed in the process-wide stage histograms (see metrics.py).
+        trace_id: str, set by run() when the request is profiled (see profiling.py),
+            trace_path is set once the trace has been written.
+        trace_skipped: bool, set by run() instead of trace_id when profiling was requested but could not start.
+        failed: bool, set by run() when inference failed: the silent placeholder it yields then must not be
+            used (or cached) as the result, the error is raised by the next iteration.
+    """
+
+    def __init__(self, parallel_infer: bool = True):
+        self._cancel_event = threading.Event()
+        self.parallel_infer = parallel_infer
+        self.timings: dict = {}
+        self.start_time = time.perf_counter()
+        self.trace_id: str = None
+        self.trace_path: str = None
+        self.trace_skipped = False
+        self.failed = False
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def add_timing(self, stage: str, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        observe_stage(stage, seconds)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
+
+# 路径参数按文件内容计入 key
+IGNORED_PARAMS = {"gpt_weights_path", "sovits_weights_path", "ref_audio_path", "aux_ref_audio_paths", "voice_profile"}
+
+
+def iter_file(f: BinaryIO, block_size: int = 1 << 16) -> Iterator[bytes]:
+    """
+    Read an open file in blocks and close it at the end.
+    """
+    with f:
+        for block in iter(lambda: f.read(block_size), b""):
+            yield block
+
+
+class RequestHasher:
+    """
+    Canonical hash of deterministic requests (seed != -1): the canonical JSON of every request parameter together
+    with the content hashes of the reference audio(s) / voice profile and fingerprints of the GPT/SoVITS weights,
+    so replacing any of these files changes the key.
+    """
+
+    def __init__(self):
+        self._file_hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def hash_file(self, path: str) -> str:
+        """
+        Content hash of a file, memoized on (mtime, size) so unchanged files (weights included) are not read again.
+        """
+        stat = os.stat(path)
+        memo = self._file_hashes.get(path)
+        if memo is not None and memo[0] == stat.st_mtime_ns and memo[1] == stat.st_size:
+            return memo[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self._file_hashes[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def make_key(self, req: dict, weights_paths: List[str], extra: dict = None) -> Union[str, None]:
+        """
+        Canonical hash of a request, None if the request is not cacheable (random seed).
+        Args:
+            weights_paths: list, the GPT/SoVITS weights serving the request.
+            extra: dict, other settings affecting the output (model version, precision, ...).
+        """
+        seed = req.get("seed", -1)
+        if seed in [-1, "", None]:
+            return None
+        params = {k: v for k, v in req.items() if k not in IGNORED_PARAMS}
+        params["ref_audio"] = self.hash_file(req["ref_audio_path"]) if req.get("ref_audio_path") else None
+        params["aux_ref_audios"] = [self.hash_file(path) for path in req.get("aux_ref_audio_paths") or []]
+        params["voice_profile"] = self.hash_file(req["voice_profile"]) if req.get("voice_profile") else None
+        params["weights"] = [self.hash_file(path) for path in weights_paths]
+        params["extra"] = extra or {}
+        data = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(RequestHasher):
+    """
+    Size-bounded LRU disk cache of final encoded responses, keyed by RequestHasher.make_key.
+
+    Entries are plain files named after their key, served directly from disk. The index is rebuilt from the
+    directory (ordered by mtime) on startup, so the cache survives restarts.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+        self._enforce_budget()
+
+    def get(self, key: str) -> Union[BinaryIO, None]:
+        """
+        The cached response for key opened for reading, or None. The caller closes it.
+        The file is opened here, so an eviction after get() does not affect the response being sent.
+        """
+        with self._lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            path = os.path.join(self.cache_dir, key)
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                # 被其他进程或手动删除
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def put(self, key: str, data: bytes):
+        path = os.path.join(self.cache_dir, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.entries[key] = len(data)
+            self.entries.move_to_end(key)
+            self.stores += 1
+            self._enforce_budget()
+
+    def _enforce_budget(self):
+        nbytes = sum(self.entries.values())
+        while nbytes > self.max_bytes and self.entries:
+            key, size = self.entries.popitem(last=False)
+            nbytes -= size
+            self.evictions += 1
+            try:
+                # 正在发送的文件已在 get() 中打开, 删除不影响其读取
+                os.remove(os.path.join(self.cache_dir, key))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Windows 上无法删除打开中的文件, 留到下次启动时重建索引
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": sum(self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
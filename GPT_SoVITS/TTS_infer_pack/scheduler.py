@@ -0,0 +1,381 @@
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, List, Union
+
+import numpy as np
+import torch
+
+from TTS_infer_pack.request_context import RequestContext
+from TTS_infer_pack import metrics
+from tools.i18n.i18n import I18nAuto, scan_language_list
+
+import os
+import sys
+
+language = os.environ.get("language", "Auto")
+language = sys.argv[-1] if sys.argv[-1] in scan_language_list() else language
+i18n = I18nAuto(language=language)
+
+
+class ScheduledRequest:
+    """
+    A request submitted to BatchScheduler.
+    Outputs are delivered in sentence order through on_output, as (sr, np.int16 audio) tuples,
+    followed by None when the request is finished, or an Exception when it failed.
+    Without on_output, the outputs can be read by iterating the request (blocking).
+    A RequestContext may be passed to share cancellation and stage timings with the caller.
+    """
+
+    def __init__(self, inputs: dict, on_output: Callable = None, tts=None, context: RequestContext = None):
+        self.inputs = inputs
+        self.tts = tts
+        self.submit_time = time.perf_counter()
+        self.context = context if context is not None else RequestContext(inputs.get("parallel_infer", True))
+        self.audio_seconds = 0.0
+        self.finished = False
+        self.voice: dict = None
+        self.no_prompt_text = False
+        self.signature: tuple = None
+        self.n_sentences = 0
+        self.next_index = 0
+        self.done_fragments: dict = {}
+        self._queue: queue.Queue = None
+        if on_output is None:
+            self._queue = queue.Queue()
+            on_output = self._queue.put
+        self.on_output = on_output
+
+    def cancel(self):
+        """
+        Stop synthesizing the remaining sentences, e.g. when the client disconnected.
+        A batch is only interrupted when all of its requests are cancelled.
+        """
+        self.context.cancel()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.context.is_cancelled()
+
+    def __iter__(self):
+        assert self._queue is not None, "outputs are delivered through on_output"
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class BatchScheduler:
+    """
+    Cross-request dynamic batching in front of a TTS pipeline.
+
+    Requests are preprocessed (reference voice, text segmentation and BERT) when they are admitted,
+    and their sentences wait in a shared queue. The scheduler thread takes the oldest sentence and,
+    after waiting at most max_wait seconds for more work, batches it with every waiting sentence that
+    can share a T2S/SoVITS forward pass: same reference voice and same sampling parameters, since the
+    prompt and the refer spec are shared by the whole batch. The batch is limited by max_batch_size
+    and max_batch_tokens (prompt + text phones). Audio fragments are routed back to each request in order.
+
+    All model calls happen on the scheduler thread, the TTS object must not be used elsewhere meanwhile.
+    Requests may name another pipeline (e.g. from ModelRegistry), sentences of different pipelines are never batched together.
+    """
+
+    def __init__(self, tts, max_wait: float = 0.02, max_batch_size: int = 16, max_batch_tokens: int = 4096):
+        self.tts = tts
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self._inbox: queue.Queue = queue.Queue()
+        self._pending: List[dict] = []
+        self._running = False
+        self._thread: threading.Thread = None
+        self.batches = 0
+        self.batched_sentences = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="tts_batch_scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._inbox.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(
+        self, inputs: dict, on_output: Callable = None, tts=None, context: RequestContext = None
+    ) -> ScheduledRequest:
+        """
+        Submit a request, see TTS.run for the inputs. Thread safe.
+        Args:
+            tts: TTS, (optional) pipeline to use instead of the default one.
+            context: RequestContext, (optional) see ScheduledRequest.
+        """
+        request = ScheduledRequest(inputs, on_output, tts if tts is not None else self.tts, context)
+        self._inbox.put(request)
+        return request
+
+    def run_in_scheduler(self, func: Callable, *args):
+        """
+        Run func(*args) on the scheduler thread between two batches and return its result,
+        for operations that touch the models (e.g. switching weights).
+        """
+        done = threading.Event()
+        result = {}
+
+        def call():
+            try:
+                result["value"] = func(*args)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                done.set()
+
+        self._inbox.put(call)
+        done.wait()
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+
+    ###### scheduler thread ######
+    def _loop(self):
+        while self._running:
+            if not self._pending:
+                self._handle(self._inbox.get())
+                continue
+
+            # 等待最早的句子至多 max_wait, 期间收集其他请求的句子
+            deadline = self._pending[0]["enqueue_time"] + self.max_wait
+            while not self._batch_full(self._pending[0]["request"].signature):
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    self._handle(self._inbox.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                if not self._pending:
+                    break
+            while True:
+                try:
+                    self._handle(self._inbox.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._drop_cancelled()
+            batch = self._take_batch()
+            if batch:
+                self._run_batch(batch)
+
+    def _handle(self, item):
+        if item is None:
+            return
+        if isinstance(item, ScheduledRequest):
+            self._admit(item)
+        else:
+            item()
+
+    def _admit(self, request: ScheduledRequest):
+        if request.cancelled:
+            self._finish(request, None)
+            return
+        inputs = request.inputs
+        tts = request.tts
+        try:
+            text_lang = inputs.get("text_lang", "")
+            assert text_lang in tts.configs.languages
+            t0 = time.perf_counter()
+            request.voice, request.no_prompt_text = tts.prepare_voice(
+                inputs.get("ref_audio_path", ""),
+                inputs.get("aux_ref_audio_paths", []),
+                inputs.get("prompt_text", ""),
+                inputs.get("prompt_lang", ""),
+                inputs.get("voice_profile", None),
+            )
+            t1 = time.perf_counter()
+            data = tts.text_preprocessor.preprocess(
+                inputs.get("text", ""), text_lang, inputs.get("text_split_method", "cut0"), tts.configs.version
+            )
+            request.context.add_timing("ref", t1 - t0)
+            request.context.add_timing("text", time.perf_counter() - t1)
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(request, e)
+            return
+
+        speed_factor = float(inputs.get("speed_factor", 1.0))
+        # 只有共享参考音色和采样参数的句子才能放进同一个批次
+        request.signature = (
+            id(request.voice),
+            id(tts),
+            request.no_prompt_text,
+            inputs.get("top_k", 5),
+            inputs.get("top_p", 1),
+            inputs.get("temperature", 1),
+            inputs.get("repetition_penalty", 1.35),
+            speed_factor,
+            inputs.get("parallel_infer", True),
+            inputs.get("sample_steps", 32),
+        )
+        request.n_sentences = len(data)
+        if len(data) == 0:
+            request.on_output((16000, np.zeros(int(16000), dtype=np.int16)))
+            self._finish(request, None)
+            return
+
+        prompt_len = 0 if request.no_prompt_text else len(request.voice["phones"])
+        now = time.perf_counter()
+        for index, res in enumerate(data):
+            res["request"] = request
+            res["index"] = index
+            res["n_tokens"] = prompt_len + len(res["phones"])
+            res["enqueue_time"] = now
+            self._pending.append(res)
+
+    def _batch_full(self, signature: tuple) -> bool:
+        size = 0
+        tokens = 0
+        for res in self._pending:
+            if res["request"].signature == signature:
+                size += 1
+                tokens += res["n_tokens"]
+        return size >= self.max_batch_size or tokens >= self.max_batch_tokens
+
+    def _take_batch(self) -> List[dict]:
+        if not self._pending:
+            return []
+        signature = self._pending[0]["request"].signature
+        batch = []
+        rest = []
+        tokens = 0
+        for res in self._pending:
+            if (
+                res["request"].signature == signature
+                and len(batch) < self.max_batch_size
+                and (len(batch) == 0 or tokens + res["n_tokens"] <= self.max_batch_tokens)
+            ):
+                batch.append(res)
+                tokens += res["n_tokens"]
+            else:
+                rest.append(res)
+        self._pending = rest
+        return batch
+
+    def _drop_cancelled(self):
+        cancelled = {id(res["request"]) for res in self._pending if res["request"].cancelled}
+        if not cancelled:
+            return
+        for res in self._pending:
+            request = res["request"]
+            if id(request) in cancelled and not request.finished:
+                self._finish(request, None)
+        self._pending = [res for res in self._pending if id(res["request"]) not in cancelled]
+
+    @torch.no_grad()
+    def _run_batch(self, batch: List[dict]):
+        request: ScheduledRequest = batch[0]["request"]
+        tts = request.tts
+        speed_factor = request.signature[7]
+        parallel_infer = request.signature[8]
+        requests = list({id(res["request"]): res["request"] for res in batch}.values())
+
+        def should_stop():
+            return all(req.cancelled for req in requests)
+
+        try:
+            t0 = time.perf_counter()
+            data, _ = tts.to_batch(
+                batch,
+                prompt_data=request.voice if not request.no_prompt_text else None,
+                batch_size=len(batch),
+                split_bucket=False,
+                device=tts.configs.device,
+                precision=tts.precision,
+            )
+            item = data[0]
+            pred_semantic_list, idx_list = tts._predict_semantic(
+                item,
+                request.voice if not request.no_prompt_text else None,
+                top_k=request.signature[3],
+                top_p=request.signature[4],
+                temperature=request.signature[5],
+                repetition_penalty=request.signature[6],
+                parallel_infer=parallel_infer,
+                should_stop=should_stop,
+            )
+            t1 = time.perf_counter()
+            fragments = tts._decode_semantic(
+                item,
+                pred_semantic_list,
+                idx_list,
+                request.voice,
+                speed_factor=speed_factor,
+                parallel_infer=parallel_infer,
+                sample_steps=request.signature[9],
+                should_stop=should_stop,
+            )
+            t2 = time.perf_counter()
+        except Exception as e:
+            traceback.print_exc()
+            for req in requests:
+                self._finish(req, e)
+            self._pending = [res for res in self._pending if not res["request"].finished]
+            tts.empty_cache()
+            return
+
+        self.batches += 1
+        self.batched_sentences += len(batch)
+        print(
+            f"############ {i18n('合成音频')}: batch {len(batch)} sentences from {len(requests)} requests ############"
+        )
+        for req in requests:
+            req.context.add_timing("t2s", t1 - t0)
+            req.context.add_timing("vits", t2 - t1)
+            if req.cancelled:
+                self._finish(req, None)
+        output_sr = tts.configs.sampling_rate if not tts.configs.use_vocoder else tts.vocoder_configs["sr"]
+        for res, fragment in zip(batch, fragments):
+            req: ScheduledRequest = res["request"]
+            if req.finished:
+                continue
+            req_inputs = req.inputs
+            super_sampling = req_inputs.get("super_sampling", False)
+            t3 = time.perf_counter()
+            req.done_fragments[res["index"]] = tts.audio_postprocess(
+                [[fragment]],
+                output_sr,
+                None,
+                speed_factor,
+                False,
+                max(0.01, req_inputs.get("fragment_interval", 0.3)),
+                super_sampling if tts.configs.use_vocoder and tts.configs.version == "v3" else False,
+            )
+            req.context.add_timing("post", time.perf_counter() - t3)
+            sr, fragment = req.done_fragments[res["index"]]
+            req.audio_seconds += len(fragment) / sr
+            # 按句子顺序返回
+            while req.next_index in req.done_fragments:
+                req.on_output(req.done_fragments.pop(req.next_index))
+                req.next_index += 1
+            if req.next_index == req.n_sentences:
+                self._finish(req, None)
+
+    def _finish(self, request: ScheduledRequest, error: Union[Exception, None]):
+        if request.finished:
+            return
+        request.finished = True
+        if error is not None:
+            metrics.observe_request(0.0, 0.0, "error")
+        elif request.cancelled:
+            metrics.observe_request(0.0, 0.0, "cancelled")
+        else:
+            metrics.observe_request(request.audio_seconds, sum(request.context.timings.values()))
+        request.on_output(error)
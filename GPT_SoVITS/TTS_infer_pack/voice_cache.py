@@ -0,0 +1,209 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple, Union
+
+import torch
+
+
+def _map_tensors(obj, fn: Callable[[torch.Tensor], torch.Tensor]):
+    """
+    Apply fn to every tensor in a (nested) dict/list/tuple, return a new structure.
+    """
+    if isinstance(obj, torch.Tensor):
+        return fn(obj)
+    if isinstance(obj, dict):
+        return {k: _map_tensors(v, fn) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_map_tensors(v, fn) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(_map_tensors(v, fn) for v in obj)
+    return obj
+
+
+def _iter_tensors(obj):
+    if isinstance(obj, torch.Tensor):
+        yield obj
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            yield from _iter_tensors(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            yield from _iter_tensors(v)
+
+
+def tensor_nbytes(obj) -> int:
+    return sum(t.numel() * t.element_size() for t in _iter_tensors(obj))
+
+
+class VoiceCache:
+    """
+    LRU cache of reference voices (prompt_semantic, refer_spec, raw_audio, prompt phones/bert).
+
+    Entries are keyed by the content hash of the reference audio(s), the prompt text/lang and the model version,
+    so a file replaced in place is not served from a stale entry.
+    Two byte budgets are kept:
+        max_gpu_bytes: entries resident on the inference device, the least recently used ones are moved to CPU when exceeded.
+        max_bytes: all entries (CPU + GPU), the least recently used ones are dropped when exceeded.
+    The cached voice dicts are never modified in place, demotion/promotion replaces them with new dicts,
+    so a voice returned by get() stays valid while a request is using it.
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30, max_gpu_bytes: int = 512 << 20):
+        self.max_bytes = max_bytes
+        self.max_gpu_bytes = max_gpu_bytes
+        self.entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._file_hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.RLock()
+
+    def hash_file(self, path: str) -> str:
+        """
+        Content hash of a file, memoized on (mtime, size) so unchanged files are not read again.
+        """
+        stat = os.stat(path)
+        memo = self._file_hashes.get(path)
+        if memo is not None and memo[0] == stat.st_mtime_ns and memo[1] == stat.st_size:
+            return memo[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        self._file_hashes[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def hash_path(self, path: str) -> Union[str, None]:
+        """
+        Content hash of a file or of a model directory (every file in it, by relative path), None if it does not exist.
+        """
+        if os.path.isfile(path):
+            return self.hash_file(path)
+        if not os.path.isdir(path):
+            return None
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+            for name in sorted(files):
+                if name.startswith("."):
+                    continue
+                file_path = os.path.join(root, name)
+                h.update(os.path.relpath(file_path, path).replace(os.sep, "/").encode())
+                h.update(self.hash_file(file_path).encode())
+        return h.hexdigest()
+
+    def make_key(
+        self,
+        ref_audio_path: str,
+        aux_ref_audio_paths: List[str],
+        prompt_text: Union[str, None],
+        prompt_lang: Union[str, None],
+        model_version: tuple,
+    ) -> tuple:
+        aux_hashes = tuple(self.hash_file(path) for path in aux_ref_audio_paths)
+        return (self.hash_file(ref_audio_path), aux_hashes, prompt_text or "", prompt_lang or "", model_version)
+
+    def make_profile_key(self, profile_path: str, model_version: tuple) -> tuple:
+        # 预编译音色文件: 参考文本已包含在文件中, 以文件内容哈希区分
+        return (self.hash_file(profile_path), ("profile",), "", "", model_version)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry["nbytes"] for entry in self.entries.values())
+
+    @property
+    def gpu_nbytes(self) -> int:
+        return sum(entry["nbytes"] for entry in self.entries.values() if entry["on_gpu"])
+
+    def get(self, key: tuple, device: Union[str, torch.device]) -> Union[dict, None]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["hits"] += 1
+            entry["last_used"] = time.time()
+            self.entries.move_to_end(key)
+            if str(device) != entry["device"]:
+                # 被换出到 CPU 的条目 (或切换了推理设备), 重新放到推理设备上
+                entry["data"] = _map_tensors(entry["data"], lambda t: t.to(device))
+                entry["device"] = str(device)
+                entry["on_gpu"] = _is_gpu(device)
+                self._enforce_budget()
+            return entry["data"]
+
+    def put(self, key: tuple, data: dict, device: Union[str, torch.device]) -> dict:
+        with self._lock:
+            now = time.time()
+            self.entries[key] = {
+                "data": data,
+                "nbytes": tensor_nbytes(data),
+                "device": str(device),
+                "on_gpu": _is_gpu(device),
+                "hits": 0,
+                "created": now,
+                "last_used": now,
+            }
+            self.entries.move_to_end(key)
+            self._enforce_budget()
+            return data
+
+    def _enforce_budget(self):
+        # 保留最近使用的一个条目, 即使它本身超出预算
+        gpu_nbytes = self.gpu_nbytes
+        for key in list(self.entries.keys())[:-1]:
+            if gpu_nbytes <= self.max_gpu_bytes:
+                break
+            entry = self.entries[key]
+            if entry["on_gpu"]:
+                entry["data"] = _map_tensors(entry["data"], lambda t: t.cpu())
+                entry["device"] = "cpu"
+                entry["on_gpu"] = False
+                gpu_nbytes -= entry["nbytes"]
+
+        nbytes = self.nbytes
+        while nbytes > self.max_bytes and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            nbytes -= entry["nbytes"]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._file_hashes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.nbytes,
+                "gpu_bytes": self.gpu_nbytes,
+                "max_bytes": self.max_bytes,
+                "max_gpu_bytes": self.max_gpu_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "voices": [
+                    {
+                        "ref_audio_hash": key[0],
+                        "prompt_text": key[2],
+                        "prompt_lang": key[3],
+                        "model_version": list(key[4]),
+                        "bytes": entry["nbytes"],
+                        "on_gpu": entry["on_gpu"],
+                        "hits": entry["hits"],
+                        "created": entry["created"],
+                        "last_used": entry["last_used"],
+                    }
+                    for key, entry in self.entries.items()
+                ],
+            }
+
+
+def _is_gpu(device: Union[str, torch.device]) -> bool:
+    return str(device) != "cpu"
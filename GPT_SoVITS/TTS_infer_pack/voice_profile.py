@@ -0,0 +1,112 @@
+"""
+Precompiled voice profiles.
+
+A voice profile stores every tensor TTS derives from a reference (prompt_semantic, refer_spec, sv_emb,
+v3/v4 mel prompt, prompt phones/bert) in one .npz file, so serving nodes can synthesize with it
+without CNHuBERT and the SV model (see "profile_only" in tts_infer.yaml).
+
+compile:
+    python GPT_SoVITS/TTS_infer_pack/voice_profile.py -c GPT_SoVITS/configs/tts_infer.yaml \
+        -r ref.wav -t "prompt text" -l zh -o voices/ref.npz
+"""
+
+import json
+import os
+import sys
+from typing import Tuple
+
+import numpy as np
+import torch
+
+PROFILE_FORMAT_VERSION = 1
+
+
+def save_voice_profile(path: str, voice: dict, meta: dict) -> None:
+    """
+    Write a voice (as returned by TTS.get_voice) to a .npz voice profile.
+    Args:
+        path: str, output path.
+        voice: dict, voice features.
+        meta: dict, json serializable metadata, e.g. model version and weights hash.
+    """
+    arrays = {
+        "prompt_semantic": voice["prompt_semantic"].cpu().numpy(),
+    }
+    for i, (spec, _) in enumerate(voice["refer_spec"]):
+        arrays[f"refer_spec_{i}"] = spec.float().cpu().numpy()
+    for i, sv_emb in enumerate(voice.get("sv_emb") or []):
+        arrays[f"sv_emb_{i}"] = sv_emb.float().cpu().numpy()
+    if voice.get("prompt_mel") is not None:
+        arrays["prompt_mel"] = voice["prompt_mel"].float().cpu().numpy()
+    if voice["phones"] is not None:
+        arrays["phones"] = np.asarray(voice["phones"], dtype=np.int64)
+        arrays["bert_features"] = voice["bert_features"].float().cpu().numpy()
+
+    meta = dict(meta)
+    meta["format_version"] = PROFILE_FORMAT_VERSION
+    meta["n_refer_spec"] = len(voice["refer_spec"])
+    meta["n_sv_emb"] = len(voice.get("sv_emb") or [])
+    meta["prompt_text"] = voice["prompt_text"]
+    meta["prompt_lang"] = voice["prompt_lang"]
+    meta["norm_text"] = voice["norm_text"]
+    arrays["meta"] = np.array(json.dumps(meta, ensure_ascii=False))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def load_voice_profile(path: str) -> Tuple[dict, dict]:
+    """
+    Read a .npz voice profile.
+    Returns:
+        voice: dict with the same fields as TTS.prompt_cache, tensors on CPU in float32.
+        meta: dict, metadata written by save_voice_profile.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("format_version") != PROFILE_FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported voice profile format {meta.get('format_version')}")
+        voice = {
+            "ref_audio_path": None,
+            "prompt_semantic": torch.from_numpy(data["prompt_semantic"]),
+            "refer_spec": [(torch.from_numpy(data[f"refer_spec_{i}"]), None) for i in range(meta["n_refer_spec"])],
+            "sv_emb": [torch.from_numpy(data[f"sv_emb_{i}"]) for i in range(meta["n_sv_emb"])] or None,
+            "prompt_mel": torch.from_numpy(data["prompt_mel"]) if "prompt_mel" in data else None,
+            "raw_audio": None,
+            "raw_sr": None,
+            "prompt_text": meta["prompt_text"],
+            "prompt_lang": meta["prompt_lang"],
+            "phones": data["phones"].tolist() if "phones" in data else None,
+            "bert_features": torch.from_numpy(data["bert_features"]) if "bert_features" in data else None,
+            "norm_text": meta["norm_text"],
+            "aux_ref_audio_paths": [],
+        }
+    return voice, meta
+
+
+if __name__ == "__main__":
+    import argparse
+
+    now_dir = os.getcwd()
+    sys.path.append(now_dir)
+    sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+    from TTS_infer_pack.TTS import TTS, TTS_Config
+
+    parser = argparse.ArgumentParser(description="compile a GPT-SoVITS voice profile")
+    parser.add_argument(
+        "-c", "--tts_config", type=str, default="GPT_SoVITS/configs/tts_infer.yaml", help="tts_infer路径"
+    )
+    parser.add_argument("-r", "--ref_audio_path", type=str, required=True, help="参考音频路径")
+    parser.add_argument("-a", "--aux_ref_audio_paths", type=str, nargs="*", default=[], help="辅助参考音频路径")
+    parser.add_argument("-t", "--prompt_text", type=str, default="", help="参考音频的文本")
+    parser.add_argument("-l", "--prompt_lang", type=str, default="", help="参考音频的语种")
+    parser.add_argument("-o", "--output", type=str, required=True, help="输出的 .npz 路径")
+    args = parser.parse_args()
+
+    tts_pipeline = TTS(TTS_Config(args.tts_config))
+    tts_pipeline.compile_voice_profile(
+        args.output, args.ref_audio_path, args.aux_ref_audio_paths, args.prompt_text, args.prompt_lang
+    )
+    print(f"voice profile written: {args.output}")
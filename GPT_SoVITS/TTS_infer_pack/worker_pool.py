@@ -0,0 +1,462 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, List
+
+import numpy as np
+import torch
+
+from TTS_infer_pack.metrics import REGISTRY
+from TTS_infer_pack.request_context import RequestContext
+
+# 小于该大小的音频块直接通过管道发送, 创建共享内存的开销更大
+SHM_MIN_BYTES = 64 * 1024
+# 切换权重后随之变化的配置, 由工作进程同步回主进程
+MODEL_STATE_FIELDS = [
+    "version",
+    "languages",
+    "t2s_weights_path",
+    "vits_weights_path",
+    "filter_length",
+    "segment_size",
+    "sampling_rate",
+    "hop_length",
+    "win_length",
+    "n_speakers",
+    "semantic_frame_rate",
+    "use_vocoder",
+]
+# call_all 部分失败时, 用调用前的配置恢复已切换的工作进程
+ROLLBACK_ARGS = {
+    "init_t2s_weights": lambda configs: (configs.t2s_weights_path,),
+    "init_vits_weights": lambda configs: (configs.vits_weights_path,),
+}
+
+
+def model_state(tts) -> dict:
+    state = {field: getattr(tts.configs, field) for field in MODEL_STATE_FIELDS}
+    state["is_v2pro"] = tts.is_v2pro
+    return state
+
+
+def apply_model_state(tts, state: dict):
+    """
+    Mirror the model state of the workers on the parent pipeline, without loading any model.
+    """
+    for field in MODEL_STATE_FIELDS:
+        setattr(tts.configs, field, state[field])
+    tts.is_v2pro = state["is_v2pro"]
+
+
+def split_cpus(num_workers: int) -> List[List[int]]:
+    """
+    Split the CPUs this process may run on into num_workers contiguous subsets.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    num_workers = max(1, num_workers)
+    size = max(1, len(cpus) // num_workers)
+    subsets = []
+    for i in range(num_workers):
+        subset = cpus[i * size : (i + 1) * size] if i < num_workers - 1 else cpus[i * size :]
+        subsets.append(subset or cpus[-size:])
+    return subsets
+
+
+def pack_fragment(audio: np.ndarray):
+    """
+    Worker side: the audio is copied once into a new shared memory block, only its name goes through the pipe
+    (instead of pickling the array and copying it through the pipe). The receiver unlinks the block.
+    """
+    if audio.nbytes < SHM_MIN_BYTES:
+        return audio
+    shm = shared_memory.SharedMemory(create=True, size=audio.nbytes)
+    try:
+        np.ndarray(audio.shape, audio.dtype, buffer=shm.buf)[...] = audio
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    shm.close()
+    return (shm.name, audio.shape, audio.dtype.str)
+
+
+def unpack_fragment(fragment) -> np.ndarray:
+    """
+    Parent side of pack_fragment, copies the audio out of the shared memory block and frees it.
+    """
+    if isinstance(fragment, np.ndarray):
+        return fragment
+    name, shape, dtype = fragment
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        view = np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+        audio = view.copy()
+        del view
+    finally:
+        shm.close()
+        shm.unlink()
+    return audio
+
+
+class PoolJob:
+    """
+    A request running on a pool worker, outputs are delivered through on_output as in BatchScheduler:
+    (sr, np.int16 audio) tuples, then None when finished or an Exception when it failed.
+    result is set before the final None, to the data sent back with the end of the job (see _worker_main).
+    The stage timings of the worker are added to context.timings (if given) when the job ends.
+    The trace_id/trace_skipped of a profiled request are set on context before its first output.
+    """
+
+    def __init__(self, job_id: int, worker: "_WorkerHandle", on_output: Callable, context: RequestContext = None):
+        self.job_id = job_id
+        self.worker = worker
+        self.on_output = on_output
+        self.context = context
+        self.finished = False
+        self.result = None
+
+    def cancel(self):
+        if not self.finished:
+            self.worker.send(("cancel", self.job_id))
+
+
+class _WorkerHandle:
+    def __init__(self, index: int, process, conn, cpus: List[int]):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.cpus = cpus
+        self.jobs: dict = {}
+        self.send_lock = threading.Lock()
+
+    @property
+    def load(self) -> int:
+        return len(self.jobs)
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class WorkerPool:
+    """
+    Forked inference workers sharing the weights loaded by the parent process.
+
+    The TTS pipeline is built once in the parent, then num_workers processes are forked from it, so the
+    model weights are shared copy-on-write (and memory-mapped safetensors share the page cache).
+    Each worker is pinned to its own CPU subset with a matching number of intra-op threads and runs one
+    request at a time. Requests go to the worker with the fewest running requests over a local pipe,
+    audio fragments stream back as they are produced, through shared memory (see pack_fragment).
+    The metrics recorded by the workers (stage histograms, T2S counters, requests...) are sent back with the end
+    of every job and merged into the REGISTRY of the parent, so /metrics covers the whole pool.
+
+    Only CPU inference is supported: CUDA cannot be used in forked children.
+    Fork before running any inference in the parent, the parent only dispatches requests.
+    Models requested per request (gpt_weights_path/sovits_weights_path) are loaded by each worker into its own
+    ModelRegistry, they are not shared between workers: every worker may use up to model_budget bytes.
+    """
+
+    def __init__(
+        self,
+        tts,
+        num_workers: int,
+        pin_cpus: bool = True,
+        worker_init: Callable = None,
+        model_budget: int = 8 << 30,
+    ):
+        """
+        Args:
+            worker_init: callable, (optional) run in every worker after fork, e.g. to warm up the text frontend
+                (onnxruntime/g2p sessions are not fork safe and should be created in the workers).
+            model_budget: int, memory budget in bytes of the per-request models of each worker.
+        """
+        if "cuda" in str(tts.configs.device):
+            raise RuntimeError("WorkerPool only supports CPU inference, CUDA cannot be used after fork")
+        self.tts = tts
+        self.num_workers = num_workers
+        self.pin_cpus = pin_cpus
+        self.worker_init = worker_init
+        self.model_budget = model_budget
+        self.workers: List[_WorkerHandle] = []
+        # 切换权重部分失败且无法恢复时, 各工作进程的模型不一致
+        self.error: str = None
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def start(self):
+        ctx = multiprocessing.get_context("fork")
+        # fork 前启动, 工作进程与主进程共用同一个 resource tracker, 由主进程释放工作进程创建的共享内存
+        resource_tracker.ensure_running()
+        for index, cpus in enumerate(split_cpus(self.num_workers)):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker_main,
+                args=(
+                    index,
+                    self.tts,
+                    child_conn,
+                    cpus if self.pin_cpus else None,
+                    self.worker_init,
+                    self.model_budget,
+                ),
+                name=f"tts_worker_{index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            worker = _WorkerHandle(index, process, parent_conn, cpus)
+            self.workers.append(worker)
+            threading.Thread(
+                target=self._reader, args=(worker,), name=f"tts_worker_reader_{index}", daemon=True
+            ).start()
+        print(f"WorkerPool: {self.num_workers} workers, CPU subsets: {[w.cpus for w in self.workers]}")
+
+    def stop(self):
+        for worker in self.workers:
+            try:
+                worker.send(("exit",))
+            except (OSError, EOFError):
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=5)
+
+    def submit(self, inputs: dict, on_output: Callable, context: RequestContext = None) -> PoolJob:
+        """
+        Run a request (see TTS.run for the inputs) on the least loaded worker. Thread safe.
+        Args:
+            context: RequestContext, (optional) receives the stage timings of the request once it has finished.
+        """
+        with self._lock:
+            worker = min(self.workers, key=lambda w: (w.load, w.index))
+            job = PoolJob(next(self._job_ids), worker, on_output, context)
+            worker.jobs[job.job_id] = job
+        worker.send(("run", job.job_id, inputs))
+        return job
+
+    @property
+    def healthy(self) -> bool:
+        return self.error is None
+
+    def call_all(self, method: str, *args):
+        """
+        Call tts.<method>(*args) in every worker (e.g. to switch weights) and wait for all of them.
+        On success the model state of the workers (weights paths, version, languages...) is mirrored on the
+        parent pipeline. If some workers fail, the others are switched back (weights switches only), otherwise
+        the pool is marked unhealthy.
+        """
+        rollback = ROLLBACK_ARGS.get(method)
+        rollback_args = rollback(self.tts.configs) if rollback is not None else None
+        results = self._call_workers(self.workers, method, args)
+        errors = [result for _, result in results if isinstance(result, Exception)]
+        if not errors:
+            apply_model_state(self.tts, results[0][1])
+            return
+        switched = [worker for worker, result in results if not isinstance(result, Exception)]
+        if switched:
+            rollback_errors = []
+            if rollback_args is not None:
+                rollback_results = self._call_workers(switched, method, rollback_args)
+                rollback_errors = [result for _, result in rollback_results if isinstance(result, Exception)]
+            if rollback_args is None or rollback_errors:
+                self.error = f"{method} failed on some workers, the workers run different models: {errors[0]}"
+                print(f"WorkerPool: {self.error}")
+        raise errors[0]
+
+    def _call_workers(self, workers: List[_WorkerHandle], method: str, args: tuple) -> list:
+        """
+        Returns [(worker, model state or Exception)] in the order of workers.
+        """
+        done = threading.Semaphore(0)
+        results = {}
+
+        def make_on_output(job: PoolJob):
+            def on_output(item):
+                if item is None or isinstance(item, Exception):
+                    results[job.job_id] = item if item is not None else job.result
+                    done.release()
+
+            return on_output
+
+        with self._lock:
+            jobs = []
+            for worker in workers:
+                job = PoolJob(next(self._job_ids), worker, None)
+                job.on_output = make_on_output(job)
+                worker.jobs[job.job_id] = job
+                jobs.append(job)
+        for job in jobs:
+            job.worker.send(("call", job.job_id, method, args))
+        for _ in jobs:
+            done.acquire()
+        return [(job.worker, results[job.job_id]) for job in jobs]
+
+    def stats(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "error": self.error,
+            "workers": [
+                {
+                    "index": w.index,
+                    "pid": w.process.pid,
+                    "alive": w.process.is_alive(),
+                    "cpus": w.cpus,
+                    "running": w.load,
+                }
+                for w in self.workers
+            ],
+        }
+
+    def _reader(self, worker: _WorkerHandle):
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, job_id = message[0], message[1]
+            if kind == "metrics":
+                REGISTRY.merge(message[2])
+                continue
+            if kind == "trace":
+                job = worker.jobs.get(job_id)
+                if job is not None and job.context is not None:
+                    job.context.trace_id, job.context.trace_skipped = message[2], message[3]
+                continue
+            receive_error = None
+            if kind == "chunk":
+                # 已取消的请求也要释放共享内存
+                try:
+                    audio = unpack_fragment(message[3])
+                except Exception as e:
+                    traceback.print_exc()
+                    receive_error = f"failed to receive audio from tts worker {worker.index}: {e}"
+            job: PoolJob = worker.jobs.get(job_id)
+            if job is None:
+                continue
+            if receive_error is not None:
+                # 停止工作进程中的推理, 其后续消息被忽略
+                job.cancel()
+                kind, message = "error", ("error", job_id, receive_error)
+            elif kind == "chunk":
+                job.on_output((message[2], audio))
+                continue
+            with self._lock:
+                worker.jobs.pop(job_id, None)
+            job.finished = True
+            if kind == "end":
+                job.result = message[2] if len(message) > 2 else None
+                if job.context is not None and isinstance(job.result, dict):
+                    # 阶段指标已随 metrics 消息合并, 这里只累加到请求的用时 (Server-Timing)
+                    for stage, seconds in job.result.get("timings", {}).items():
+                        job.context.timings[stage] = job.context.timings.get(stage, 0.0) + seconds
+            job.on_output(None if kind == "end" else RuntimeError(message[2]))
+        # 工作进程退出, 结束其上的所有请求
+        with self._lock:
+            jobs = list(worker.jobs.values())
+            worker.jobs.clear()
+        for job in jobs:
+            job.finished = True
+            job.on_output(RuntimeError(f"tts worker {worker.index} exited"))
+
+
+def _worker_main(index: int, tts, conn, cpus: List[int], worker_init: Callable = None, model_budget: int = 8 << 30):
+    if cpus:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        torch.set_num_threads(len(cpus))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    # fork 时继承的主进程指标不再发送, 只发送之后的变化
+    metrics_baseline = REGISTRY.snapshot()
+    if worker_init is not None:
+        worker_init()
+
+    jobs: queue.Queue = queue.Queue()
+    contexts: dict = {}
+    cancelled: set = set()
+    send_lock = threading.Lock()
+    registry = None
+
+    def send(message):
+        with send_lock:
+            conn.send(message)
+
+    def send_metrics():
+        nonlocal metrics_baseline
+        delta, metrics_baseline = REGISTRY.delta_since(metrics_baseline)
+        if delta:
+            send(("metrics", None, delta))
+
+    def reader():
+        # 单独的线程接收消息, 推理过程中也能收到取消
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                message = ("exit",)
+            if message[0] == "cancel":
+                context = contexts.get(message[1])
+                if context is not None:
+                    context.cancel()
+                else:
+                    cancelled.add(message[1])
+                continue
+            jobs.put(message)
+            if message[0] == "exit":
+                return
+
+    threading.Thread(target=reader, name="tts_worker_conn", daemon=True).start()
+
+    while True:
+        message = jobs.get()
+        if message[0] == "exit":
+            break
+        job_id = message[1]
+        result = None
+        try:
+            if message[0] == "call":
+                getattr(tts, message[2])(*message[3])
+                result = model_state(tts)
+            elif job_id in cancelled:
+                cancelled.discard(job_id)
+            else:
+                inputs = message[2]
+                pipeline = tts
+                if inputs.get("gpt_weights_path") or inputs.get("sovits_weights_path"):
+                    if registry is None:
+                        from TTS_infer_pack.model_registry import ModelRegistry
+
+                        registry = ModelRegistry(tts, max_bytes=model_budget)
+                    pipeline = registry.get(inputs.get("gpt_weights_path"), inputs.get("sovits_weights_path"))
+                context = RequestContext(inputs.get("parallel_infer", True))
+                contexts[job_id] = context
+                try:
+                    trace_sent = not inputs.get("profile", False)
+                    for sr, audio in pipeline.run(inputs, context):
+                        if context.is_cancelled():
+                            break
+                        if not trace_sent:
+                            # 在第一块音频之前发送, 流式响应的响应头要用到
+                            send(("trace", job_id, context.trace_id, context.trace_skipped))
+                            trace_sent = True
+                        send(("chunk", job_id, sr, pack_fragment(audio)))
+                finally:
+                    contexts.pop(job_id, None)
+                result = {"timings": dict(context.timings)}
+            send_metrics()
+            send(("end", job_id, result))
+        except Exception as e:
+            traceback.print_exc()
+            try:
+                send_metrics()
+                send(("error", job_id, str(e)))
+            except (OSError, EOFError):
+                break
@@ -0,0 +1,50 @@
+"""
+把 GPT(.ckpt) / SoVITS(.pth) 权重转换为可内存映射的 safetensors 格式, 版本和配置写入文件头.
+TTS/api 加载 .safetensors 权重时直接映射文件, 不复制张量, 切换模型只需几十毫秒, 多个进程共享页缓存.
+
+python GPT_SoVITS/convert_ckpt_safetensors.py -i GPT_weights_v2/xxx.ckpt SoVITS_weights_v2/xxx.pth
+python GPT_SoVITS/convert_ckpt_safetensors.py -i SoVITS_weights_v2/xxx.pth --dtype float32  # CPU 推理
+"""
+
+import argparse
+import os
+import sys
+import time
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+sys.path.append("%s/GPT_SoVITS" % (now_dir))
+
+import torch
+
+from process_ckpt import convert_to_safetensors, load_sovits_new
+
+dtypes = {"float16": torch.float16, "float32": torch.float32, "bfloat16": torch.bfloat16}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert GPT-SoVITS checkpoints to safetensors")
+    parser.add_argument("-i", "--inputs", type=str, nargs="+", required=True, help="待转换的 .ckpt/.pth 权重")
+    parser.add_argument("-o", "--output_dir", type=str, default="", help="输出目录, 默认与输入文件相同")
+    parser.add_argument(
+        "--dtype", type=str, default="", choices=["", *dtypes.keys()], help="浮点权重的精度, 默认保持不变"
+    )
+    args = parser.parse_args()
+
+    for src_path in args.inputs:
+        dst_path = os.path.splitext(src_path)[0] + ".safetensors"
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            dst_path = os.path.join(args.output_dir, os.path.basename(dst_path))
+        convert_to_safetensors(src_path, dst_path, dtypes.get(args.dtype))
+
+        t0 = time.perf_counter()
+        load_sovits_new(src_path)
+        t1 = time.perf_counter()
+        load_sovits_new(dst_path)
+        t2 = time.perf_counter()
+        print(f"{src_path} -> {dst_path} (load: {t1 - t0:.3f}s -> {t2 - t1:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ from AR.models.t2s_lightning_module import Text2SemanticLightningModule
 from module.models_onnx import SynthesizerTrn
 
 from inference_webui import get_phones_and_bert
+from text.phone_level_feature import build_phone_level_feature
 
 from sv import SV
 import kaldi as Kaldi
@@ -570,15 +571,8 @@ cnhubert_base_path = "GPT_SoVITS/pretrained_models/chinese-hubert-base"
 cnhubert.cnhubert_base_path = cnhubert_base_path
 
 
-@torch.jit.script
-def build_phone_level_feature(res: Tensor, word2ph: IntTensor):
-    phone_level_feature = []
-    for i in range(word2ph.shape[0]):
-        repeat_feature = res[i].repeat(word2ph[i].item(), 1)
-        phone_level_feature.append(repeat_feature)
-    phone_level_feature = torch.cat(phone_level_feature, dim=0)
-    # [sum(word2ph), 1024]
-    return phone_level_feature
+# [sum(word2ph), 1024], 与推理共用 repeat_interleave 实现
+build_phone_level_feature = torch.jit.script(build_phone_level_feature)
 
 
 class MyBertModel(torch.nn.Module):
@@ -1,9 +1,10 @@
 import argparse
+import asyncio
 import os
+import sys
 import soundfile as sf
 
 from tools.i18n.i18n import I18nAuto
-from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights, get_tts_wav
 
 i18n = I18nAuto()
 
@@ -18,6 +19,9 @@ def synthesize(
     target_language,
     output_path,
 ):
+    # 批量模式不需要加载 inference_webui 的模型
+    from GPT_SoVITS.inference_webui import change_gpt_weights, change_sovits_weights, get_tts_wav
+
     # Read reference text
     with open(ref_text_path, "r", encoding="utf-8") as file:
         ref_text = file.read()
@@ -50,26 +54,89 @@ def synthesize(
         print(f"Audio saved to {output_wav_path}")
 
 
+def synthesize_manifest(args):
+    """
+    Bulk mode: synthesize every item of a JSONL manifest (see TTS_infer_pack/bulk_jobs.py), resumable.
+    """
+    now_dir = os.getcwd()
+    for path in [now_dir, os.path.join(now_dir, "GPT_SoVITS")]:
+        if path not in sys.path:
+            sys.path.append(path)
+    from TTS_infer_pack.TTS import TTS, TTS_Config
+    from TTS_infer_pack.bulk_jobs import BulkJob, local_synthesizer, pool_synthesizer
+    from TTS_infer_pack.worker_pool import WorkerPool
+
+    job = BulkJob(args.manifest, args.progress, args.shard, args.num_shards)
+    print(f"{len(job.items)} items in shard {args.shard}/{args.num_shards}, {job.skipped} already done")
+    if len(job.pending) == 0:
+        return
+    tts_config = TTS_Config(args.tts_config)
+    if args.gpt_model:
+        tts_config.t2s_weights_path = args.gpt_model
+    if args.sovits_model:
+        tts_config.vits_weights_path = args.sovits_model
+    tts = TTS(tts_config)
+
+    pool = None
+    if args.workers > 1:
+        pool = WorkerPool(tts, args.workers)
+        pool.start()
+        synthesize_fn, concurrency = pool_synthesizer(pool), args.workers
+    else:
+        synthesize_fn, concurrency = local_synthesizer(tts), 1
+    try:
+        asyncio.run(job.run(synthesize_fn, concurrency))
+    finally:
+        if pool is not None:
+            pool.stop()
+    stats = job.stats()
+    print(
+        f"done: {stats['done']}, failed: {stats['failed']}, audio: {stats['audio_seconds'] / 3600:.2f}h "
+        f"in {stats['elapsed'] / 3600:.2f}h ({stats['throughput']:.2f} audio-hours per machine-hour)"
+    )
+    print(f"Progress saved to {job.progress_path}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="GPT-SoVITS Command Line Tool")
-    parser.add_argument("--gpt_model", required=True, help="Path to the GPT model file")
-    parser.add_argument("--sovits_model", required=True, help="Path to the SoVITS model file")
-    parser.add_argument("--ref_audio", required=True, help="Path to the reference audio file")
-    parser.add_argument("--ref_text", required=True, help="Path to the reference text file")
-    parser.add_argument(
-        "--ref_language", required=True, choices=["中文", "英文", "日文"], help="Language of the reference audio"
-    )
-    parser.add_argument("--target_text", required=True, help="Path to the target text file")
+    parser.add_argument("--gpt_model", help="Path to the GPT model file")
+    parser.add_argument("--sovits_model", help="Path to the SoVITS model file")
+    parser.add_argument("--ref_audio", help="Path to the reference audio file")
+    parser.add_argument("--ref_text", help="Path to the reference text file")
+    parser.add_argument("--ref_language", choices=["中文", "英文", "日文"], help="Language of the reference audio")
+    parser.add_argument("--target_text", help="Path to the target text file")
     parser.add_argument(
         "--target_language",
-        required=True,
         choices=["中文", "英文", "日文", "中英混合", "日英混合", "多语种混合"],
         help="Language of the target text",
     )
-    parser.add_argument("--output_path", required=True, help="Path to the output directory")
+    parser.add_argument("--output_path", help="Path to the output directory")
+    parser.add_argument("--manifest", help="JSONL manifest of a bulk job, replaces the single synthesis arguments")
+    parser.add_argument("--progress", help="Progress file of the bulk job, default: next to the manifest")
+    parser.add_argument("--shard", type=int, default=0, help="Shard of the manifest processed by this machine")
+    parser.add_argument("--num_shards", type=int, default=1, help="Number of shards the manifest is split into")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the bulk job (CPU only)")
+    parser.add_argument("--tts_config", default="GPT_SoVITS/configs/tts_infer.yaml", help="TTS config of the bulk job")
 
     args = parser.parse_args()
 
+    if args.manifest:
+        synthesize_manifest(args)
+        return
+    required = [
+        "gpt_model",
+        "sovits_model",
+        "ref_audio",
+        "ref_text",
+        "ref_language",
+        "target_text",
+        "target_language",
+        "output_path",
+    ]
+    missing = [name for name in required if getattr(args, name) is None]
+    if missing:
+        parser.error("the following arguments are required: " + ", ".join("--" + name for name in missing))
+
     synthesize(
         args.gpt_model,
         args.sovits_model,
@@ -122,6 +122,7 @@ from AR.models.t2s_lightning_module import Text2SemanticLightningModule
 from peft import LoraConfig, get_peft_model
 from text import cleaned_text_to_sequence
 from text.cleaner import clean_text
+from text.phone_level_feature import expand_to_phone_level, get_zero_feature
 
 from tools.assets import css, js, top_html
 from tools.i18n.i18n import I18nAuto, scan_language_list
@@ -176,11 +177,7 @@ def get_bert_feature(text, word2ph):
         res = bert_model(**inputs, output_hidden_states=True)
         res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
     assert len(word2ph) == len(text)
-    phone_level_feature = []
-    for i in range(len(word2ph)):
-        repeat_feature = res[i].repeat(word2ph[i], 1)
-        phone_level_feature.append(repeat_feature)
-    phone_level_feature = torch.cat(phone_level_feature, dim=0)
+    phone_level_feature = expand_to_phone_level(res, word2ph)
     return phone_level_feature.T
 
 
@@ -221,7 +218,7 @@ else:
 
 ###todo:put them to process_ckpt and modify my_save func (save sovits weights), gpt save weights use my_save in process_ckpt
 # symbol_version-model_version-if_lora_v3
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import get_sovits_version_from_path_fast, load_gpt_new, load_sovits_new
 
 v3v4set = {"v3", "v4"}
 
@@ -378,7 +375,7 @@ def change_gpt_weights(gpt_path):
         gpt_path = name2gpt_path[gpt_path]
     global hz, max_sec, t2s_model, config
     hz = 50
-    dict_s1 = torch.load(gpt_path, map_location="cpu", weights_only=False)
+    dict_s1 = load_gpt_new(gpt_path)
     config = dict_s1["config"]
     max_sec = config["data"]["max_sec"]
     t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
@@ -564,10 +561,7 @@ def get_bert_inf(phones, word2ph, norm_text, language):
     if language == "zh":
         bert = get_bert_feature(norm_text, word2ph).to(device)  # .to(dtype)
     else:
-        bert = torch.zeros(
-            (1024, len(phones)),
-            dtype=torch.float16 if is_half == True else torch.float32,
-        ).to(device)
+        bert = get_zero_feature(len(phones), dtype=torch.float16 if is_half == True else torch.float32, device=device)
 
     return bert
 
@@ -18,6 +18,7 @@ version = os.environ.get("version", None)
 import traceback
 import os.path
 from text.cleaner import clean_text
+from text.phone_level_feature import expand_to_phone_level
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from tools.my_utils import clean_path
 
@@ -74,12 +75,7 @@ if os.path.exists(txt_path) == False:
             res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
 
         assert len(word2ph) == len(text)
-        phone_level_feature = []
-        for i in range(len(word2ph)):
-            repeat_feature = res[i].repeat(word2ph[i], 1)
-            phone_level_feature.append(repeat_feature)
-
-        phone_level_feature = torch.cat(phone_level_feature, dim=0)
+        phone_level_feature = expand_to_phone_level(res, word2ph)
 
         return phone_level_feature.T
 
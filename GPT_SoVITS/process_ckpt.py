@@ -1,8 +1,16 @@
 import traceback
 from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from time import time as ttime
+import inspect
+import json
+import math
+import mmap
 import shutil
 import os
+import struct
+import threading
 import torch
 from tools.i18n.i18n import I18nAuto
 
@@ -98,6 +106,10 @@ def get_hash_from_file(sovits_path):
 
 
 def get_sovits_version_from_path_fast(sovits_path):
+    ###0-safetensors weights, by header metadata
+    if is_safetensors(sovits_path):
+        metadata = read_safetensors_metadata(sovits_path)
+        return [metadata["version"], metadata["model_version"], metadata.get("if_lora_v3") == "true"]
     ###1-if it is pretrained sovits models, by hash
     hash = get_hash_from_file(sovits_path)
     if hash in hash_pretrained_dict:
@@ -127,6 +139,8 @@ def get_sovits_version_from_path_fast(sovits_path):
 
 
 def load_sovits_new(sovits_path):
+    if is_safetensors(sovits_path):
+        return load_safetensors_ckpt(sovits_path)
     f = open(sovits_path, "rb")
     meta = f.read(2)
     if meta != b"PK":
@@ -136,3 +150,243 @@ def load_sovits_new(sovits_path):
         bio.seek(0)
         return torch.load(bio, map_location="cpu", weights_only=False)
     return torch.load(sovits_path, map_location="cpu", weights_only=False)
+
+
+def load_gpt_new(gpt_path):
+    if is_safetensors(gpt_path):
+        return load_safetensors_ckpt(gpt_path)
+    return torch.load(gpt_path, map_location="cpu", weights_only=False)
+
+
+"""
+safetensors 权重格式:
+    张量为 state dict, 头部 __metadata__ 保存 format="gpt-sovits", kind="gpt"/"sovits", config(json), info,
+    以及 sovits 的 version/model_version/if_lora_v3/lora_rank.
+    加载时直接内存映射文件, 张量不复制, 同一主机上的多个进程共享页缓存.
+"""
+SAFETENSORS_FORMAT = "gpt-sovits"
+safetensors_dtypes = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def is_safetensors(path):
+    return str(path).endswith(".safetensors")
+
+
+def _read_safetensors_header(path):
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+    return header, 8 + header_len
+
+
+def read_safetensors_metadata(path):
+    header, _ = _read_safetensors_header(path)
+    metadata = header.get("__metadata__") or {}
+    if metadata.get("format") != SAFETENSORS_FORMAT:
+        raise ValueError("%s is not a GPT-SoVITS safetensors checkpoint" % path)
+    return metadata
+
+
+def load_safetensors_ckpt(path):
+    """
+    Memory-map a GPT-SoVITS safetensors checkpoint.
+    Returns the same dict as the .pth/.ckpt files ("weight", "config", "info", "lora_rank"),
+    the tensors are read-only-by-convention views of the mapping (copy-on-write), nothing is read until used.
+    """
+    header, data_start = _read_safetensors_header(path)
+    metadata = header.pop("__metadata__", None) or {}
+    if metadata.get("format") != SAFETENSORS_FORMAT:
+        raise ValueError("%s is not a GPT-SoVITS safetensors checkpoint" % path)
+    with open(path, "rb") as f:
+        # ACCESS_COPY: 可写的私有映射, 未修改的页仍与其他进程共享
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    weight = OrderedDict()
+    for name, info in header.items():
+        dtype = safetensors_dtypes[info["dtype"]]
+        shape = info["shape"]
+        begin, end = info["data_offsets"]
+        if end == begin:
+            weight[name] = torch.empty(shape, dtype=dtype)
+            continue
+        weight[name] = torch.frombuffer(buffer, dtype=dtype, count=math.prod(shape), offset=data_start + begin).view(
+            shape
+        )
+    ckpt = {"weight": weight, "config": json.loads(metadata["config"]), "info": metadata.get("info", "")}
+    if "lora_rank" in metadata:
+        ckpt["lora_rank"] = int(metadata["lora_rank"])
+    return ckpt
+
+
+def _to_plain_dict(obj):
+    # HParams -> dict, 以便写入 json
+    if hasattr(obj, "items") and not isinstance(obj, (str, bytes)):
+        return {k: _to_plain_dict(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_plain_dict(v) for v in obj]
+    return obj
+
+
+def convert_to_safetensors(src_path, dst_path=None, dtype=None):
+    """
+    Convert a GPT (.ckpt) or SoVITS (.pth) checkpoint to the memory-mappable safetensors format.
+    dtype: torch.dtype of the floating point weights, e.g. torch.float32 for CPU inference so the
+        weights can be used without conversion, None keeps the checkpoint dtype.
+    Returns the output path.
+    """
+    from safetensors.torch import save_file
+
+    if dst_path is None:
+        dst_path = os.path.splitext(src_path)[0] + ".safetensors"
+    ckpt = load_sovits_new(src_path)
+    weight = ckpt["weight"]
+    if any(key.startswith("enc_p.") or key.startswith("dec.") for key in weight.keys()):
+        kind = "sovits"
+    else:
+        kind = "gpt"
+    metadata = {
+        "format": SAFETENSORS_FORMAT,
+        "kind": kind,
+        "config": json.dumps(_to_plain_dict(ckpt["config"]), ensure_ascii=False),
+        "info": str(ckpt.get("info", "")),
+    }
+    if kind == "sovits":
+        version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(src_path)
+        metadata["version"] = version
+        metadata["model_version"] = model_version
+        metadata["if_lora_v3"] = "true" if if_lora_v3 else "false"
+    if "lora_rank" in ckpt:
+        metadata["lora_rank"] = str(ckpt["lora_rank"])
+    # safetensors 不允许共享存储的张量
+    tensors = {}
+    for key, value in weight.items():
+        value = value.detach()
+        if dtype is not None and value.is_floating_point():
+            value = value.to(dtype)
+        tensors[key] = value.contiguous().clone()
+    save_file(tensors, dst_path, metadata=metadata)
+    return dst_path
+
+
+_random_init_names = [
+    "uniform_",
+    "normal_",
+    "trunc_normal_",
+    "xavier_uniform_",
+    "xavier_normal_",
+    "kaiming_uniform_",
+    "kaiming_normal_",
+    "orthogonal_",
+]
+
+
+# torch<2.1 没有 load_state_dict(assign=True), 只能复制权重, 此时不跳过随机初始化
+ASSIGN_SUPPORTED = "assign" in inspect.signature(torch.nn.Module.load_state_dict).parameters
+# 跳过随机初始化只作用于当前线程, 可嵌套
+_skip_init = threading.local()
+_init_patch_lock = threading.Lock()
+_init_patched = False
+
+
+def _skippable(func):
+    @wraps(func)
+    def wrapper(tensor, *args, **kwargs):
+        if getattr(_skip_init, "depth", 0) > 0:
+            return tensor
+        return func(tensor, *args, **kwargs)
+
+    return wrapper
+
+
+def _patch_random_init():
+    global _init_patched
+    with _init_patch_lock:
+        if _init_patched:
+            return
+        for name in _random_init_names:
+            setattr(torch.nn.init, name, _skippable(getattr(torch.nn.init, name)))
+        _init_patched = True
+
+
+@contextmanager
+def skip_random_init():
+    """
+    Build modules without their random weight initialisation, for modules whose weights are loaded right after
+    with load_state_dict_assign. Only affects the calling thread; a no-op when assign is not supported.
+    """
+    if not ASSIGN_SUPPORTED:
+        yield
+        return
+    _patch_random_init()
+    _skip_init.depth = getattr(_skip_init, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _skip_init.depth -= 1
+
+
+def _init_missing_parameters(module, missing_keys):
+    """
+    Give the parameters missing from the checkpoint their normal random initialisation (reset_parameters of the
+    owning layer), the tensors taken from the checkpoint are swapped out meanwhile so they are never written.
+    """
+    owners = OrderedDict()
+    for key in missing_keys:
+        prefix, _, name = key.rpartition(".")
+        owner = module.get_submodule(prefix) if prefix else module
+        if name in owner._parameters:
+            owners.setdefault(prefix, (owner, []))[1].append(name)
+    for prefix, (owner, names) in owners.items():
+        if not hasattr(owner, "reset_parameters"):
+            with torch.no_grad():
+                for name in names:
+                    owner._parameters[name].zero_()
+            print(f"{prefix or type(module).__name__}: no reset_parameters, zeroed the missing {names}")
+            continue
+        saved = {}
+        for tensors in [owner._parameters, owner._buffers]:
+            for name, tensor in tensors.items():
+                if tensor is not None and name not in names:
+                    saved[name] = (tensors, tensor)
+                    tensors[name] = (
+                        torch.nn.Parameter(torch.empty_like(tensor), tensor.requires_grad)
+                        if isinstance(tensor, torch.nn.Parameter)
+                        else torch.empty_like(tensor)
+                    )
+        with torch.no_grad():
+            owner.reset_parameters()
+        for name, (tensors, tensor) in saved.items():
+            tensors[name] = tensor
+
+
+def load_state_dict_assign(module, state_dict, strict=True):
+    """
+    load_state_dict that assigns the checkpoint tensors to the module instead of copying them
+    (torch>=2.1), so memory-mapped weights stay shared. Tensors whose dtype differs from the module
+    are converted first. Parameters missing from the checkpoint get their normal random initialisation,
+    as modules are built under skip_random_init; missing keys outside enc_q (not used for inference) are printed.
+    """
+    if not ASSIGN_SUPPORTED:
+        return module.load_state_dict(state_dict, strict=strict)
+    own = module.state_dict(keep_vars=True)
+    state_dict = OrderedDict(
+        (key, value.to(own[key].dtype) if key in own and value.dtype != own[key].dtype else value)
+        for key, value in state_dict.items()
+    )
+    result = module.load_state_dict(state_dict, strict=strict, assign=True)
+    if result.missing_keys:
+        _init_missing_parameters(module, result.missing_keys)
+        missing = [key for key in result.missing_keys if not key.startswith("enc_q.")]
+        if missing:
+            print(f"{type(module).__name__}: keys missing from the checkpoint, randomly initialised: {missing}")
+    return result
@@ -14,46 +14,55 @@ fast_langdetect.infer._default_detector = fast_langdetect.infer.LangDetector(fas
 from split_lang import LangSplitter
 
 
+_full_en_pattern = re.compile(r"^(?=.*[A-Za-z])[A-Za-z0-9\s\u0020-\u007E\u2000-\u206F\u3000-\u303F\uFF00-\uFFEF]+$")
+
+# 来自wiki
+_cjk_ranges = (
+    "\u4e00-\u9fff"  # CJK Unified Ideographs
+    "\u3400-\u4db5"  # CJK Extension A
+    "\U00020000-\U0002a6dd"  # CJK Extension B
+    "\U0002a700-\U0002b73f"  # CJK Extension C
+    "\U0002b740-\U0002b81f"  # CJK Extension D
+    "\U0002b820-\U0002ceaf"  # CJK Extension E
+    "\U0002ceb0-\U0002ebef"  # CJK Extension F
+    "\U00030000-\U0003134a"  # CJK Extension G
+    "\U00031350-\U000323af"  # CJK Extension H
+    "\U0002ebf0-\U0002ee5d"  # CJK Extension H
+)
+_full_cjk_char_pattern = re.compile("[" + _cjk_ranges + "0-9、-〜。！？.!?… /]")
+
+# 快速路径: 纯汉字(可夹数字/标点/空白)的文本, 不含假名、谚文和拉丁字母
+_han_only_pattern = re.compile(
+    "^(?=.*["
+    + _cjk_ranges
+    + "])["
+    + _cjk_ranges
+    + "0-9\\s\u0021-\u002f\u003a-\u0040\u005b-\u0060\u007b-\u007e"
+    + "\u2000-\u206f\u3000-\u303f\uff01-\uff20\uff3b-\uff40\uff5b-\uff65]+$"
+)
+
+_ja_pattern = re.compile(
+    r"([\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]+(?:[0-9、-〜。！？.!?… ]+[\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]*)*)"
+)
+_ko_pattern = re.compile(
+    r"([\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]+(?:[0-9、-〜。！？.!?… ]+[\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]*)*)"
+)
+
+
 def full_en(text):
-    pattern = r'^(?=.*[A-Za-z])[A-Za-z0-9\s\u0020-\u007E\u2000-\u206F\u3000-\u303F\uFF00-\uFFEF]+$'
-    return bool(re.match(pattern, text))
+    return bool(_full_en_pattern.match(text))
 
 
 def full_cjk(text):
-    # 来自wiki
-    cjk_ranges = [
-        (0x4E00, 0x9FFF),        # CJK Unified Ideographs
-        (0x3400, 0x4DB5),        # CJK Extension A
-        (0x20000, 0x2A6DD),      # CJK Extension B
-        (0x2A700, 0x2B73F),      # CJK Extension C
-        (0x2B740, 0x2B81F),      # CJK Extension D
-        (0x2B820, 0x2CEAF),      # CJK Extension E
-        (0x2CEB0, 0x2EBEF),      # CJK Extension F
-        (0x30000, 0x3134A),      # CJK Extension G
-        (0x31350, 0x323AF),      # CJK Extension H
-        (0x2EBF0, 0x2EE5D),      # CJK Extension H
-    ]
-
-    pattern = r'[0-9、-〜。！？.!?… /]+$'
-
-    cjk_text = ""
-    for char in text:
-        code_point = ord(char)
-        in_cjk = any(start <= code_point <= end for start, end in cjk_ranges)
-        if in_cjk or re.match(pattern, char):
-            cjk_text += char
-    return cjk_text
+    return "".join(_full_cjk_char_pattern.findall(text))
 
 
 def split_jako(tag_lang,item):
-    if tag_lang == "ja":
-        pattern = r"([\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]+(?:[0-9、-〜。！？.!?… ]+[\u3041-\u3096\u3099\u309A\u30A1-\u30FA\u30FC]*)*)"
-    else:
-        pattern = r"([\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]+(?:[0-9、-〜。！？.!?… ]+[\u1100-\u11FF\u3130-\u318F\uAC00-\uD7AF]*)*)"
+    pattern = _ja_pattern if tag_lang == "ja" else _ko_pattern
 
     lang_list: list[dict] = []
     tag = 0
-    for match in re.finditer(pattern, item['text']):
+    for match in pattern.finditer(item['text']):
         if match.start() > tag:
             lang_list.append({'lang':item['lang'],'text':item['text'][tag:match.start()]})
 
@@ -87,10 +96,41 @@ class LangSegmenter():
         "en": "en",
     }
 
+    _lang_splitter = None
+
+    @staticmethod
+    def get_splitter():
+        # LangSplitter 构建开销较大, 全局复用同一个实例
+        if LangSegmenter._lang_splitter is None:
+            lang_splitter = LangSplitter(lang_map=LangSegmenter.DEFAULT_LANG_MAP)
+            lang_splitter.merge_across_digit = False
+            LangSegmenter._lang_splitter = lang_splitter
+        return LangSegmenter._lang_splitter
+
+    @staticmethod
+    def fast_path(text, default_lang=""):
+        """
+        Single-script shortcut that skips language identification.
+        Returns the segment list for pure-Han text when default_lang is given and,
+        when no default_lang is given, for pure-ASCII English text; otherwise None.
+        Pure-Han text without default_lang still goes through LangSplitter, which
+        may tag kanji-only Japanese as ja.
+        """
+        if not text:
+            return None
+        if default_lang != "" and _han_only_pattern.match(text):
+            return [{"lang": default_lang, "text": text}]
+        if default_lang == "" and text.isascii() and full_en(text):
+            return [{"lang": "en", "text": text}]
+        return None
+
+    @staticmethod
     def getTexts(text,default_lang = ""):
-        lang_splitter = LangSplitter(lang_map=LangSegmenter.DEFAULT_LANG_MAP)
-        lang_splitter.merge_across_digit = False
-        substr = lang_splitter.split_by_lang(text=text)
+        fast_result = LangSegmenter.fast_path(text, default_lang)
+        if fast_result is not None:
+            return fast_result
+
+        substr = LangSegmenter.get_splitter().split_by_lang(text=text)
 
         lang_list: list[dict] = []
 
@@ -31,12 +31,22 @@ if is_g2pw:
     from text.g2pw import G2PWPinyin, correct_pronunciation
 
     parent_directory = os.path.dirname(current_file_path)
-    g2pw = G2PWPinyin(
-        model_dir="GPT_SoVITS/text/G2PWModel",
-        model_source=os.environ.get("bert_path", "GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large"),
-        v_to_u=False,
-        neutral_tone_with_five=True,
-    )
+
+# G2PW 的 ONNX 会话和分词器加载较慢, 首次使用时再创建
+g2pw = None
+
+
+def get_g2pw():
+    global g2pw
+    if g2pw is None:
+        g2pw = G2PWPinyin(
+            model_dir="GPT_SoVITS/text/G2PWModel",
+            model_source=os.environ.get("bert_path", "GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large"),
+            v_to_u=False,
+            neutral_tone_with_five=True,
+        )
+    return g2pw
+
 
 rep_map = {
     "：": ",",
@@ -58,21 +68,30 @@ rep_map = {
 
 tone_modifier = ToneSandhi()
 
+# 正则在模块加载时编译一次, 避免每句话都重新拼接和编译
+# "嗯"/"呣" 与标点映射互不重叠, 并入同一次替换
+_punctuation_rep_map = {"嗯": "恩", "呣": "母", **rep_map}
+_punctuation_pattern = re.compile("|".join(re.escape(p) for p in _punctuation_rep_map.keys()))
+_non_zh_pattern = re.compile(r"[^\u4e00-\u9fa5" + "".join(punctuation) + r"]+")
+_non_zh_en_pattern = re.compile(r"[^\u4e00-\u9fa5A-Za-z" + "".join(punctuation) + r"]+")
+_sentence_split_pattern = re.compile(r"(?<=[{0}])\s*".format("".join(punctuation)))
+_en_word_pattern = re.compile("[a-zA-Z]+")
+_punctuations = "".join(re.escape(p) for p in punctuation)
+_consecutive_punctuation_pattern = re.compile(f"([{_punctuations}])([{_punctuations}])+")
+
+text_normalizer = TextNormalizer()
 
-def replace_punctuation(text):
-    text = text.replace("嗯", "恩").replace("呣", "母")
-    pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
 
-    replaced_text = pattern.sub(lambda x: rep_map[x.group()], text)
+def replace_punctuation(text):
+    replaced_text = _punctuation_pattern.sub(lambda x: _punctuation_rep_map[x.group()], text)
 
-    replaced_text = re.sub(r"[^\u4e00-\u9fa5" + "".join(punctuation) + r"]+", "", replaced_text)
+    replaced_text = _non_zh_pattern.sub("", replaced_text)
 
     return replaced_text
 
 
 def g2p(text):
-    pattern = r"(?<=[{0}])\s*".format("".join(punctuation))
-    sentences = [i for i in re.split(pattern, text) if i.strip() != ""]
+    sentences = [i for i in _sentence_split_pattern.split(text) if i.strip() != ""]
     phones, word2ph = _g2p(sentences)
     return phones, word2ph
 
@@ -183,7 +202,7 @@ def _g2p(segments):
     for seg in segments:
         pinyins = []
         # Replace all English words in the sentence
-        seg = re.sub("[a-zA-Z]+", "", seg)
+        seg = _en_word_pattern.sub("", seg)
         seg_cut = psg.lcut(seg)
         seg_cut = tone_modifier.pre_merge_for_modify(seg_cut)
         initials = []
@@ -205,7 +224,7 @@ def _g2p(segments):
             print("pypinyin结果", initials, finals)
         else:
             # g2pw采用整句推理
-            pinyins = g2pw.lazy_pinyin(seg, neutral_tone_with_five=True, style=Style.TONE3)
+            pinyins = get_g2pw().lazy_pinyin(seg, neutral_tone_with_five=True, style=Style.TONE3)
 
             pre_word_length = 0
             for word, pos in seg_cut:
@@ -296,27 +315,21 @@ def _g2p(segments):
 
 
 def replace_punctuation_with_en(text):
-    text = text.replace("嗯", "恩").replace("呣", "母")
-    pattern = re.compile("|".join(re.escape(p) for p in rep_map.keys()))
-
-    replaced_text = pattern.sub(lambda x: rep_map[x.group()], text)
+    replaced_text = _punctuation_pattern.sub(lambda x: _punctuation_rep_map[x.group()], text)
 
-    replaced_text = re.sub(r"[^\u4e00-\u9fa5A-Za-z" + "".join(punctuation) + r"]+", "", replaced_text)
+    replaced_text = _non_zh_en_pattern.sub("", replaced_text)
 
     return replaced_text
 
 
 def replace_consecutive_punctuation(text):
-    punctuations = "".join(re.escape(p) for p in punctuation)
-    pattern = f"([{punctuations}])([{punctuations}])+"
-    result = re.sub(pattern, r"\1", text)
+    result = _consecutive_punctuation_pattern.sub(r"\1", text)
     return result
 
 
 def text_normalize(text):
     # https://github.com/PaddlePaddle/PaddleSpeech/tree/develop/paddlespeech/t2s/frontend/zh_normalization
-    tx = TextNormalizer()
-    sentences = tx.normalize(text)
+    sentences = text_normalizer.normalize(text)
     dest_text = ""
     for sentence in sentences:
         dest_text += replace_punctuation(sentence)
@@ -1,5 +1,7 @@
 from text import cleaned_text_to_sequence
+import importlib
 import os
+import time
 # if os.environ.get("version","v1")=="v1":
 #     from text import chinese
 #     from text.symbols import symbols
@@ -17,16 +19,81 @@ special = [
     # ('@', 'zh', "SP4")#不搞鬼畜了，和第二版保持一致吧
 ]
 
+language_module_map_v1 = {"zh": "chinese", "ja": "japanese", "en": "english"}
+language_module_map_v2 = {"zh": "chinese2", "ja": "japanese", "en": "english", "ko": "korean", "yue": "cantonese"}
+
+# 各语种前端模块在首次使用时才导入, 仅部署单一语种时不必加载其余语种的模型
+_language_modules = {}
+import_timings = {}
+
+warmup_texts = {
+    "zh": "你好，欢迎使用语音合成。",
+    "yue": "你好，欢迎使用语音合成。",
+    "en": "Hello, welcome to text to speech.",
+    "ja": "こんにちは、音声合成へようこそ。",
+    "ko": "안녕하세요, 음성 합성에 오신 것을 환영합니다.",
+}
+
+
+def get_language_module_map(version=None):
+    if version is None:
+        version = os.environ.get("version", "v2")
+    return language_module_map_v1 if version == "v1" else language_module_map_v2
+
+
+def get_language_module(language, version=None):
+    module_name = get_language_module_map(version)[language]
+    module = _language_modules.get(module_name, None)
+    if module is None:
+        t0 = time.perf_counter()
+        module = importlib.import_module("text." + module_name)
+        import_timings[module_name] = time.perf_counter() - t0
+        _language_modules[module_name] = module
+        print(f"Loaded text frontend text.{module_name} in {import_timings[module_name]:.3f}s")
+    return module
+
+
+def warmup(languages=None, version=None):
+    """
+    Import the language frontends and build their lazily created models (g2pw, g2p_en, g2pk2 ...)
+    by running a short sentence through each of them.
+    Args:
+        languages: list of language codes, e.g. ["zh", "en"]; None means every language of the version.
+        version: model version, decides which frontend modules are used.
+    Returns:
+        dict: warm-up time in seconds for each language.
+    """
+    module_map = get_language_module_map(version)
+    if languages is None:
+        languages = list(module_map.keys())
+    timings = {}
+    for language in languages:
+        language = language.replace("all_", "").lower()
+        if language in timings:
+            continue
+        if language not in module_map:
+            print(f"Skip warm-up of unsupported language: {language}")
+            continue
+        t0 = time.perf_counter()
+        clean_text(warmup_texts[language], language, version)
+        timings[language] = time.perf_counter() - t0
+        print(f"Warmed up {language} text frontend in {timings[language]:.3f}s")
+    return timings
+
+
+def print_import_timings():
+    string = "Text Frontend Import Timings".center(60, "-") + "\n"
+    for module_name, cost in sorted(import_timings.items(), key=lambda x: -x[1]):
+        string += f"{('text.' + module_name).ljust(30)}: {cost:.3f}s\n"
+    string += "-" * 60
+    print(string)
+
 
 def clean_text(text, language, version=None):
     if version is None:
         version = os.environ.get("version", "v2")
-    if version == "v1":
-        symbols = symbols_v1.symbols
-        language_module_map = {"zh": "chinese", "ja": "japanese", "en": "english"}
-    else:
-        symbols = symbols_v2.symbols
-        language_module_map = {"zh": "chinese2", "ja": "japanese", "en": "english", "ko": "korean", "yue": "cantonese"}
+    symbols = symbols_v1.symbols if version == "v1" else symbols_v2.symbols
+    language_module_map = get_language_module_map(version)
 
     if language not in language_module_map:
         language = "en"
@@ -34,7 +101,7 @@ def clean_text(text, language, version=None):
     for special_s, special_l, target_symbol in special:
         if special_s in text and language == special_l:
             return clean_special(text, language, special_s, target_symbol, version)
-    language_module = __import__("text." + language_module_map[language], fromlist=[language_module_map[language]])
+    language_module = get_language_module(language, version)
     if hasattr(language_module, "text_normalize"):
         norm_text = language_module.text_normalize(text)
     else:
@@ -58,18 +125,13 @@ def clean_text(text, language, version=None):
 def clean_special(text, language, special_s, target_symbol, version=None):
     if version is None:
         version = os.environ.get("version", "v2")
-    if version == "v1":
-        symbols = symbols_v1.symbols
-        language_module_map = {"zh": "chinese", "ja": "japanese", "en": "english"}
-    else:
-        symbols = symbols_v2.symbols
-        language_module_map = {"zh": "chinese2", "ja": "japanese", "en": "english", "ko": "korean", "yue": "cantonese"}
+    symbols = symbols_v1.symbols if version == "v1" else symbols_v2.symbols
 
     """
     特殊静音段sp符号处理
     """
     text = text.replace(special_s, ",")
-    language_module = __import__("text." + language_module_map[language], fromlist=[language_module_map[language]])
+    language_module = get_language_module(language, version)
     norm_text = language_module.text_normalize(text)
     phones = language_module.g2p(norm_text)
     new_ph = []
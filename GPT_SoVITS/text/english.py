@@ -357,12 +357,20 @@ class en_G2p(G2p):
         return [phone for comp in comps for phone in self.qryword(comp)]
 
 
-_g2p = en_G2p()
+# en_G2p 需要加载 NLTK 标注器和词典, 首次使用时再创建
+_g2p = None
+
+
+def get_g2p():
+    global _g2p
+    if _g2p is None:
+        _g2p = en_G2p()
+    return _g2p
 
 
 def g2p(text):
     # g2p_en 整段推理，剔除不存在的arpa返回
-    phone_list = _g2p(text)
+    phone_list = get_g2p()(text)
     phones = [ph if ph != "<unk>" else "UNK" for ph in phone_list if ph not in [" ", "<pad>", "UW", "</s>", "<s>"]]
 
     return replace_phs(phones)
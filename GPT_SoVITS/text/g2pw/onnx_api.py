@@ -213,7 +213,8 @@ class G2PWOnnxConverter:
             window_size=None,
         )
 
-        preds, confidences = predict(session=self.session_g2pW, onnx_input=onnx_input, labels=self.labels)
+        with torch.profiler.record_function("g2pw"):
+            preds, confidences = predict(session=self.session_g2pW, onnx_input=onnx_input, labels=self.labels)
         if self.config.use_char_phoneme:
             preds = [pred.split(" ")[1] for pred in preds]
 
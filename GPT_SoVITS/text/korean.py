@@ -286,13 +286,21 @@ def korean_to_lazy_ipa(text):
     return text
 
 
-_g2p = G2p()
+# g2pk2 需要初始化 mecab, 首次使用时再创建
+_g2p = None
+
+
+def get_g2p():
+    global _g2p
+    if _g2p is None:
+        _g2p = G2p()
+    return _g2p
 
 
 def korean_to_ipa(text):
     text = latin_to_hangul(text)
     text = number_to_hangul(text)
-    text = _g2p(text)
+    text = get_g2p()(text)
     text = fix_g2pk2_error(text)
     text = korean_to_lazy_ipa(text)
     return text.replace("ʧ", "tʃ").replace("ʥ", "dʑ")
@@ -323,7 +331,7 @@ def post_replace_ph(ph):
 
 def g2p(text):
     text = latin_to_hangul(text)
-    text = _g2p(text)
+    text = get_g2p()(text)
     text = divide_hangul(text)
     text = fix_g2pk2_error(text)
     text = re.sub(r"([\u3131-\u3163])$", r"\1.", text)
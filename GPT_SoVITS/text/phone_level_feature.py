@@ -0,0 +1,59 @@
+from typing import Dict, List, Tuple, Union
+
+import torch
+from torch import Tensor
+
+# (dtype, device) -> [1024, 1] 的全零特征, 非中文片段广播成 [1024, len(phones)], 不再逐段分配
+_zero_feature_cache: Dict[Tuple[torch.dtype, str, int], Tensor] = {}
+
+
+def build_phone_level_index(word2ph: Tensor) -> Tensor:
+    """
+    Index that maps every phone to the character it belongs to, e.g. word2ph [1, 2, 2] -> [0, 1, 1, 2, 2].
+    Args:
+        word2ph: [n_chars] int tensor, number of phones of each character.
+    Returns:
+        [sum(word2ph)] long tensor.
+    """
+    word2ph = word2ph.long()
+    return torch.repeat_interleave(torch.arange(word2ph.shape[0], device=word2ph.device), word2ph)
+
+
+def build_phone_level_feature(res: Tensor, word2ph: Tensor) -> Tensor:
+    """
+    Expand character level features to phone level, TorchScript compatible.
+    Args:
+        res: [n_chars, C] character level features.
+        word2ph: [n_chars] int tensor, number of phones of each character.
+    Returns:
+        [sum(word2ph), C] phone level features.
+    """
+    index = build_phone_level_index(word2ph).to(res.device)
+    return res.index_select(0, index)
+
+
+def expand_to_phone_level(res: Tensor, word2ph: Union[List[int], Tensor]) -> Tensor:
+    """
+    Same as build_phone_level_feature, but word2ph can also be the list returned by clean_text.
+    """
+    if not isinstance(word2ph, Tensor):
+        word2ph = torch.tensor(word2ph, dtype=torch.long)
+    return build_phone_level_feature(res, word2ph)
+
+
+def get_zero_feature(n_phones: int, dtype: torch.dtype = torch.float32, device="cpu", dim: int = 1024) -> Tensor:
+    """
+    Zero bert features for non-Chinese segments.
+    The result is a broadcast (read-only) view of a cached [dim, 1] buffer, callers concatenate or copy it before writing.
+    Args:
+        n_phones: number of phones of the segment.
+    Returns:
+        [dim, n_phones] tensor.
+    """
+    device = torch.device(device)
+    key = (dtype, str(device), dim)
+    zero = _zero_feature_cache.get(key)
+    if zero is None:
+        zero = torch.zeros((dim, 1), dtype=dtype, device=device)
+        _zero_feature_cache[key] = zero
+    return zero.expand(dim, n_phones)
@@ -56,8 +56,10 @@ def replace_temperature(match) -> str:
     return result
 
 
+# 按 measure_dict 的顺序组成一个分支表达式, 一次扫描完成替换
+# (替换结果均为汉字, 不会与后续单位重新组合, 因此与逐个 replace 的结果一致)
+RE_MEASURE = re.compile("|".join(re.escape(q_notation) for q_notation in measure_dict))
+
+
 def replace_measure(sentence) -> str:
-    for q_notation in measure_dict:
-        if q_notation in sentence:
-            sentence = sentence.replace(q_notation, measure_dict[q_notation])
-    return sentence
+    return RE_MEASURE.sub(lambda match: measure_dict[match.group(0)], sentence)
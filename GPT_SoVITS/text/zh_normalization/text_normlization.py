@@ -24,7 +24,6 @@ from .chronology import replace_date2
 from .chronology import replace_time
 from .constants import F2H_ASCII_LETTERS
 from .constants import F2H_DIGITS
-from .constants import F2H_SPACE
 from .num import RE_VERSION_NUM
 from .num import RE_DECIMAL_NUM
 from .num import RE_DEFAULT_NUM
@@ -57,10 +56,77 @@ from .quantifier import RE_TEMPERATURE
 from .quantifier import replace_measure
 from .quantifier import replace_temperature
 
+RE_SENTENCE_SPLITOR = re.compile(r"([：、，；。？！,;?!][”’]?)")
+RE_LINE_BREAKS = re.compile(r"\n+")
+RE_SPECIAL_CHARS = re.compile(r"[——《》【】<>{}()（）#&@“”^_|\\]")
+RE_POST_SPECIAL_CHARS = re.compile(r"[-——《》【】<=>{}()（）#&@“”^_|\\]")
+RE_DIGIT = re.compile(r"\d")
+
+# 全角英文字母和数字转半角 (全角空格的映射键为字符串, str.translate 不会使用, 因此不并入)
+F2H_TABLE = {**F2H_ASCII_LETTERS, **F2H_DIGITS}
+
+# _post_replace 中的单字符替换, 替换结果不含任何待替换字符, 合并为一次 str.translate
+POST_REPLACE_TABLE = str.maketrans(
+    {
+        "/": "每",
+        "①": "一",
+        "②": "二",
+        "③": "三",
+        "④": "四",
+        "⑤": "五",
+        "⑥": "六",
+        "⑦": "七",
+        "⑧": "八",
+        "⑨": "九",
+        "⑩": "十",
+        "α": "阿尔法",
+        "β": "贝塔",
+        "γ": "伽玛",
+        "Γ": "伽玛",
+        "δ": "德尔塔",
+        "Δ": "德尔塔",
+        "ε": "艾普西龙",
+        "ζ": "捷塔",
+        "η": "依塔",
+        "θ": "西塔",
+        "Θ": "西塔",
+        "ι": "艾欧塔",
+        "κ": "喀帕",
+        "λ": "拉姆达",
+        "Λ": "拉姆达",
+        "μ": "缪",
+        "ν": "拗",
+        "ξ": "克西",
+        "Ξ": "克西",
+        "ο": "欧米克伦",
+        "π": "派",
+        "Π": "派",
+        "ρ": "肉",
+        "ς": "西格玛",
+        "Σ": "西格玛",
+        "σ": "西格玛",
+        "τ": "套",
+        "υ": "宇普西龙",
+        "φ": "服艾",
+        "Φ": "服艾",
+        "χ": "器",
+        "ψ": "普赛",
+        "Ψ": "普赛",
+        "ω": "欧米伽",
+        "Ω": "欧米伽",
+        # 兜底数学运算，顺便兼容懒人用语
+        "+": "加",
+        "-": "减",
+        "×": "乘",
+        "÷": "除",
+        "=": "等",
+    }
+)
+
 
 class TextNormalizer:
     def __init__(self):
-        self.SENTENCE_SPLITOR = re.compile(r"([：、，；。？！,;?!][”’]?)")
+        self.SENTENCE_SPLITOR = RE_SENTENCE_SPLITOR
 
     def _split(self, text: str, lang="zh") -> List[str]:
         """Split long text into sentences with sentence-splitting punctuations.
@@ -73,98 +139,66 @@ class TextNormalizer:
         if lang == "zh":
             text = text.replace(" ", "")
             # 过滤掉特殊字符
-            text = re.sub(r"[——《》【】<>{}()（）#&@“”^_|\\]", "", text)
+            text = RE_SPECIAL_CHARS.sub("", text)
         text = self.SENTENCE_SPLITOR.sub(r"\1\n", text)
         text = text.strip()
-        sentences = [sentence.strip() for sentence in re.split(r"\n+", text)]
+        sentences = [sentence.strip() for sentence in RE_LINE_BREAKS.split(text)]
         return sentences
 
     def _post_replace(self, sentence: str) -> str:
-        sentence = sentence.replace("/", "每")
         # sentence = sentence.replace('~', '至')
         # sentence = sentence.replace('～', '至')
-        sentence = sentence.replace("①", "一")
-        sentence = sentence.replace("②", "二")
-        sentence = sentence.replace("③", "三")
-        sentence = sentence.replace("④", "四")
-        sentence = sentence.replace("⑤", "五")
-        sentence = sentence.replace("⑥", "六")
-        sentence = sentence.replace("⑦", "七")
-        sentence = sentence.replace("⑧", "八")
-        sentence = sentence.replace("⑨", "九")
-        sentence = sentence.replace("⑩", "十")
-        sentence = sentence.replace("α", "阿尔法")
-        sentence = sentence.replace("β", "贝塔")
-        sentence = sentence.replace("γ", "伽玛").replace("Γ", "伽玛")
-        sentence = sentence.replace("δ", "德尔塔").replace("Δ", "德尔塔")
-        sentence = sentence.replace("ε", "艾普西龙")
-        sentence = sentence.replace("ζ", "捷塔")
-        sentence = sentence.replace("η", "依塔")
-        sentence = sentence.replace("θ", "西塔").replace("Θ", "西塔")
-        sentence = sentence.replace("ι", "艾欧塔")
-        sentence = sentence.replace("κ", "喀帕")
-        sentence = sentence.replace("λ", "拉姆达").replace("Λ", "拉姆达")
-        sentence = sentence.replace("μ", "缪")
-        sentence = sentence.replace("ν", "拗")
-        sentence = sentence.replace("ξ", "克西").replace("Ξ", "克西")
-        sentence = sentence.replace("ο", "欧米克伦")
-        sentence = sentence.replace("π", "派").replace("Π", "派")
-        sentence = sentence.replace("ρ", "肉")
-        sentence = sentence.replace("ς", "西格玛").replace("Σ", "西格玛").replace("σ", "西格玛")
-        sentence = sentence.replace("τ", "套")
-        sentence = sentence.replace("υ", "宇普西龙")
-        sentence = sentence.replace("φ", "服艾").replace("Φ", "服艾")
-        sentence = sentence.replace("χ", "器")
-        sentence = sentence.replace("ψ", "普赛").replace("Ψ", "普赛")
-        sentence = sentence.replace("ω", "欧米伽").replace("Ω", "欧米伽")
-        # 兜底数学运算，顺便兼容懒人用语
-        sentence = sentence.replace("+", "加")
-        sentence = sentence.replace("-", "减")
-        sentence = sentence.replace("×", "乘")
-        sentence = sentence.replace("÷", "除")
-        sentence = sentence.replace("=", "等")
+        sentence = sentence.translate(POST_REPLACE_TABLE)
         # re filter special characters, have one more character "-" than line 68
-        sentence = re.sub(r"[-——《》【】<=>{}()（）#&@“”^_|\\]", "", sentence)
+        sentence = RE_POST_SPECIAL_CHARS.sub("", sentence)
         return sentence
 
     def normalize_sentence(self, sentence: str) -> str:
         # basic character conversions
         sentence = tranditional_to_simplified(sentence)
-        sentence = sentence.translate(F2H_ASCII_LETTERS).translate(F2H_DIGITS).translate(F2H_SPACE)
+        sentence = sentence.translate(F2H_TABLE)
+
+        # 数字相关的规则都要求至少一个数字, 没有数字时直接跳过
+        has_digit = RE_DIGIT.search(sentence) is not None
 
-        # number related NSW verbalization
-        sentence = RE_DATE.sub(replace_date, sentence)
-        sentence = RE_DATE2.sub(replace_date2, sentence)
+        if has_digit:
+            # number related NSW verbalization
+            sentence = RE_DATE.sub(replace_date, sentence)
+            sentence = RE_DATE2.sub(replace_date2, sentence)
 
-        # range first
-        sentence = RE_TIME_RANGE.sub(replace_time, sentence)
-        sentence = RE_TIME.sub(replace_time, sentence)
+            # range first
+            sentence = RE_TIME_RANGE.sub(replace_time, sentence)
+            sentence = RE_TIME.sub(replace_time, sentence)
 
-        # 处理~波浪号作为至的替换
-        sentence = RE_TO_RANGE.sub(replace_to_range, sentence)
-        sentence = RE_TEMPERATURE.sub(replace_temperature, sentence)
+            # 处理~波浪号作为至的替换
+            sentence = RE_TO_RANGE.sub(replace_to_range, sentence)
+            sentence = RE_TEMPERATURE.sub(replace_temperature, sentence)
         sentence = replace_measure(sentence)
 
         # 处理数学运算
-        while RE_ASMD.search(sentence):
-            sentence = RE_ASMD.sub(replace_asmd, sentence)
-        sentence = RE_POWER.sub(replace_power, sentence)
+        n_replaced = 1
+        while n_replaced:
+            sentence, n_replaced = RE_ASMD.subn(replace_asmd, sentence)
+        # 次方会生成数字, 如 x² -> x的2次方
+        sentence, n_replaced = RE_POWER.subn(replace_power, sentence)
+        has_digit = has_digit or n_replaced > 0
 
-        sentence = RE_FRAC.sub(replace_frac, sentence)
-        sentence = RE_PERCENTAGE.sub(replace_percentage, sentence)
-        sentence = RE_MOBILE_PHONE.sub(replace_mobile, sentence)
+        if has_digit:
+            sentence = RE_FRAC.sub(replace_frac, sentence)
+            sentence = RE_PERCENTAGE.sub(replace_percentage, sentence)
+            sentence = RE_MOBILE_PHONE.sub(replace_mobile, sentence)
 
-        sentence = RE_TELEPHONE.sub(replace_phone, sentence)
-        sentence = RE_NATIONAL_UNIFORM_NUMBER.sub(replace_phone, sentence)
+            sentence = RE_TELEPHONE.sub(replace_phone, sentence)
+            sentence = RE_NATIONAL_UNIFORM_NUMBER.sub(replace_phone, sentence)
 
-        sentence = RE_RANGE.sub(replace_range, sentence)
+            sentence = RE_RANGE.sub(replace_range, sentence)
 
-        sentence = RE_INTEGER.sub(replace_negative_num, sentence)
-        sentence = RE_VERSION_NUM.sub(replace_vrsion_num, sentence)
-        sentence = RE_DECIMAL_NUM.sub(replace_number, sentence)
-        sentence = RE_POSITIVE_QUANTIFIERS.sub(replace_positive_quantifier, sentence)
-        sentence = RE_DEFAULT_NUM.sub(replace_default_num, sentence)
-        sentence = RE_NUMBER.sub(replace_number, sentence)
+            sentence = RE_INTEGER.sub(replace_negative_num, sentence)
+            sentence = RE_VERSION_NUM.sub(replace_vrsion_num, sentence)
+            sentence = RE_DECIMAL_NUM.sub(replace_number, sentence)
+            sentence = RE_POSITIVE_QUANTIFIERS.sub(replace_positive_quantifier, sentence)
+            sentence = RE_DEFAULT_NUM.sub(replace_default_num, sentence)
+            sentence = RE_NUMBER.sub(replace_number, sentence)
         sentence = self._post_replace(sentence)
 
         return sentence
@@ -173,3 +207,61 @@ class TextNormalizer:
         sentences = self._split(text)
         sentences = [self.normalize_sentence(sent) for sent in sentences]
         return sentences
+
+
+if __name__ == "__main__":
+    # 用法 (在 GPT_SoVITS 目录下):
+    #   python -m text.zh_normalization.text_normlization                               测速并与 golden/ 下的黄金文件逐行比对
+    #   python -m text.zh_normalization.text_normlization corpus.txt                    只测速
+    #   python -m text.zh_normalization.text_normlization corpus.txt -g golden.txt --update  生成黄金文件
+    # golden/golden.txt 由预编译改写之前的规范化代码生成, 只有在有意改变输出时才用 --update 重新生成
+    import argparse
+    import os
+    import sys
+    import time
+
+    golden_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+    parser = argparse.ArgumentParser(description="zh text normalization benchmark / golden check")
+    parser.add_argument(
+        "corpus",
+        type=str,
+        nargs="?",
+        default=None,
+        help="utf-8 corpus, one paragraph per line, default: the bundled corpus checked against the bundled golden file",
+    )
+    parser.add_argument("-g", "--golden", type=str, default=None, help="golden output file")
+    parser.add_argument("--update", action="store_true", help="write the golden file instead of comparing")
+    args = parser.parse_args()
+    if args.corpus is None:
+        args.corpus = os.path.join(golden_dir, "corpus.txt")
+        if args.golden is None:
+            args.golden = os.path.join(golden_dir, "golden.txt")
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f]
+
+    tx = TextNormalizer()
+    t0 = time.perf_counter()
+    outputs = ["\t".join(tx.normalize(line)) for line in lines]
+    cost = time.perf_counter() - t0
+    n_chars = sum(len(line) for line in lines)
+    print(f"{len(lines)} lines, {n_chars} chars, {cost:.3f}s, {n_chars / max(cost, 1e-9):.0f} chars/s")
+
+    if args.golden is None:
+        sys.exit(0)
+    if args.update:
+        with open(args.golden, "w", encoding="utf-8") as f:
+            f.write("\n".join(outputs) + "\n")
+        print(f"golden file written: {args.golden}")
+        sys.exit(0)
+
+    with open(args.golden, "r", encoding="utf-8") as f:
+        golden = [line.rstrip("\n") for line in f]
+    if len(golden) != len(outputs):
+        print(f"line count mismatch: golden {len(golden)}, output {len(outputs)}")
+        sys.exit(1)
+    mismatches = [i for i, (a, b) in enumerate(zip(golden, outputs)) if a != b]
+    for i in mismatches[:20]:
+        print(f"line {i + 1}:\n  input : {lines[i]}\n  golden: {golden[i]}\n  output: {outputs[i]}")
+    print(f"{len(mismatches)} mismatched lines")
+    sys.exit(1 if mismatches else 0)
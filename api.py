@@ -19,12 +19,16 @@
 `-fp` - `覆盖 config.py 使用全精度`
 `-hp` - `覆盖 config.py 使用半精度`
 `-sm` - `流式返回模式, 默认不启用, "close","c", "normal","n", "keepalive","k"`
-·-mt` - `返回的音频编码格式, 流式默认ogg, 非流式默认wav, "wav", "ogg", "aac"`
+·-mt` - `返回的音频编码格式, 流式默认ogg, 非流式默认wav, "wav", "ogg", "aac", "mp3"`
 ·-st` - `返回的音频数据类型, 默认int16, "int16", "int32"`
 ·-cp` - `文本切分符号设定, 默认为空, 以",.，。"字符串的方式传入`
 
 `-hb` - `cnhubert路径`
 `-b` - `bert路径`
+`-wl` - `启动时预热的文本前端语种, 逗号分隔, 如"zh,en", "all"为全部语种, 默认不预热(首次使用时加载)`
+`-wu` - `启动时用默认参考音频完整预热(文本前端/BERT/GPT/SoVITS), 每种 -wl 语种(默认为参考语种)合成一句话, 完成前 /health/ready 返回 503`
+
+单进程推理; 多进程工作池(共享只读权重, 按 CPU 分组绑定)只在 api_v2.py 中提供(`-w`).
 
 ## 调用:
 
@@ -119,6 +123,12 @@ RESP:
 失败: json, 400
 
 
+### 健康检查
+
+`/health/live`: 进程在运行即返回 200.
+`/health/ready`: 启动预热(`-wu`)完成后返回 200, 预热中或预热失败时返回 503;
+返回内容包括预热用时、每种语种的预热用时(第一项即冷启动时第一个请求的延迟)和预热后第一个请求的延迟.
+
 ### 命令控制
 
 endpoint: `/control`
@@ -150,6 +160,8 @@ sys.path.append(now_dir)
 sys.path.append("%s/GPT_SoVITS" % (now_dir))
 
 import signal
+import threading
+import time
 from text.LangSegmenter import LangSegmenter
 from time import time as ttime
 import torch
@@ -167,11 +179,13 @@ from module.models import Generator, SynthesizerTrn, SynthesizerTrnV3
 from peft import LoraConfig, get_peft_model
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
 from text import cleaned_text_to_sequence
-from text.cleaner import clean_text
+from text.cleaner import clean_text, warmup as warmup_text_frontend, print_import_timings, warmup_texts
+from text.phone_level_feature import expand_to_phone_level, get_zero_feature
 from module.mel_processing import spectrogram_torch
 import config as global_config
 import logging
-import subprocess
+from tools.audio_encoder import STREAMING_MEDIA_TYPES, create_encoder
+from tools.readiness import WarmupState
 
 
 class DefaultRefer:
@@ -375,7 +389,7 @@ class Sovits:
         self.hps = hps
 
 
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import get_sovits_version_from_path_fast, load_gpt_new, load_sovits_new
 
 
 def get_sovits_weights(sovits_path):
@@ -475,7 +489,7 @@ hz = 50
 
 
 def get_gpt_weights(gpt_path):
-    dict_s1 = torch.load(gpt_path, map_location="cpu", weights_only=False)
+    dict_s1 = load_gpt_new(gpt_path)
     config = dict_s1["config"]
     max_sec = config["data"]["max_sec"]
     t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
@@ -510,11 +524,7 @@ def get_bert_feature(text, word2ph):
         res = bert_model(**inputs, output_hidden_states=True)
         res = torch.cat(res["hidden_states"][-3:-2], -1)[0].cpu()[1:-1]
     assert len(word2ph) == len(text)
-    phone_level_feature = []
-    for i in range(len(word2ph)):
-        repeat_feature = res[i].repeat(word2ph[i], 1)
-        phone_level_feature.append(repeat_feature)
-    phone_level_feature = torch.cat(phone_level_feature, dim=0)
+    phone_level_feature = expand_to_phone_level(res, word2ph)
     # if(is_half==True):phone_level_feature=phone_level_feature.half()
     return phone_level_feature.T
 
@@ -531,17 +541,11 @@ def get_bert_inf(phones, word2ph, norm_text, language):
     if language == "zh":
         bert = get_bert_feature(norm_text, word2ph).to(device)  # .to(dtype)
     else:
-        bert = torch.zeros(
-            (1024, len(phones)),
-            dtype=torch.float16 if is_half == True else torch.float32,
-        ).to(device)
+        bert = get_zero_feature(len(phones), dtype=torch.float16 if is_half == True else torch.float32, device=device)
 
     return bert
 
 
-from text import chinese
-
-
 def get_phones_and_bert(text, language, version, final=False):
     text = re.sub(r' {2,}', ' ', text)
     textlist = []
@@ -667,11 +671,10 @@ def get_spepc(hps, filename, dtype, device, is_v2pro=False):
     return spec, audio
 
 
-def pack_audio(audio_bytes, data, rate):
-    if media_type == "ogg":
-        audio_bytes = pack_ogg(audio_bytes, data, rate)
-    elif media_type == "aac":
-        audio_bytes = pack_aac(audio_bytes, data, rate)
+def pack_audio(audio_bytes, data, rate, encoder=None):
+    if media_type in STREAMING_MEDIA_TYPES:
+        # ogg / aac / mp3 整个响应共用一个编码器
+        audio_bytes.write(encoder.encode(data))
     else:
         # wav无法流式, 先暂存raw
         audio_bytes = pack_raw(audio_bytes, data, rate)
@@ -679,52 +682,6 @@ def pack_audio(audio_bytes, data, rate):
     return audio_bytes
 
 
-def pack_ogg(audio_bytes, data, rate):
-    # Author: AkagawaTsurunaki
-    # Issue:
-    #   Stack overflow probabilistically occurs
-    #   when the function `sf_writef_short` of `libsndfile_64bit.dll` is called
-    #   using the Python library `soundfile`
-    # Note:
-    #   This is an issue related to `libsndfile`, not this project itself.
-    #   It happens when you generate a large audio tensor (about 499804 frames in my PC)
-    #   and try to convert it to an ogg file.
-    # Related:
-    #   https://github.com/RVC-Boss/GPT-SoVITS/issues/1199
-    #   https://github.com/libsndfile/libsndfile/issues/1023
-    #   https://github.com/bastibe/python-soundfile/issues/396
-    # Suggestion:
-    #   Or split the whole audio data into smaller audio segment to avoid stack overflow?
-
-    def handle_pack_ogg():
-        with sf.SoundFile(audio_bytes, mode="w", samplerate=rate, channels=1, format="ogg") as audio_file:
-            audio_file.write(data)
-
-    import threading
-
-    # See: https://docs.python.org/3/library/threading.html
-    # The stack size of this thread is at least 32768
-    # If stack overflow error still occurs, just modify the `stack_size`.
-    # stack_size = n * 4096, where n should be a positive integer.
-    # Here we chose n = 4096.
-    stack_size = 4096 * 4096
-    try:
-        threading.stack_size(stack_size)
-        pack_ogg_thread = threading.Thread(target=handle_pack_ogg)
-        pack_ogg_thread.start()
-        pack_ogg_thread.join()
-    except RuntimeError as e:
-        # If changing the thread stack size is unsupported, a RuntimeError is raised.
-        print("RuntimeError: {}".format(e))
-        print("Changing the thread stack size is unsupported.")
-    except ValueError as e:
-        # If the specified stack size is invalid, a ValueError is raised and the stack size is unmodified.
-        print("ValueError: {}".format(e))
-        print("The specified stack size is invalid.")
-
-    return audio_bytes
-
-
 def pack_raw(audio_bytes, data, rate):
     audio_bytes.write(data.tobytes())
 
@@ -743,43 +700,6 @@ def pack_wav(audio_bytes, rate):
     return wav_bytes
 
 
-def pack_aac(audio_bytes, data, rate):
-    if is_int32:
-        pcm = "s32le"
-        bit_rate = "256k"
-    else:
-        pcm = "s16le"
-        bit_rate = "128k"
-    process = subprocess.Popen(
-        [
-            "ffmpeg",
-            "-f",
-            pcm,  # 输入16位有符号小端整数PCM
-            "-ar",
-            str(rate),  # 设置采样率
-            "-ac",
-            "1",  # 单声道
-            "-i",
-            "pipe:0",  # 从管道读取输入
-            "-c:a",
-            "aac",  # 音频编码器为AAC
-            "-b:a",
-            bit_rate,  # 比特率
-            "-vn",  # 不包含视频
-            "-f",
-            "adts",  # 输出AAC数据流格式
-            "pipe:1",  # 将输出写入管道
-        ],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    out, _ = process.communicate(input=data.tobytes())
-    audio_bytes.write(out)
-
-    return audio_bytes
-
-
 def read_clean_buffer(audio_bytes):
     audio_chunk = audio_bytes.getvalue()
     audio_bytes.truncate(0)
@@ -915,6 +835,7 @@ def get_tts_wav(
     phones1, bert1, norm_text1 = get_phones_and_bert(prompt_text, prompt_language, version)
     texts = text.split("\n")
     audio_bytes = BytesIO()
+    encoder = None
 
     for text in texts:
         # 简单防止纯符号引发参考音频泄露
@@ -1047,15 +968,23 @@ def get_tts_wav(
                 audio_opt /= max_audio
             sr = 48000
 
+        if encoder is None and media_type in STREAMING_MEDIA_TYPES:
+            encoder = create_encoder(media_type, sr, 4 if is_int32 else 2)
         if is_int32:
-            audio_bytes = pack_audio(audio_bytes, (audio_opt * 2147483647).astype(np.int32), sr)
+            audio_bytes = pack_audio(audio_bytes, (audio_opt * 2147483647).astype(np.int32), sr, encoder)
         else:
-            audio_bytes = pack_audio(audio_bytes, (audio_opt * 32768).astype(np.int16), sr)
+            audio_bytes = pack_audio(audio_bytes, (audio_opt * 32768).astype(np.int16), sr, encoder)
         # logger.info("%.3f\t%.3f\t%.3f\t%.3f" % (t1 - t0, t2 - t1, t3 - t2, t4 - t3))
         if stream_mode == "normal":
             audio_bytes, audio_chunk = read_clean_buffer(audio_bytes)
             yield audio_chunk
 
+    if encoder is not None:
+        audio_bytes.write(encoder.finish())
+        if stream_mode == "normal":
+            audio_bytes, audio_chunk = read_clean_buffer(audio_bytes)
+            yield audio_chunk
+
     if not stream_mode == "normal":
         if media_type == "wav":
             if version in {"v1", "v2", "v2Pro", "v2ProPlus"}:
@@ -1097,6 +1026,42 @@ def handle_change(path, text, language):
     return JSONResponse({"code": 0, "message": "Success"}, status_code=200)
 
 
+def record_first_chunk(chunks, start_time):
+    for chunk in chunks:
+        readiness.record_request(time.perf_counter() - start_time)
+        yield chunk
+
+
+def warmup_inference():
+    """
+    用默认参考音频合成每种预热语种的一句话, 完成后 /health/ready 才返回 200
+    """
+    if not args.warmup:
+        readiness.finish()
+        return
+    if not default_refer.is_ready():
+        readiness.fail("warm-up needs the default reference audio (-dr/-dt/-dl)")
+        return
+    readiness.begin()
+    if args.warmup_langs == "all":
+        languages = list(warmup_texts.keys())
+    elif args.warmup_langs != "":
+        languages = [lang.strip() for lang in args.warmup_langs.split(",")]
+    else:
+        languages = [default_refer.language]
+    timings = {}
+    try:
+        for language in languages:
+            text = warmup_texts.get(dict_language[language.lower()].replace("all_", ""), warmup_texts["zh"])
+            t0 = time.perf_counter()
+            for _ in get_tts_wav(default_refer.path, default_refer.text, default_refer.language, text, language):
+                pass
+            timings[language] = time.perf_counter() - t0
+        readiness.finish(timings)
+    except Exception as e:
+        readiness.fail(str(e))
+
+
 def handle(
     refer_wav_path,
     prompt_text,
@@ -1134,19 +1099,22 @@ def handle(
         text = cut_text(text, cut_punc)
 
     return StreamingResponse(
-        get_tts_wav(
-            refer_wav_path,
-            prompt_text,
-            prompt_language,
-            text,
-            text_language,
-            top_k,
-            top_p,
-            temperature,
-            speed,
-            inp_refs,
-            sample_steps,
-            if_sr,
+        record_first_chunk(
+            get_tts_wav(
+                refer_wav_path,
+                prompt_text,
+                prompt_language,
+                text,
+                text_language,
+                top_k,
+                top_p,
+                temperature,
+                speed,
+                inp_refs,
+                sample_steps,
+                if_sr,
+            ),
+            time.perf_counter(),
         ),
         media_type="audio/" + media_type,
     )
@@ -1207,12 +1175,14 @@ parser.add_argument(
 # bool值的用法为 `python ./api.py -fp ...`
 # 此时 full_precision==True, half_precision==False
 parser.add_argument("-sm", "--stream_mode", type=str, default="close", help="流式返回模式, close / normal / keepalive")
-parser.add_argument("-mt", "--media_type", type=str, default="wav", help="音频编码格式, wav / ogg / aac")
+parser.add_argument("-mt", "--media_type", type=str, default="wav", help="音频编码格式, wav / ogg / aac / mp3")
 parser.add_argument("-st", "--sub_type", type=str, default="int16", help="音频数据类型, int16 / int32")
 parser.add_argument("-cp", "--cut_punc", type=str, default="", help="文本切分符号设定, 符号范围,.;?!、，。？！；：…")
 # 切割常用分句符为 `python ./api.py -cp ".?!。？！"`
 parser.add_argument("-hb", "--hubert_path", type=str, default=g_config.cnhubert_path, help="覆盖config.cnhubert_path")
 parser.add_argument("-b", "--bert_path", type=str, default=g_config.bert_path, help="覆盖config.bert_path")
+parser.add_argument("-wl", "--warmup_langs", type=str, default="", help="启动时预热的文本前端语种, 如 zh,en / all")
+parser.add_argument("-wu", "--warmup", action="store_true", default=False, help="启动时用默认参考音频完整预热")
 
 args = parser.parse_args()
 sovits_path = args.sovits_path
@@ -1262,7 +1232,7 @@ else:
     stream_mode = "close"
 
 # 音频编码格式
-if args.media_type.lower() in ["aac", "ogg"]:
+if args.media_type.lower() in STREAMING_MEDIA_TYPES:
     media_type = args.media_type.lower()
 elif stream_mode == "close":
     media_type = "wav"
@@ -1290,12 +1260,33 @@ else:
     bert_model = bert_model.to(device)
     ssl_model = ssl_model.to(device)
 change_gpt_sovits_weights(gpt_path=gpt_path, sovits_path=sovits_path)
+if args.warmup_langs != "" and "default" in speaker_list:
+    warmup_langs = None if args.warmup_langs == "all" else [lang.strip() for lang in args.warmup_langs.split(",")]
+    warmup_text_frontend(warmup_langs, speaker_list["default"].sovits.vq_model.version)
+    print_import_timings()
 
 
 # --------------------------------
 # 接口部分
 # --------------------------------
 app = FastAPI()
+readiness = WarmupState()
+
+
+@app.on_event("startup")
+async def start_warmup():
+    # 预热在后台线程中进行, 期间 /health/live 可以正常响应
+    threading.Thread(target=warmup_inference, name="warmup", daemon=True).start()
+
+
+@app.get("/health/live")
+async def health_live():
+    return JSONResponse({"status": "alive"}, status_code=200)
+
+
+@app.get("/health/ready")
+async def health_ready():
+    return JSONResponse(readiness.report(), status_code=200 if readiness.ready else 503)
 
 
 @app.post("/set_model")
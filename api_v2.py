@@ -7,6 +7,21 @@
     `-a` - `绑定地址, 默认"127.0.0.1"`
     `-p` - `绑定端口, 默认9880`
     `-c` - `TTS配置文件路径, 默认"GPT_SoVITS/configs/tts_infer.yaml"`
+    `-wl` - `启动时预热的文本前端语种, 逗号分隔, 如"zh,en", "all"为全部语种, 默认不预热(首次使用时加载)`
+    `-wv` - `启动时完整预热(文本前端/BERT/T2S/SoVITS/声码器)使用的音色, "参考音频|参考文本|参考语种" 或音色文件(.npz), 可重复; 每个音色合成 -wl 中每种语言(默认参考语种)的一句话`
+    `-mq` - `推理队列上限(排队中+推理中的请求数), 超出时返回 503, 默认64`
+    `-sb` - `流式响应预取的音频块数, 客户端读取较慢时推理暂停, 默认4`
+    `-bs` - `启用跨请求动态批处理: 同一参考音色且采样参数相同的并发请求, 其句子合并到同一批次推理`
+    `--max_wait_ms` - `动态批处理时最早的句子最多等待多少毫秒以凑批, 默认20`
+    `--max_batch_tokens` - `动态批处理每批最多的音素数(含参考文本), 默认4096`
+    `--max_batch_size` - `动态批处理每批最多的句子数, 默认16`
+    `-mb` - `按请求加载的其他模型(gpt_weights_path/sovits_weights_path)的内存预算(MB), 超出时卸载最久未用的模型, 默认8192`
+    `-w` - `推理工作进程数(仅CPU), 加载权重后 fork 出多个进程共享权重, 每个进程绑定一组CPU核心, 请求分发给最空闲的进程, 默认1(不启用)`
+    `--no_cpu_pinning` - `多进程时不绑定CPU核心`
+    `--no_coalescing` - `不合并同时进行的相同请求(见"请求合并")`
+
+动态批处理模式下 batch_size/batch_threshold/split_bucket/seed 不生效, 每个请求按句子返回.
+压测: `python tools/load_test_api.py -u http://127.0.0.1:9880/tts -r archive_jingyuan_1.wav -pt "..." -pl zh -n 32 -c 1,4,16`
 
 ## 调用:
 
@@ -27,6 +42,9 @@ POST:
     "aux_ref_audio_paths": [],    # list.(optional) auxiliary reference audio paths for multi-speaker tone fusion
     "prompt_text": "",            # str.(optional) prompt text for the reference audio
     "prompt_lang": "",            # str.(required) language of the prompt text for the reference audio
+    "voice_profile": "",          # str.(optional) precompiled voice profile (.npz), replaces ref_audio_path/aux_ref_audio_paths/prompt_text/prompt_lang
+    "gpt_weights_path": "",       # str.(optional) GPT weights of this request, default: the loaded model
+    "sovits_weights_path": "",    # str.(optional) SoVITS weights of this request, default: the loaded model
     "top_k": 5,                   # int. top k sampling
     "top_p": 1,                   # float. top p sampling
     "temperature": 1,             # float. temperature for sampling
@@ -40,13 +58,124 @@ POST:
     "parallel_infer": True,       # bool. whether to use parallel inference.
     "repetition_penalty": 1.35,   # float. repetition penalty for T2S model.
     "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
-    "super_sampling": False       # bool. whether to use super-sampling for audio when using VITS model V3.
+    "super_sampling": False,      # bool. whether to use super-sampling for audio when using VITS model V3.
+    "profile": False,             # bool|str.(optional) profile this request: true/"torch" or "sampling", see 性能分析 below.
+    "trace_id": "",               # str.(optional) id the trace is stored under, generated if empty.
+    "priority": "",               # str.(optional) "interactive" or "batch", default: interactive for streaming requests.
+    "tenant": "",                 # str.(optional) tenant of the request, default: the X-Tenant-Id header.
+    "deadline_ms": None           # float.(optional) longest acceptable queue wait, see 准入控制 below.
 }
 ```
 
 RESP:
 成功: 直接返回 wav 音频流， http code 200
 失败: 返回包含错误信息的 json, http code 400
+客户端断开连接(包括流式响应中途断开)时, 推理在下一个语义 token/音频块处停止.
+
+预编译音色 (voice_profile):
+```
+python GPT_SoVITS/TTS_infer_pack/voice_profile.py -c GPT_SoVITS/configs/tts_infer.yaml -r archive_jingyuan_1.wav -t "我是「罗浮」云骑将军景元。" -l zh -o voices/jingyuan.npz
+```
+之后请求中传 `voice_profile=voices/jingyuan.npz` 代替 `ref_audio_path` 等参考参数。
+只使用预编译音色的节点可以在配置文件中设置 `profile_only: true`, 不加载 CNHuBERT 和 SV 模型。
+
+### WebSocket 双向流式
+
+endpoint: `ws://127.0.0.1:9880/tts/ws`
+
+客户端边生成边发送文本(如 LLM 的输出), 服务端按句切分后立即合成并推送音频, 同一连接内可连续合成多段话.
+客户端发送 JSON 文本消息:
+```
+{"type": "start", "text_lang": "zh", "ref_audio_path": "...", "prompt_text": "...", "prompt_lang": "zh", "media_type": "raw", ...}
+                                 # 必须是第一条消息, 参数同 /tts (不含 text/streaming_mode/profile), media_type 为 "raw"(默认) 或 "ogg"/"aac"/"mp3"
+{"type": "text", "text": "..."}  # 文本增量, 凑成完整句子后开始合成
+{"type": "flush"}                # 不等句末标点, 立即合成缓冲区中的文本
+{"type": "voice", "ref_audio_path": "...", "prompt_text": "...", ...}
+                                 # 切换音色(ref_audio_path/aux_ref_audio_paths/prompt_text/prompt_lang/voice_profile), 之前收到的文本仍用原音色
+{"type": "cancel"}               # 丢弃未合成的文本并停止当前句子
+{"type": "end"}                  # 合成剩余文本, 发送完毕后关闭连接
+```
+服务端发送:
+```
+{"type": "ready"} / {"type": "voice_changed"} / {"type": "flushed"} / {"type": "cancelled"} / {"type": "done"}
+{"type": "sentence_start", "sentence": 0, "text": "...", "seq": 0, "sample_rate": 32000, "media_type": "raw"}
+二进制帧: 4 字节大端序列号 + 音频数据 (raw 为 16 位单声道 PCM; 其他格式每句是一个完整的音频流, 如 ogg 在采样率支持时为 Opus)
+{"type": "sentence_end", "sentence": 0, "seq": 12, "duration": 2.35}     # seq 为该句最后一帧的序列号
+{"type": "error", "message": "...", "sentence": 0}                         # 单句失败或被准入控制拒绝时连接不断开
+```
+音色在 start/voice 时预先加载到音色缓存, 每句按 `interactive` 优先级经过准入控制.
+文本按 text_split_method 切分, 与整段文本的切分结果一致; cut1/cut2 按整段文本分组, 要到 flush/end 时才开始合成.
+
+### 批量任务
+
+endpoint: `/jobs`
+
+POST:
+```json
+{
+    "manifest_path": "jobs/book.jsonl",   # str.(required) 服务器上的 JSONL 清单, 格式见 GPT_SoVITS/TTS_infer_pack/bulk_jobs.py
+    "progress_path": "",                  # str.(optional) 进度文件, 默认在 --job_output_root 下
+    "shard": 0,                           # int.(optional) 多台机器分片处理时本机的分片
+    "num_shards": 1,                      # int.(optional) 分片数
+    "concurrency": 0                      # int.(optional) 同时进行的条目数, 0 为 --max_running
+}
+```
+条目按音色、参数、长度排序后以 `batch` 优先级经过准入控制合成(交互请求优先), 音频直接写入清单中的 output_path.
+output_path 与 progress_path 的相对路径以 `--job_output_root` 为根目录, 解析后(含符号链接)不在该目录下的清单会被拒绝.
+每完成一条即写入进度文件, 任务中断后用同一清单重新提交会跳过已完成的条目. 也可离线运行: `python GPT_SoVITS/inference_cli.py --manifest jobs/book.jsonl -w 4`
+进度: GET `/jobs`, `/jobs/<job_id>` (含每机器小时合成的音频小时数 throughput); 取消: DELETE `/jobs/<job_id>`
+
+### 多模型
+
+请求中的 `gpt_weights_path`/`sovits_weights_path` 指定其他模型时, 模型在后台加载(不阻塞其他模型上的请求),
+BERT/CNHuBERT/声码器与默认模型共享, 超出 `-mb` 内存预算时卸载最久未用的模型.
+多进程模式(`-w`)下每个工作进程各自加载请求的模型, 互不共享, `-mb` 为每个工作进程的预算(总内存最多为 `-w` × `-mb`).
+
+预加载: `http://127.0.0.1:9880/load_model?gpt_weights_path=GPT_weights_v2/xxx.ckpt&sovits_weights_path=SoVITS_weights_v2/xxx.pth`
+卸载: `http://127.0.0.1:9880/unload_model?gpt_weights_path=...&sovits_weights_path=...`
+已加载的模型: `http://127.0.0.1:9880/models`
+
+### 响应缓存
+
+`-cd` 指定缓存目录后, 固定 `seed`(不为 -1) 的请求的最终音频会按编码后的格式写入磁盘缓存,
+完全相同的请求(文本、参数、参考音频内容、模型权重都相同)直接从磁盘返回, 不再推理. 缓存总大小受 `-cs` 限制, 超出时删除最久未用的条目.
+动态批处理模式下 seed 不生效, 不使用缓存. 缓存统计: `http://127.0.0.1:9880/cache`
+
+### 请求合并
+
+固定 `seed` 的请求在推理期间又收到完全相同的请求(判定方式同响应缓存, 不需要启用 `-cd`)时, 后来的请求不再推理,
+而是接入正在进行的合成: 流式请求先补发已生成的音频块再接收后续的块, 非流式请求等待同一份结果.
+合成在独立的任务中运行, 任一客户端断开不影响其他客户端, 所有客户端都断开后才停止. 合并次数见 `/metrics`
+(`tts_coalesced_requests_total`); `--no_coalescing` 关闭. 动态批处理模式下 seed 不生效, 不合并.
+
+### 监控指标
+
+`http://127.0.0.1:9880/metrics` 返回 Prometheus 文本格式的指标: 各阶段用时直方图(参考音频、分句、G2P、BERT、T2S prefill、T2S、SoVITS/CFM、声码器、后处理、编码),
+T2S 每步延迟、生成的 token 数、合成的音频时长、实时率、达到最大长度提前停止的次数、批大小, 以及音色/模型/响应缓存和队列的统计.
+`--server_timing` 时非流式响应附带 `Server-Timing` 头. 多进程模式下各工作进程的指标和阶段用时在每个请求结束时发回主进程汇总.
+
+### 准入控制
+
+每个请求按估计的音素数和模型版本预测推理用时(每音素用时随实际请求滑动更新), 同时推理的请求数受 `--max_running` 限制,
+其余请求按优先级排队: `interactive`(流式请求默认)总是先于 `batch`(非流式请求默认)调度.
+预测的排队时间超过请求的 `deadline_ms`、排队到期仍未开始, 或同一租户(`tenant` 或 `X-Tenant-Id` 头)排队加推理中的请求达到 `--tenant_limit` 时返回 429 并附带 `Retry-After`;
+排队数达到 `-mq` 时返回 503, 估计音素数超过 `--max_phones` 时返回 413. 队列深度、预测排队时间和拒绝次数见 `/metrics` 与 `/admission`.
+
+### 性能分析
+
+请求中 `profile=true`(或 `"torch"`) 时用 torch.profiler 记录该请求, 导出 Chrome trace(可用 https://ui.perfetto.dev 打开),
+各阶段(g2p、g2pw、bert、ref、t2s_prefill、t2s_decode、t2s_sample、vits_decode、cfm、vocoder)为命名区间;
+`profile="sampling"` 时对推理线程的 Python 调用栈采样, 输出 py-spy raw 格式的折叠栈(可用 flamegraph.pl / speedscope 查看).
+响应头 `X-Trace-Id` 给出 trace ID, 结果保存在 `--trace_dir` 下, 通过 `http://127.0.0.1:9880/trace/<trace_id>` 下载
+(流式响应在结束后才写入). 同一时间只能有一个 torch 分析, 分析期间同一进程内其他请求的计算也会被记录;
+已有请求在分析时, 新请求不做分析, 响应头中没有 `X-Trace-Id`, 而是 `X-Trace-Skipped`. 动态批处理模式下不支持.
+
+### 健康检查
+
+`/health/live`: 进程在运行即返回 200.
+`/health/ready`: 启动预热(`-wv`)完成后返回 200, 预热中或预热失败时返回 503;
+多进程模式下切换权重只在部分工作进程成功且无法恢复时也返回 503(`workers_error`);
+返回内容包括预热用时、每项预热的用时(第一项即冷启动时第一个请求的延迟)和预热后第一个请求的延迟.
 
 ### 命令控制
 
@@ -96,30 +225,50 @@ RESP:
 成功: 返回"success", http code 200
 失败: 返回包含错误信息的 json, http code 400
 
+多进程模式下在每个工作进程中切换, 成功后主进程同步新的模型版本、支持的语种和权重路径(响应缓存与请求合并据此区分模型);
+部分工作进程失败时, 已切换的工作进程恢复原来的权重.
+
 """
 
+import asyncio
+import json
 import os
+import struct
 import sys
+import time
 import traceback
-from typing import Generator
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncGenerator, Dict, Generator, List, Union
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
 sys.path.append("%s/GPT_SoVITS" % (now_dir))
 
 import argparse
-import subprocess
-import wave
 import signal
 import numpy as np
 import soundfile as sf
-from fastapi import FastAPI, Response
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 import uvicorn
 from io import BytesIO
 from tools.i18n.i18n import I18nAuto
-from GPT_SoVITS.TTS_infer_pack.TTS import TTS, TTS_Config
+from tools.audio_encoder import STREAMING_MEDIA_TYPES, StreamEncoder, create_encoder, encode_audio
+from GPT_SoVITS.TTS_infer_pack.TTS import TTS, TTS_Config, RequestContext, metrics, profiling
+from GPT_SoVITS.TTS_infer_pack.TextPreprocessor import StreamingTextSegmenter
+from GPT_SoVITS.TTS_infer_pack.scheduler import BatchScheduler
+from GPT_SoVITS.TTS_infer_pack.model_registry import ModelRegistry
+from GPT_SoVITS.TTS_infer_pack.worker_pool import WorkerPool
+from GPT_SoVITS.TTS_infer_pack.response_cache import RequestHasher, ResponseCache, iter_file
+from GPT_SoVITS.TTS_infer_pack.coalescing import Coalescer, SharedSynthesis
+from GPT_SoVITS.TTS_infer_pack.admission import PRIORITIES, AdmissionController, AdmissionRejected
+from GPT_SoVITS.TTS_infer_pack.bulk_jobs import BulkJob
 from GPT_SoVITS.TTS_infer_pack.text_segmentation_method import get_method_names as get_cut_method_names
+from text.cleaner import warmup as warmup_text_frontend, print_import_timings, warmup_texts
+from tools.readiness import WarmupState
 from pydantic import BaseModel
 
 # print(sys.path)
@@ -130,6 +279,33 @@ parser = argparse.ArgumentParser(description="GPT-SoVITS api")
 parser.add_argument("-c", "--tts_config", type=str, default="GPT_SoVITS/configs/tts_infer.yaml", help="tts_infer路径")
 parser.add_argument("-a", "--bind_addr", type=str, default="127.0.0.1", help="default: 127.0.0.1")
 parser.add_argument("-p", "--port", type=int, default="9880", help="default: 9880")
+parser.add_argument("-wl", "--warmup_langs", type=str, default="", help="启动时预热的文本前端语种, 如 zh,en / all")
+parser.add_argument(
+    "-wv",
+    "--warmup_voice",
+    type=str,
+    action="append",
+    default=[],
+    help="启动时完整预热使用的音色, 参考音频|参考文本|参考语种 或 音色文件(.npz), 可重复",
+)
+parser.add_argument("-mq", "--max_queue", type=int, default=64, help="推理队列上限, 超出时返回 503")
+parser.add_argument("--max_running", type=int, default=0, help="同时推理的请求数, 0 为自动(工作进程数/动态批大小/1)")
+parser.add_argument("--tenant_limit", type=int, default=0, help="每个租户排队加推理中的请求上限, 0 为不限制")
+parser.add_argument("--max_phones", type=int, default=0, help="单个请求估计音素数上限, 超出时返回 413, 0 为不限制")
+parser.add_argument("-sb", "--stream_buffer", type=int, default=4, help="流式响应预取的音频块数")
+parser.add_argument("-bs", "--batch_scheduler", action="store_true", default=False, help="启用跨请求动态批处理")
+parser.add_argument("--max_wait_ms", type=float, default=20, help="动态批处理凑批的最长等待时间(毫秒)")
+parser.add_argument("--max_batch_tokens", type=int, default=4096, help="动态批处理每批最多的音素数")
+parser.add_argument("--max_batch_size", type=int, default=16, help="动态批处理每批最多的句子数")
+parser.add_argument("-mb", "--model_budget", type=int, default=8192, help="按请求加载的其他模型的内存预算(MB)")
+parser.add_argument("-w", "--workers", type=int, default=1, help="推理工作进程数(仅CPU)")
+parser.add_argument("--no_cpu_pinning", action="store_true", default=False, help="多进程时不绑定CPU核心")
+parser.add_argument("-cd", "--cache_dir", type=str, default="", help="响应缓存目录, 为空时不缓存")
+parser.add_argument("-cs", "--cache_size", type=int, default=1024, help="响应缓存的磁盘上限(MB)")
+parser.add_argument("--no_coalescing", action="store_true", default=False, help="不合并同时进行的相同请求")
+parser.add_argument("--server_timing", action="store_true", default=False, help="非流式响应附带 Server-Timing 头")
+parser.add_argument("--trace_dir", type=str, default="traces", help="性能分析结果的保存目录")
+parser.add_argument("--job_output_root", type=str, default="output/jobs_opt", help="批量任务(/jobs)只能写入该目录")
 args = parser.parse_args()
 config_path = args.tts_config
 # device = args.device
@@ -140,12 +316,401 @@ argv = sys.argv
 if config_path in [None, ""]:
     config_path = "GPT-SoVITS/configs/tts_infer.yaml"
 
+profiling.TRACE_DIR = args.trace_dir
+
 tts_config = TTS_Config(config_path)
 print(tts_config)
 tts_pipeline = TTS(tts_config)
 
+
+def parse_warmup_voice(spec: str) -> dict:
+    if spec.endswith(".npz"):
+        return {"voice_profile": spec}
+    parts = spec.split("|")
+    if len(parts) != 3:
+        raise ValueError(f"--warmup_voice must be 参考音频|参考文本|参考语种 or a .npz voice profile, got {spec}")
+    return {"ref_audio_path": parts[0], "prompt_text": parts[1], "prompt_lang": parts[2].lower()}
+
+
+warmup_voices = [parse_warmup_voice(spec) for spec in args.warmup_voice]
+warmup_full_langs = None
+if args.warmup_langs == "all":
+    warmup_full_langs = [lang for lang in warmup_texts if lang in tts_config.languages]
+elif args.warmup_langs not in [None, ""]:
+    warmup_full_langs = [lang.strip().lower() for lang in args.warmup_langs.split(",")]
+readiness = WarmupState()
+
+
+def warmup():
+    if args.warmup_langs not in [None, ""]:
+        warmup_langs = None if args.warmup_langs == "all" else [lang.strip() for lang in args.warmup_langs.split(",")]
+        warmup_text_frontend(warmup_langs, tts_config.version)
+        print_import_timings()
+
+
+worker_pool: WorkerPool = None
+if args.workers > 1:
+    # 权重已加载, fork 出的工作进程共享这些权重; 文本前端在各工作进程内预热
+    worker_pool = WorkerPool(
+        tts_pipeline,
+        args.workers,
+        pin_cpus=not args.no_cpu_pinning,
+        worker_init=warmup,
+        model_budget=args.model_budget << 20,
+    )
+    worker_pool.start()
+else:
+    warmup()
+model_registry = ModelRegistry(tts_pipeline, max_bytes=args.model_budget << 20)
+response_cache: ResponseCache = None
+if args.cache_dir:
+    response_cache = ResponseCache(args.cache_dir, max_bytes=args.cache_size << 20)
+request_hasher = response_cache if response_cache is not None else RequestHasher()
+# 同时进行的相同请求共用一次合成, 只在事件循环线程中使用
+coalescer: Coalescer = None if args.no_coalescing else Coalescer()
+
 APP = FastAPI()
 
+# 推理在专用的单线程执行器中进行, 事件循环只负责收发, 不会被推理阻塞
+infer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts_infer")
+_STREAM_END = object()
+
+batch_scheduler: BatchScheduler = None
+if args.batch_scheduler and worker_pool is not None:
+    print("Batch scheduler is disabled with multiple workers")
+elif args.batch_scheduler:
+    batch_scheduler = BatchScheduler(
+        tts_pipeline,
+        max_wait=args.max_wait_ms / 1000,
+        max_batch_size=args.max_batch_size,
+        max_batch_tokens=args.max_batch_tokens,
+    )
+    batch_scheduler.start()
+
+max_running = args.max_running
+if max_running <= 0:
+    if worker_pool is not None:
+        max_running = args.workers
+    elif batch_scheduler is not None:
+        max_running = args.max_batch_size
+    else:
+        max_running = 1
+# 准入控制, 只在事件循环线程中使用
+admission = AdmissionController(max_running, args.max_queue, args.tenant_limit, args.max_phones)
+
+
+def collect_server_metrics() -> dict:
+    admission_stats = admission.stats()
+    values = {
+        "tts_pending_jobs": admission_stats["running"] + sum(admission_stats["queued"].values()),
+        "tts_max_queue": args.max_queue,
+        "tts_admission_running": admission_stats["running"],
+        "tts_admission_max_running": admission_stats["max_running"],
+    }
+    for priority in PRIORITIES:
+        values[f"tts_admission_queued_{priority}"] = admission_stats["queued"][priority]
+        values[f"tts_admission_predicted_wait_{priority}"] = admission_stats["predicted_wait"][priority]
+    voice_stats = tts_pipeline.voice_cache.stats()
+    for key in ["entries", "bytes", "hits", "misses", "evictions"]:
+        values[f"tts_voice_cache_{key}"] = voice_stats[key]
+    model_stats = model_registry.stats()
+    for key in ["entries", "bytes", "loads", "evictions"]:
+        values[f"tts_model_registry_{key}"] = model_stats[key]
+    if response_cache is not None:
+        cache_stats = response_cache.stats()
+        for key in ["entries", "bytes", "hits", "misses", "evictions"]:
+            values[f"tts_response_cache_{key}"] = cache_stats[key]
+    if coalescer is not None:
+        coalescer_stats = coalescer.stats()
+        values["tts_coalescing_inflight"] = coalescer_stats["inflight"]
+        values["tts_coalescing_started"] = coalescer_stats["started"]
+    if batch_scheduler is not None:
+        values["tts_scheduler_batches"] = batch_scheduler.batches
+        values["tts_scheduler_batched_sentences"] = batch_scheduler.batched_sentences
+    if worker_pool is not None:
+        workers = worker_pool.stats()["workers"]
+        values["tts_workers_alive"] = sum(w["alive"] for w in workers)
+        values["tts_workers_running"] = sum(w["running"] for w in workers)
+    return values
+
+
+metrics.REGISTRY.add_collector(collect_server_metrics)
+
+
+async def run_in_infer_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    if worker_pool is not None and getattr(func, "__self__", None) is tts_pipeline:
+        # 多进程时在每个工作进程中执行 (如切换权重)
+        return await loop.run_in_executor(None, worker_pool.call_all, func.__name__, *args)
+    if batch_scheduler is not None:
+        # 动态批处理时模型归调度线程所有, 切换权重等操作排在两个批次之间执行
+        return await loop.run_in_executor(infer_executor, batch_scheduler.run_in_scheduler, func, *args)
+    return await loop.run_in_executor(infer_executor, func, *args)
+
+
+async def run_blocking(func, *args):
+    # 编码等阻塞操作放到默认线程池, 不占用推理线程
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+
+def request_key(req: dict):
+    """
+    Canonical hash of a request, shared by the response cache and request coalescing.
+    None when the request is not deterministic.
+    """
+    # 动态批处理时不使用 seed, 输出不可复现
+    if batch_scheduler is not None:
+        return None
+    # 调度相关的参数不影响输出
+    req = {k: v for k, v in req.items() if k not in ["priority", "tenant", "deadline_ms"]}
+    weights_paths = [
+        req.get("gpt_weights_path") or tts_config.t2s_weights_path,
+        req.get("sovits_weights_path") or tts_config.vits_weights_path,
+    ]
+    extra = {"version": tts_config.version, "is_half": tts_config.is_half, "device": str(tts_config.device)}
+    try:
+        return request_hasher.make_key(req, weights_paths, extra)
+    except OSError:
+        # 文件不存在等错误交给推理流程报告
+        return None
+
+
+async def acquire_inference_slot(req: dict, http_request: Request = None):
+    """
+    Wait for admission (see admission.py), the request leaves the queue if the client disconnects meanwhile.
+    Returns a release function, safe to call more than once and from any thread.
+    Raises AdmissionRejected when the request is rejected or shed.
+    """
+    priority = req.get("priority") or ("interactive" if req.get("return_fragment") else "batch")
+    tenant = req.get("tenant") or (http_request.headers.get("X-Tenant-Id", "") if http_request is not None else "")
+    deadline = req.get("deadline_ms")
+    deadline = deadline / 1000 if deadline else None
+    watcher: asyncio.Task = None
+    if http_request is not None:
+        watcher = asyncio.create_task(watch_disconnect(http_request, asyncio.current_task()))
+    try:
+        ticket = await admission.acquire(req.get("text", ""), tts_config.version, priority, tenant, deadline)
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+    loop = asyncio.get_running_loop()
+    return lambda: loop.call_soon_threadsafe(admission.release, ticket)
+
+
+def admission_rejected_response(e: AdmissionRejected) -> JSONResponse:
+    headers = {"Retry-After": str(e.retry_after)} if e.status_code in [429, 503] else None
+    return JSONResponse(status_code=e.status_code, content={"message": e.message}, headers=headers)
+
+
+async def iterate_in_infer_executor(tts_generator: Generator, buffer_size: int) -> AsyncGenerator:
+    """
+    Drive a blocking TTS generator on the inference executor and yield its items asynchronously.
+    At most buffer_size items are computed ahead of the consumer, so a slow client pauses the generator
+    instead of buffering the whole audio. The generator is closed when the consumer stops early.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, buffer_size))
+
+    async def producer():
+        try:
+            while True:
+                item = await run_in_infer_executor(next, tts_generator, _STREAM_END)
+                await queue.put(item)
+                if item is _STREAM_END:
+                    break
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.create_task(producer())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+        # 客户端断开时关闭推理生成器, 排在执行器中正在进行的 next 之后
+        infer_executor.submit(tts_generator.close)
+
+
+async def iterate_submitted(req: dict, pipeline: TTS, context: RequestContext) -> AsyncGenerator:
+    """
+    Submit a request to the worker pool or the batch scheduler and yield its (sr, audio) fragments in order.
+    The request is cancelled when the consumer stops early.
+    Stage timings are collected in context, with the batch scheduler cancellation goes through it too.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_output(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    if worker_pool is not None:
+        request = worker_pool.submit(req, on_output, context=context)
+    else:
+        request = batch_scheduler.submit(req, on_output, tts=pipeline, context=context)
+    completed = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                completed = True
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not completed:
+            request.cancel()
+
+
+async def encode_response(
+    fragments: List[np.ndarray], sr: int, media_type: str, context: RequestContext
+) -> Union[bytes, memoryview]:
+    """
+    Encode the concatenated fragments as a whole response. int16 wav/raw responses are built without intermediate
+    copies: the samples are written once, straight into the response body (a single fragment is sent as is in raw).
+    """
+    t0 = time.perf_counter()
+    if media_type in ["wav", "raw"] and all(
+        fragment.dtype == np.int16 and fragment.ndim == 1 for fragment in fragments
+    ):
+        if media_type == "raw" and len(fragments) == 1:
+            data = pcm_view(fragments[0])
+        else:
+            header = wav_header(sr, sum(fragment.nbytes for fragment in fragments)) if media_type == "wav" else b""
+            data = await run_blocking(pack_pcm, fragments, header)
+    else:
+        audio_data = np.concatenate(fragments, 0) if len(fragments) > 1 else fragments[0]
+        data = (await run_blocking(pack_audio, BytesIO(), audio_data, sr, media_type)).getvalue()
+    context.add_timing("encode", time.perf_counter() - t0)
+    return data
+
+
+def join_audio(chunks: List[Union[bytes, memoryview]]) -> Union[bytes, memoryview]:
+    # 非流式响应只有一块, 不再拷贝
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+async def select_pipeline(req: dict) -> TTS:
+    # 多进程时由工作进程加载其他模型
+    if worker_pool is None and (req.get("gpt_weights_path") or req.get("sovits_weights_path")):
+        # 其他模型在加载线程中加载, 不阻塞推理线程
+        return await asyncio.wrap_future(
+            model_registry.load_async(req.get("gpt_weights_path"), req.get("sovits_weights_path"))
+        )
+    return tts_pipeline
+
+
+async def produce_audio(req: dict, pipeline: TTS, context: RequestContext, cache_key: str = None) -> AsyncGenerator:
+    """
+    Run a checked request and yield its encoded response: the chunks of a streaming response, or the whole audio.
+    The response is stored in the response cache under cache_key (if given) once it is complete.
+    Admission and cancelling the context are left to the caller.
+    """
+    media_type = req.get("media_type", "wav")
+    submitted = worker_pool is not None or batch_scheduler is not None
+
+    if not req.get("streaming_mode", False):
+        if submitted:
+            fragments = [item async for item in iterate_submitted(req, pipeline, context)]
+            if len(fragments) == 0:
+                raise RuntimeError("tts pipeline returned no audio")
+            sr = fragments[0][0]
+            fragments = [fragment for _, fragment in fragments]
+        else:
+            tts_generator = pipeline.run(req, context)
+            try:
+                result = await run_in_infer_executor(next, tts_generator, _STREAM_END)
+                if context.failed:
+                    # 推理失败时先返回占位的静音, 继续迭代以重置模型并抛出原始异常
+                    await run_in_infer_executor(next, tts_generator, _STREAM_END)
+                    raise RuntimeError("tts pipeline failed")
+            finally:
+                infer_executor.submit(tts_generator.close)
+            if result is _STREAM_END:
+                raise RuntimeError("tts pipeline returned no audio")
+            sr, audio_data = result
+            fragments = [audio_data]
+        stopped = context.is_cancelled()
+        data = await encode_response(fragments, sr, media_type, context)
+        if cache_key is not None and not stopped:
+            await run_blocking(response_cache.put, cache_key, data)
+        yield data
+        return
+
+    if submitted:
+        audio_iterator = iterate_submitted(req, pipeline, context)
+    else:
+        audio_iterator = iterate_in_infer_executor(pipeline.run(req, context), args.stream_buffer)
+    encoder: StreamEncoder = None
+    # 可缓存的请求记录完整的响应
+    cached_chunks = [] if cache_key is not None else None
+    try:
+        if_frist_chunk = True
+        async for sr, chunk in audio_iterator:
+            data = b""
+            if if_frist_chunk and media_type == "wav":
+                data = wave_header_chunk(sample_rate=sr)
+                media_type = "raw"
+                if_frist_chunk = False
+            if media_type == "raw":
+                # 直接发送音频数组的内存, 只有第一块与 wav 头拼接
+                data = data + pcm_view(chunk) if data else pcm_view(chunk)
+            else:
+                # 整个响应共用一个编码器, 输出单个连续的音频流
+                if encoder is None:
+                    encoder = await run_blocking(create_encoder, media_type, sr)
+                t0 = time.perf_counter()
+                data = await run_blocking(encoder.encode, chunk)
+                context.add_timing("encode", time.perf_counter() - t0)
+            if data:
+                if cached_chunks is not None:
+                    cached_chunks.append(data)
+                yield data
+        if encoder is not None:
+            data = await run_blocking(encoder.finish)
+            if data:
+                if cached_chunks is not None:
+                    cached_chunks.append(data)
+                yield data
+        if cached_chunks is not None and not context.is_cancelled():
+            await run_blocking(response_cache.put, cache_key, b"".join(cached_chunks))
+    finally:
+        if encoder is not None:
+            encoder.close()
+
+
+def response_headers(req: dict, context: RequestContext, server_timing: bool = True):
+    """
+    Server-Timing (--server_timing) and X-Trace-Id (profiled requests) headers, from the context of a request
+    that has started. X-Trace-Skipped is sent instead of X-Trace-Id when the request could not be profiled.
+    Args:
+        server_timing: bool, False for streaming responses, whose headers are sent before the timings are complete.
+    """
+    headers = {}
+    if server_timing and args.server_timing:
+        headers["Server-Timing"] = metrics.server_timing(context.timings)
+    if req.get("profile"):
+        if context.trace_id is not None:
+            headers["X-Trace-Id"] = context.trace_id
+        elif context.trace_skipped:
+            headers["X-Trace-Skipped"] = "another request is being profiled"
+    return headers or None
+
+
+async def watch_disconnect(http_request: Request, task: asyncio.Task, interval: float = 0.1):
+    """
+    Cancel task when the client disconnects.
+    Streaming responses are cancelled by starlette itself, this covers requests still waiting for the full audio.
+    """
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(interval)
+    task.cancel()
+
 
 class TTS_Request(BaseModel):
     text: str = None
@@ -154,6 +719,9 @@ class TTS_Request(BaseModel):
     aux_ref_audio_paths: list = None
     prompt_lang: str = None
     prompt_text: str = ""
+    voice_profile: str = None
+    gpt_weights_path: str = None
+    sovits_weights_path: str = None
     top_k: int = 5
     top_p: float = 1
     temperature: float = 1
@@ -170,12 +738,16 @@ class TTS_Request(BaseModel):
     repetition_penalty: float = 1.35
     sample_steps: int = 32
     super_sampling: bool = False
+    profile: Union[bool, str] = False
+    trace_id: str = None
+    priority: str = None
+    tenant: str = None
+    deadline_ms: float = None
 
 
 ### modify from https://github.com/RVC-Boss/GPT-SoVITS/pull/894/files
 def pack_ogg(io_buffer: BytesIO, data: np.ndarray, rate: int):
-    with sf.SoundFile(io_buffer, mode="w", samplerate=rate, channels=1, format="ogg") as audio_file:
-        audio_file.write(data)
+    io_buffer.write(encode_audio("ogg", data, rate))
     return io_buffer
 
 
@@ -190,41 +762,16 @@ def pack_wav(io_buffer: BytesIO, data: np.ndarray, rate: int):
     return io_buffer
 
 
-def pack_aac(io_buffer: BytesIO, data: np.ndarray, rate: int):
-    process = subprocess.Popen(
-        [
-            "ffmpeg",
-            "-f",
-            "s16le",  # 输入16位有符号小端整数PCM
-            "-ar",
-            str(rate),  # 设置采样率
-            "-ac",
-            "1",  # 单声道
-            "-i",
-            "pipe:0",  # 从管道读取输入
-            "-c:a",
-            "aac",  # 音频编码器为AAC
-            "-b:a",
-            "192k",  # 比特率
-            "-vn",  # 不包含视频
-            "-f",
-            "adts",  # 输出AAC数据流格式
-            "pipe:1",  # 将输出写入管道
-        ],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
-    out, _ = process.communicate(input=data.tobytes())
-    io_buffer.write(out)
+def pack_aac(io_buffer: BytesIO, data: np.ndarray, rate: int, media_type: str = "aac"):
+    io_buffer.write(encode_audio(media_type, data, rate))
     return io_buffer
 
 
 def pack_audio(io_buffer: BytesIO, data: np.ndarray, rate: int, media_type: str):
     if media_type == "ogg":
         io_buffer = pack_ogg(io_buffer, data, rate)
-    elif media_type == "aac":
-        io_buffer = pack_aac(io_buffer, data, rate)
+    elif media_type in ["aac", "mp3"]:
+        io_buffer = pack_aac(io_buffer, data, rate, media_type)
     elif media_type == "wav":
         io_buffer = pack_wav(io_buffer, data, rate)
     else:
@@ -233,20 +780,45 @@ def pack_audio(io_buffer: BytesIO, data: np.ndarray, rate: int, media_type: str)
     return io_buffer
 
 
-# from https://huggingface.co/spaces/coqui/voice-chat-with-mistral/blob/main/app.py
-def wave_header_chunk(frame_input=b"", channels=1, sample_width=2, sample_rate=32000):
-    # This will create a wave header then append the frame input
-    # It should be first on a streaming wav file
-    # Other frames better should not have it (else you will hear some artifacts each chunk start)
-    wav_buf = BytesIO()
-    with wave.open(wav_buf, "wb") as vfout:
-        vfout.setnchannels(channels)
-        vfout.setsampwidth(sample_width)
-        vfout.setframerate(sample_rate)
-        vfout.writeframes(frame_input)
+WAV_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
 
-    wav_buf.seek(0)
-    return wav_buf.read()
+
+def wav_header(sample_rate: int, data_size: int = 0, channels: int = 1, sample_width: int = 2) -> bytes:
+    """
+    Canonical 44-byte PCM wav header, data_size 0 when the length is unknown (streaming).
+    """
+    block_align = channels * sample_width
+    return WAV_HEADER.pack(
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, channels, sample_rate,
+        sample_rate * block_align, block_align, sample_width * 8, b"data", data_size,
+    )  # fmt: skip
+
+
+# It should be first on a streaming wav file
+# Other frames better should not have it (else you will hear some artifacts each chunk start)
+@lru_cache(maxsize=None)
+def wave_header_chunk(channels=1, sample_width=2, sample_rate=32000):
+    # 只与音频格式有关, 每种格式只生成一次
+    return wav_header(sample_rate, 0, channels, sample_width)
+
+
+def pcm_view(data: np.ndarray) -> memoryview:
+    """
+    The samples as bytes without copying them, the array stays alive as long as the view.
+    """
+    return memoryview(np.ascontiguousarray(data)).cast("B")
+
+
+def pack_pcm(fragments: List[np.ndarray], header: bytes = b"") -> memoryview:
+    """
+    header followed by the concatenated fragments, the samples are copied once into the preallocated body.
+    """
+    nbytes = sum(fragment.nbytes for fragment in fragments)
+    body = bytearray(len(header) + nbytes)
+    body[: len(header)] = header
+    out = np.frombuffer(body, dtype=fragments[0].dtype, offset=len(header))
+    np.concatenate(fragments, 0, out=out)
+    return memoryview(body)
 
 
 def handle_control(command: str):
@@ -265,8 +837,10 @@ def check_params(req: dict):
     media_type: str = req.get("media_type", "wav")
     prompt_lang: str = req.get("prompt_lang", "")
     text_split_method: str = req.get("text_split_method", "cut5")
+    voice_profile: str = req.get("voice_profile", None)
+    use_profile = voice_profile not in [None, ""]
 
-    if ref_audio_path in [None, ""]:
+    if ref_audio_path in [None, ""] and not use_profile:
         return JSONResponse(status_code=400, content={"message": "ref_audio_path is required"})
     if text in [None, ""]:
         return JSONResponse(status_code=400, content={"message": "text is required"})
@@ -277,31 +851,55 @@ def check_params(req: dict):
             status_code=400,
             content={"message": f"text_lang: {text_lang} is not supported in version {tts_config.version}"},
         )
-    if prompt_lang in [None, ""]:
+    if use_profile:
+        pass
+    elif prompt_lang in [None, ""]:
         return JSONResponse(status_code=400, content={"message": "prompt_lang is required"})
     elif prompt_lang.lower() not in tts_config.languages:
         return JSONResponse(
             status_code=400,
             content={"message": f"prompt_lang: {prompt_lang} is not supported in version {tts_config.version}"},
         )
-    if media_type not in ["wav", "raw", "ogg", "aac"]:
+    if media_type not in ["wav", "raw", *STREAMING_MEDIA_TYPES]:
         return JSONResponse(status_code=400, content={"message": f"media_type: {media_type} is not supported"})
-    elif media_type == "ogg" and not streaming_mode:
-        return JSONResponse(status_code=400, content={"message": "ogg format is not supported in non-streaming mode"})
 
     if text_split_method not in cut_method_names:
         return JSONResponse(
             status_code=400, content={"message": f"text_split_method:{text_split_method} is not supported"}
         )
 
+    if req.get("priority") not in [None, "", *PRIORITIES]:
+        return JSONResponse(status_code=400, content={"message": f"priority must be one of {PRIORITIES}"})
+    deadline_ms = req.get("deadline_ms")
+    if deadline_ms is not None and (not isinstance(deadline_ms, (int, float)) or deadline_ms < 0):
+        return JSONResponse(status_code=400, content={"message": "deadline_ms must be a non-negative number"})
+
+    profile = req.get("profile", False)
+    if profile in [True, "true", "True", "1"]:
+        req["profile"] = profile = "torch"
+    elif profile in [False, None, "", "false", "False", "0"]:
+        req["profile"] = profile = False
+    if profile:
+        if profile not in profiling.PROFILE_MODES:
+            return JSONResponse(status_code=400, content={"message": f"profile: {profile} is not supported"})
+        if batch_scheduler is not None:
+            return JSONResponse(
+                status_code=400, content={"message": "profile is not supported with the batch scheduler"}
+            )
+        if req.get("trace_id") in [None, ""]:
+            req["trace_id"] = profiling.new_trace_id()
+        elif not profiling.check_trace_id(req["trace_id"]):
+            return JSONResponse(status_code=400, content={"message": "trace_id may only contain [0-9A-Za-z_-]"})
+
     return None
 
 
-async def tts_handle(req: dict):
+async def tts_handle(req: dict, http_request: Request = None):
     """
     Text to speech handler.
 
     Args:
+        http_request (Request): (optional) the client connection, inference is cancelled when it disconnects.
         req (dict):
             {
                 "text": "",                   # str.(required) text to be synthesized
@@ -310,6 +908,9 @@ async def tts_handle(req: dict):
                 "aux_ref_audio_paths": [],    # list.(optional) auxiliary reference audio paths for multi-speaker synthesis
                 "prompt_text": "",            # str.(optional) prompt text for the reference audio
                 "prompt_lang": "",            # str.(required) language of the prompt text for the reference audio
+                "voice_profile": "",          # str.(optional) precompiled voice profile (.npz), replaces the reference parameters above
+                "gpt_weights_path": "",       # str.(optional) GPT weights of this request, default: the loaded model
+                "sovits_weights_path": "",    # str.(optional) SoVITS weights of this request, default: the loaded model
                 "top_k": 5,                   # int. top k sampling
                 "top_p": 1,                   # float. top p sampling
                 "temperature": 1,             # float. temperature for sampling
@@ -320,17 +921,23 @@ async def tts_handle(req: dict):
                 "speed_factor":1.0,           # float. control the speed of the synthesized audio.
                 "fragment_interval":0.3,      # float. to control the interval of the audio fragment.
                 "seed": -1,                   # int. random seed for reproducibility.
-                "media_type": "wav",          # str. media type of the output audio, support "wav", "raw", "ogg", "aac".
+                "media_type": "wav",          # str. media type of the output audio, support "wav", "raw", "ogg", "aac", "mp3".
                 "streaming_mode": False,      # bool. whether to return a streaming response.
                 "parallel_infer": True,       # bool.(optional) whether to use parallel inference.
                 "repetition_penalty": 1.35    # float.(optional) repetition penalty for T2S model.
                 "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
                 "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+                "profile": False,             # bool|str.(optional) profile this request, "torch" or "sampling".
+                "trace_id": "",               # str.(optional) id the trace is stored under, returned in X-Trace-Id.
+                "priority": "",               # str.(optional) "interactive" or "batch", default: interactive for streaming requests.
+                "tenant": "",                 # str.(optional) tenant of the request, default: the X-Tenant-Id header.
+                "deadline_ms": None,          # float.(optional) longest acceptable queue wait, 429 + Retry-After beyond it.
             }
     returns:
         StreamingResponse: audio stream response.
     """
 
+    start_time = time.perf_counter()
     streaming_mode = req.get("streaming_mode", False)
     return_fragment = req.get("return_fragment", False)
     media_type = req.get("media_type", "wav")
@@ -339,38 +946,155 @@ async def tts_handle(req: dict):
     if check_res is not None:
         return check_res
 
+    key = None if req.get("profile") else await run_blocking(request_key, req)
+    cache_key = key if response_cache is not None else None
+    if cache_key is not None:
+        cached_file = response_cache.get(cache_key)
+        if cached_file is not None:
+            metrics.REQUESTS.inc(status="cached")
+            return StreamingResponse(
+                iter_file(cached_file),
+                media_type=f"audio/{media_type}",
+                headers={"Content-Length": str(os.fstat(cached_file.fileno()).st_size)},
+                background=BackgroundTask(cached_file.close),
+            )
+
     if streaming_mode or return_fragment:
         req["return_fragment"] = True
 
+    if key is not None and coalescer is not None:
+        return await coalesced_tts_handle(key, req, http_request, start_time)
+
     try:
-        tts_generator = tts_pipeline.run(req)
+        release = await acquire_inference_slot(req, http_request)
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except asyncio.CancelledError:
+        return Response(status_code=499)
+
+    handed_off = False
+    context = RequestContext(req.get("parallel_infer", True))
+    watcher: asyncio.Task = None
+    try:
+        pipeline = await select_pipeline(req)
 
         if streaming_mode:
-
-            def streaming_generator(tts_generator: Generator, media_type: str):
-                if_frist_chunk = True
-                for sr, chunk in tts_generator:
-                    if if_frist_chunk and media_type == "wav":
-                        yield wave_header_chunk(sample_rate=sr)
-                        media_type = "raw"
-                        if_frist_chunk = False
-                    yield pack_audio(BytesIO(), chunk, sr, media_type).getvalue()
+            # 先取第一块再发送响应头: 推理开始后才知道请求是否被性能分析 (X-Trace-Id)
+            if http_request is not None:
+                watcher = asyncio.create_task(watch_disconnect(http_request, asyncio.current_task()))
+            audio_chunks = produce_audio(req, pipeline, context, cache_key)
+            try:
+                first_data = await audio_chunks.__anext__()
+            except StopAsyncIteration:
+                first_data = b""
+            readiness.record_request(time.perf_counter() - start_time)
+
+            async def streaming_generator():
+                try:
+                    yield first_data
+                    async for data in audio_chunks:
+                        yield data
+                finally:
+                    # 客户端断开时停止解码, 正常结束时无影响
+                    context.cancel()
+                    await audio_chunks.aclose()
+                    release()
 
             # _media_type = f"audio/{media_type}" if not (streaming_mode and media_type in ["wav", "raw"]) else f"audio/x-{media_type}"
+            handed_off = True
             return StreamingResponse(
-                streaming_generator(
-                    tts_generator,
-                    media_type,
-                ),
+                streaming_generator(),
                 media_type=f"audio/{media_type}",
+                headers=response_headers(req, context, server_timing=False),
+                background=BackgroundTask(release),
             )
 
-        else:
-            sr, audio_data = next(tts_generator)
-            audio_data = pack_audio(BytesIO(), audio_data, sr, media_type).getvalue()
-            return Response(audio_data, media_type=f"audio/{media_type}")
+        if http_request is not None:
+            watcher = asyncio.create_task(watch_disconnect(http_request, asyncio.current_task()))
+        audio_data = join_audio([data async for data in produce_audio(req, pipeline, context, cache_key)])
+        readiness.record_request(time.perf_counter() - start_time)
+        return Response(audio_data, media_type=f"audio/{media_type}", headers=response_headers(req, context))
+    except asyncio.CancelledError:
+        # 客户端已断开
+        return Response(status_code=499)
     except Exception as e:
         return JSONResponse(status_code=400, content={"message": "tts failed", "Exception": str(e)})
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if not handed_off:
+            context.cancel()
+            release()
+
+
+async def coalesced_tts_handle(key: str, req: dict, http_request: Request, start_time: float):
+    """
+    Serve a deterministic request from the identical synthesis in flight, or start a shared one.
+    The synthesis runs in its own task (see coalescing.py), it is cancelled when every caller has disconnected.
+    """
+    streaming_mode = req.get("streaming_mode", False)
+    media_type = req.get("media_type", "wav")
+    if not req.get("tenant") and http_request is not None:
+        req["tenant"] = http_request.headers.get("X-Tenant-Id", "")
+
+    def producer_factory(synthesis: SharedSynthesis):
+        synthesis.context = RequestContext(req.get("parallel_infer", True))
+
+        async def producer():
+            # 合成不属于任何一个客户端, 准入排队时不随第一个客户端断开而取消
+            release = await acquire_inference_slot(req)
+            try:
+                pipeline = await select_pipeline(req)
+                cache_key = key if response_cache is not None else None
+                async for data in produce_audio(req, pipeline, synthesis.context, cache_key):
+                    yield data
+            finally:
+                synthesis.context.cancel()
+                release()
+
+        return producer()
+
+    synthesis, joined = coalescer.join(key, producer_factory)
+    chunks = synthesis.subscribe()
+    watcher: asyncio.Task = None
+    if http_request is not None:
+        watcher = asyncio.create_task(watch_disconnect(http_request, asyncio.current_task()))
+    try:
+        try:
+            first_data = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_data = b""
+
+        if streaming_mode:
+            readiness.record_request(time.perf_counter() - start_time)
+
+            async def streaming_generator():
+                try:
+                    yield first_data
+                    async for data in chunks:
+                        yield data
+                finally:
+                    await chunks.aclose()
+
+            return StreamingResponse(
+                streaming_generator(),
+                media_type=f"audio/{media_type}",
+                headers=response_headers(req, synthesis.context, server_timing=False),
+            )
+
+        audio_data = join_audio([first_data] + [data async for data in chunks])
+        readiness.record_request(time.perf_counter() - start_time)
+        return Response(audio_data, media_type=f"audio/{media_type}", headers=response_headers(req, synthesis.context))
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except asyncio.CancelledError:
+        # 客户端已断开
+        return Response(status_code=499)
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"message": "tts failed", "Exception": str(e)})
+    finally:
+        if watcher is not None:
+            watcher.cancel()
 
 
 @APP.get("/control")
@@ -382,12 +1106,16 @@ async def control(command: str = None):
 
 @APP.get("/tts")
 async def tts_get_endpoint(
+    http_request: Request,
     text: str = None,
     text_lang: str = None,
     ref_audio_path: str = None,
     aux_ref_audio_paths: list = None,
     prompt_lang: str = None,
     prompt_text: str = "",
+    voice_profile: str = None,
+    gpt_weights_path: str = None,
+    sovits_weights_path: str = None,
     top_k: int = 5,
     top_p: float = 1,
     temperature: float = 1,
@@ -404,6 +1132,11 @@ async def tts_get_endpoint(
     repetition_penalty: float = 1.35,
     sample_steps: int = 32,
     super_sampling: bool = False,
+    profile: str = "",
+    trace_id: str = None,
+    priority: str = None,
+    tenant: str = None,
+    deadline_ms: float = None,
 ):
     req = {
         "text": text,
@@ -411,7 +1144,10 @@ async def tts_get_endpoint(
         "ref_audio_path": ref_audio_path,
         "aux_ref_audio_paths": aux_ref_audio_paths,
         "prompt_text": prompt_text,
-        "prompt_lang": prompt_lang.lower(),
+        "prompt_lang": prompt_lang.lower() if prompt_lang else prompt_lang,
+        "voice_profile": voice_profile,
+        "gpt_weights_path": gpt_weights_path,
+        "sovits_weights_path": sovits_weights_path,
         "top_k": top_k,
         "top_p": top_p,
         "temperature": temperature,
@@ -428,20 +1164,268 @@ async def tts_get_endpoint(
         "repetition_penalty": float(repetition_penalty),
         "sample_steps": int(sample_steps),
         "super_sampling": super_sampling,
+        "profile": profile,
+        "trace_id": trace_id,
+        "priority": priority,
+        "tenant": tenant,
+        "deadline_ms": deadline_ms,
     }
-    return await tts_handle(req)
+    return await tts_handle(req, http_request)
 
 
 @APP.post("/tts")
-async def tts_post_endpoint(request: TTS_Request):
+async def tts_post_endpoint(request: TTS_Request, http_request: Request):
     req = request.dict()
-    return await tts_handle(req)
+    return await tts_handle(req, http_request)
+
+
+WS_VOICE_KEYS = ["ref_audio_path", "aux_ref_audio_paths", "prompt_text", "prompt_lang", "voice_profile"]
+WS_PARAM_KEYS = [
+    *WS_VOICE_KEYS,
+    "text_lang",
+    "top_k",
+    "top_p",
+    "temperature",
+    "text_split_method",
+    "batch_size",
+    "speed_factor",
+    "fragment_interval",
+    "seed",
+    "media_type",
+    "parallel_infer",
+    "repetition_penalty",
+    "sample_steps",
+    "super_sampling",
+    "tenant",
+]
+
+
+class WebSocketSession:
+    """
+    One /tts/ws connection (see the protocol in the documentation at the top of this file).
+    Text deltas are segmented as they arrive, complete sentences are queued and synthesized one after another
+    by a worker task, so synthesis overlaps with the client still sending text.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.params: dict = None
+        self.segmenter: StreamingTextSegmenter = None
+        # ("sentence", text, params) / ("flushed",) / ("end",)
+        self.sentences: asyncio.Queue = asyncio.Queue()
+        self.worker: asyncio.Task = None
+        self.send_lock = asyncio.Lock()
+        self.seq = 0
+        self.sentence_index = 0
+
+    async def send_json(self, message: dict):
+        async with self.send_lock:
+            await self.websocket.send_json(message)
+
+    async def send_audio(self, data: bytes):
+        async with self.send_lock:
+            await self.websocket.send_bytes(struct.pack(">I", self.seq) + data)
+        self.seq += 1
+
+    async def send_error(self, message: str, **extra):
+        await self.send_json({"type": "error", "message": message, **extra})
+
+    def check(self, params: dict):
+        """
+        Normalize the session parameters in place, returns an error message or None.
+        """
+        for key in ["text_lang", "prompt_lang"]:
+            if params.get(key):
+                params[key] = params[key].lower()
+        if params.get("media_type") not in ["raw", *STREAMING_MEDIA_TYPES]:
+            return f"media_type: {params.get('media_type')} is not supported, use raw or {STREAMING_MEDIA_TYPES}"
+        check_res = check_params({**params, "text": "-"})
+        if check_res is not None:
+            return json.loads(check_res.body)["message"]
+        return None
+
+    async def warm_voice(self, params: dict):
+        # 音色在推理线程(或各工作进程)中预先加载到音色缓存, 第一句不必等待参考音频处理
+        await run_in_infer_executor(
+            tts_pipeline.prepare_voice,
+            params.get("ref_audio_path"),
+            params.get("aux_ref_audio_paths"),
+            params.get("prompt_text"),
+            params.get("prompt_lang"),
+            params.get("voice_profile"),
+        )
+
+    def enqueue(self, sentences: list):
+        for text in sentences:
+            self.sentences.put_nowait(("sentence", text, self.params))
+
+    async def serve(self):
+        while True:
+            try:
+                message = json.loads(await self.websocket.receive_text())
+            except json.JSONDecodeError:
+                await self.send_error("messages must be JSON objects")
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            if kind == "start":
+                await self.start(message)
+            elif self.params is None:
+                await self.send_error("send a start message first")
+            elif kind == "text":
+                self.enqueue(self.segmenter.push(message.get("text") or ""))
+            elif kind == "flush":
+                self.enqueue(self.segmenter.flush())
+                self.sentences.put_nowait(("flushed",))
+            elif kind == "voice":
+                await self.change_voice(message)
+            elif kind == "cancel":
+                await self.cancel()
+            elif kind == "end":
+                self.enqueue(self.segmenter.flush())
+                self.sentences.put_nowait(("end",))
+                await self.worker
+                await self.websocket.close()
+                return
+            else:
+                await self.send_error(f"unknown message type: {kind}")
+
+    async def start(self, message: dict):
+        if self.params is not None:
+            await self.send_error("session already started")
+            return
+        params = {"text_split_method": "cut5", "media_type": "raw"}
+        params.update({key: message[key] for key in WS_PARAM_KEYS if message.get(key) is not None})
+        if not params.get("tenant"):
+            params["tenant"] = self.websocket.headers.get("X-Tenant-Id", "")
+        error = self.check(params)
+        if error is not None:
+            await self.send_error(error)
+            return
+        try:
+            await self.warm_voice(params)
+        except Exception as e:
+            await self.send_error("load voice failed", Exception=str(e))
+            return
+        self.params = params
+        self.segmenter = StreamingTextSegmenter(
+            tts_pipeline.text_preprocessor, params["text_lang"], params["text_split_method"]
+        )
+        self.worker = asyncio.create_task(self.synthesize_loop())
+        await self.send_json({"type": "ready"})
+
+    async def change_voice(self, message: dict):
+        params = {**self.params, **{key: message[key] for key in WS_VOICE_KEYS if key in message}}
+        error = self.check(params)
+        if error is not None:
+            await self.send_error(error)
+            return
+        try:
+            await self.warm_voice(params)
+        except Exception as e:
+            await self.send_error("load voice failed", Exception=str(e))
+            return
+        # 切换前收到的文本仍使用原来的音色
+        self.enqueue(self.segmenter.flush())
+        self.params = params
+        await self.send_json({"type": "voice_changed"})
+
+    async def cancel(self):
+        self.segmenter.reset()
+        while not self.sentences.empty():
+            self.sentences.get_nowait()
+        # 取消工作协程即停止当前句子的推理并释放准入名额
+        self.worker.cancel()
+        await asyncio.gather(self.worker, return_exceptions=True)
+        self.worker = asyncio.create_task(self.synthesize_loop())
+        await self.send_json({"type": "cancelled"})
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+
+    async def synthesize_loop(self):
+        while True:
+            item = await self.sentences.get()
+            if item[0] == "end":
+                await self.send_json({"type": "done"})
+                return
+            if item[0] == "flushed":
+                await self.send_json({"type": "flushed"})
+                continue
+            await self.synthesize(item[1], item[2])
+
+    async def synthesize(self, text: str, params: dict):
+        index = self.sentence_index
+        self.sentence_index += 1
+        media_type = params["media_type"]
+        # 文本已经切分好, 不再切分
+        req = {**params, "text": text, "text_split_method": "cut0", "return_fragment": True, "priority": "interactive"}
+        try:
+            release = await acquire_inference_slot(req)
+        except AdmissionRejected as e:
+            await self.send_error(e.message, sentence=index, status=e.status_code, retry_after=e.retry_after)
+            return
+
+        context = RequestContext(req.get("parallel_infer", True))
+        encoder: StreamEncoder = None
+        started = False
+        samples = 0
+        try:
+            if worker_pool is not None or batch_scheduler is not None:
+                audio_iterator = iterate_submitted(req, tts_pipeline, context)
+            else:
+                audio_iterator = iterate_in_infer_executor(tts_pipeline.run(req, context), args.stream_buffer)
+            async for sr, chunk in audio_iterator:
+                if not started:
+                    started = True
+                    message = {"type": "sentence_start", "sentence": index, "text": text, "seq": self.seq}
+                    await self.send_json({**message, "sample_rate": sr, "media_type": media_type})
+                samples += len(chunk)
+                if media_type == "raw":
+                    data = pcm_view(chunk)
+                else:
+                    if encoder is None:
+                        encoder = await run_blocking(create_encoder, media_type, sr)
+                    data = await run_blocking(encoder.encode, chunk)
+                if data:
+                    await self.send_audio(data)
+            if encoder is not None:
+                data = await run_blocking(encoder.finish)
+                if data:
+                    await self.send_audio(data)
+            if started:
+                await self.send_json(
+                    {"type": "sentence_end", "sentence": index, "seq": self.seq - 1, "duration": samples / sr}
+                )
+        except (asyncio.CancelledError, WebSocketDisconnect):
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            await self.send_error("tts failed", sentence=index, Exception=str(e))
+        finally:
+            context.cancel()
+            if encoder is not None:
+                encoder.close()
+            release()
+
+
+@APP.websocket("/tts/ws")
+async def tts_websocket(websocket: WebSocket):
+    await websocket.accept()
+    session = WebSocketSession(websocket)
+    try:
+        await session.serve()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
 
 
 @APP.get("/set_refer_audio")
 async def set_refer_aduio(refer_audio_path: str = None):
     try:
-        tts_pipeline.set_ref_audio(refer_audio_path)
+        await run_in_infer_executor(tts_pipeline.set_ref_audio, refer_audio_path)
     except Exception as e:
         return JSONResponse(status_code=400, content={"message": "set refer audio failed", "Exception": str(e)})
     return JSONResponse(status_code=200, content={"message": "success"})
@@ -471,7 +1455,7 @@ async def set_gpt_weights(weights_path: str = None):
     try:
         if weights_path in ["", None]:
             return JSONResponse(status_code=400, content={"message": "gpt weight path is required"})
-        tts_pipeline.init_t2s_weights(weights_path)
+        await run_in_infer_executor(tts_pipeline.init_t2s_weights, weights_path)
     except Exception as e:
         return JSONResponse(status_code=400, content={"message": "change gpt weight failed", "Exception": str(e)})
 
@@ -483,12 +1467,210 @@ async def set_sovits_weights(weights_path: str = None):
     try:
         if weights_path in ["", None]:
             return JSONResponse(status_code=400, content={"message": "sovits weight path is required"})
-        tts_pipeline.init_vits_weights(weights_path)
+        await run_in_infer_executor(tts_pipeline.init_vits_weights, weights_path)
     except Exception as e:
         return JSONResponse(status_code=400, content={"message": "change sovits weight failed", "Exception": str(e)})
     return JSONResponse(status_code=200, content={"message": "success"})
 
 
+@APP.get("/load_model")
+async def load_model(gpt_weights_path: str = None, sovits_weights_path: str = None):
+    if worker_pool is not None:
+        return JSONResponse(status_code=400, content={"message": "models are loaded by the workers on demand"})
+    try:
+        await asyncio.wrap_future(model_registry.load_async(gpt_weights_path, sovits_weights_path))
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"message": "load model failed", "Exception": str(e)})
+    return JSONResponse(status_code=200, content={"message": "success"})
+
+
+@APP.get("/unload_model")
+async def unload_model(gpt_weights_path: str = None, sovits_weights_path: str = None):
+    if worker_pool is not None:
+        return JSONResponse(status_code=400, content={"message": "models are loaded by the workers on demand"})
+    try:
+        unloaded = await run_blocking(model_registry.unload, gpt_weights_path, sovits_weights_path)
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"message": "unload model failed", "Exception": str(e)})
+    if not unloaded:
+        return JSONResponse(status_code=400, content={"message": "model is not loaded"})
+    return JSONResponse(status_code=200, content={"message": "success"})
+
+
+@APP.get("/models")
+async def list_models():
+    return JSONResponse(status_code=200, content=model_registry.stats())
+
+
+@APP.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@APP.get("/trace/{trace_id}")
+async def get_trace(trace_id: str):
+    path = profiling.find_trace(trace_id)
+    if path is None:
+        return JSONResponse(status_code=404, content={"message": f"trace {trace_id} not found"})
+    media_type = "application/json" if path.endswith(".json") else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
+class Job_Request(BaseModel):
+    manifest_path: str = None
+    progress_path: str = None
+    shard: int = 0
+    num_shards: int = 1
+    concurrency: int = 0
+
+
+jobs: Dict[str, BulkJob] = {}
+job_tasks: Dict[str, asyncio.Task] = {}
+
+
+async def synthesize_job_item(req: dict):
+    """
+    synthesize function of BulkJob.run: one manifest item through admission control and the inference backend.
+    """
+    req["priority"] = "batch"
+    while True:
+        try:
+            release = await acquire_inference_slot(req)
+            break
+        except AdmissionRejected as e:
+            if e.status_code == 413:
+                raise
+            # 批量任务不丢弃条目, 等待后重试
+            await asyncio.sleep(e.retry_after)
+    context = RequestContext(req.get("parallel_infer", True))
+    try:
+        # 条目可指定自己的 GPT/SoVITS 模型, 与 /tts 相同
+        pipeline = await select_pipeline(req)
+        if worker_pool is not None or batch_scheduler is not None:
+            fragments = [item async for item in iterate_submitted(req, pipeline, context)]
+        else:
+            fragments = [item async for item in iterate_in_infer_executor(pipeline.run(req, context), 1)]
+        if len(fragments) == 0:
+            raise RuntimeError("tts pipeline returned no audio")
+        return fragments[0][0], np.concatenate([fragment for _, fragment in fragments], 0)
+    finally:
+        context.cancel()
+        release()
+
+
+@APP.post("/jobs")
+async def create_job(request: Job_Request):
+    if request.manifest_path in [None, ""]:
+        return JSONResponse(status_code=400, content={"message": "manifest_path is required"})
+    job_id = uuid.uuid4().hex[:12]
+    try:
+        job = await run_blocking(
+            BulkJob,
+            request.manifest_path,
+            request.progress_path,
+            request.shard,
+            request.num_shards,
+            job_id,
+            args.job_output_root,
+        )
+    except (OSError, ValueError) as e:
+        return JSONResponse(status_code=400, content={"message": "load manifest failed", "Exception": str(e)})
+    for other in jobs.values():
+        if other.status == "running" and os.path.abspath(other.progress_path) == os.path.abspath(job.progress_path):
+            return JSONResponse(
+                status_code=409, content={"message": f"job {other.job_id} is running on this progress file"}
+            )
+    jobs[job_id] = job
+    concurrency = request.concurrency if request.concurrency > 0 else max_running
+    task = asyncio.create_task(job.run(synthesize_job_item, concurrency))
+    job_tasks[job_id] = task
+
+    def on_done(task: asyncio.Task):
+        job_tasks.pop(job_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"job {job_id} failed: {task.exception()}")
+
+    task.add_done_callback(on_done)
+    return JSONResponse(status_code=200, content=job.stats())
+
+
+@APP.get("/jobs")
+async def list_jobs():
+    return JSONResponse(status_code=200, content={"jobs": [job.stats() for job in jobs.values()]})
+
+
+@APP.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    if job_id not in jobs:
+        return JSONResponse(status_code=404, content={"message": f"job {job_id} not found"})
+    return JSONResponse(status_code=200, content=jobs[job_id].stats())
+
+
+@APP.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    if job_id not in jobs:
+        return JSONResponse(status_code=404, content={"message": f"job {job_id} not found"})
+    task = job_tasks.get(job_id)
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return JSONResponse(status_code=200, content=jobs[job_id].stats())
+
+
+async def run_warmup():
+    if len(warmup_voices) == 0:
+        readiness.finish()
+        return
+    readiness.begin()
+    try:
+        # 多进程时在每个工作进程中预热, 用时只在本进程统计
+        timings = await run_in_infer_executor(tts_pipeline.warmup, warmup_voices, warmup_full_langs)
+        readiness.finish(timings)
+    except Exception as e:
+        traceback.print_exc()
+        readiness.fail(str(e))
+
+
+@APP.on_event("startup")
+async def start_warmup():
+    asyncio.create_task(run_warmup())
+
+
+@APP.get("/health/live")
+async def health_live():
+    return JSONResponse(status_code=200, content={"status": "alive"})
+
+
+@APP.get("/health/ready")
+async def health_ready():
+    report = readiness.report()
+    ready = readiness.ready
+    if worker_pool is not None and not worker_pool.healthy:
+        # 切换权重部分失败, 各工作进程的模型不一致
+        ready = False
+        report["workers_error"] = worker_pool.error
+    return JSONResponse(status_code=200 if ready else 503, content=report)
+
+
+@APP.get("/admission")
+async def admission_stats():
+    return JSONResponse(status_code=200, content=admission.stats())
+
+
+@APP.get("/cache")
+async def cache_stats():
+    if response_cache is None:
+        return JSONResponse(status_code=200, content={"enabled": False})
+    return JSONResponse(status_code=200, content={"enabled": True, **response_cache.stats()})
+
+
+@APP.get("/workers")
+async def list_workers():
+    if worker_pool is None:
+        return JSONResponse(status_code=200, content={"workers": []})
+    return JSONResponse(status_code=200, content=worker_pool.stats())
+
+
 if __name__ == "__main__":
     try:
         if host == "None":  # 在调用时使用 -a None 参数，可以让api监听双栈
@@ -0,0 +1,137 @@
+"""
+LangSegmenter.getTexts 的基准测试: 把约 1 万字的文档按句切分后逐句调用 getTexts (与 get_phones_and_bert 的调用方式相同),
+对比当前实现 (复用 LangSplitter + 单一文字的快速路径) 与原实现 (每次调用新建 LangSplitter, 不走快速路径) 的耗时.
+同时检查两者的切分结果一致. 需要 split_lang 与 fast_langdetect 的模型 (GPT_SoVITS/pretrained_models/fast_langdetect).
+
+python benchmarks/bench_langsegmenter.py
+python benchmarks/bench_langsegmenter.py --chars 10000 --min_speedup 5  # 任一模式加速比低于 5 倍则返回 1
+
+模式:
+    all_zh   中文文档, default_lang="zh" (all_zh/all_yue), 纯汉字的句子走快速路径
+    auto_en  英文文档, 自动识别 (auto), 纯 ASCII 英文的句子走快速路径
+    auto_zh  中文文档, 自动识别 (auto), 纯汉字的句子仍需语言识别 (可能是只含汉字的日文), 只受益于复用 LangSplitter
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [root_dir, os.path.join(root_dir, "GPT_SoVITS")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+from text.LangSegmenter import LangSegmenter
+
+ZH_SENTENCES = [
+    "先帝创业未半而中道崩殂，今天下三分，益州疲弊，此诚危急存亡之秋也。",
+    "然侍卫之臣不懈于内，忠志之士忘身于外者，盖追先帝之殊遇，欲报之于陛下也。",
+    "今天的气温是23度，湿度百分之六十，适合出门散步。",
+    "这款扩展坞通过连接底部的插槽，扩展出一大堆接口，并且自带电源。",
+    "我们在2024年3月15日发布了新版本，修复了12个问题。",
+    "山不在高，有仙则名；水不在深，有龙则灵。",
+    "你吃饭了吗？还没有呢，一起去吧！",
+    "宫中府中，俱为一体，陟罚臧否，不宜异同。",
+]
+EN_SENTENCES = [
+    "The quick brown fox jumps over the lazy dog.",
+    "We released version 2.5 on March 15, fixing 12 issues.",
+    "Could you send me the report by Friday afternoon?",
+    "It was the best of times, it was the worst of times.",
+    "The temperature today is 23 degrees, with 60% humidity.",
+    "Please restart the server after updating the configuration file!",
+]
+MODES = {
+    "all_zh": (ZH_SENTENCES, "zh"),
+    "auto_en": (EN_SENTENCES, ""),
+    "auto_zh": (ZH_SENTENCES, ""),
+}
+
+
+def make_document(sentences: list, n_chars: int, seed: int) -> list:
+    """
+    Returns the sentences of a document of at least n_chars characters, drawn from sentences.
+    """
+    rng = random.Random(seed)
+    document = []
+    total = 0
+    while total < n_chars:
+        sentence = rng.choice(sentences)
+        document.append(sentence)
+        total += len(sentence)
+    return document
+
+
+def no_fast_path(text, default_lang=""):
+    return None
+
+
+def get_texts_baseline(text: str, default_lang: str):
+    # 原实现: 每次调用新建 LangSplitter, 不走快速路径
+    LangSegmenter._lang_splitter = None
+    return LangSegmenter.getTexts(text, default_lang)
+
+
+def measure(fn, document: list, default_lang: str, repeat: int):
+    """
+    Segment every sentence of the document with fn, returns (best time of repeat runs, segments of the last run).
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = [fn(sentence, default_lang) for sentence in document]
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LangSegmenter.getTexts benchmark")
+    parser.add_argument("--chars", type=int, default=10000, help="文档字数")
+    parser.add_argument("--repeat", type=int, default=3, help="计时次数, 取最快的一次")
+    parser.add_argument("--seed", type=int, default=1234, help="生成文档的随机种子")
+    parser.add_argument("--modes", type=str, default="all_zh,auto_en", help=f"逗号分隔, 可选 {list(MODES)}")
+    parser.add_argument("--min_speedup", type=float, default=0.0, help="加速比低于该值时返回 1, 0 为不检查")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"未知的模式: {mode}")
+
+    # 预热: 加载 jieba 与 fast_langdetect 的模型
+    LangSegmenter.getTexts(ZH_SENTENCES[0])
+
+    ok = True
+    for mode in modes:
+        sentences, default_lang = MODES[mode]
+        document = make_document(sentences, args.chars, args.seed)
+        n_chars = sum(len(sentence) for sentence in document)
+
+        fast_path = LangSegmenter.fast_path
+        LangSegmenter.fast_path = staticmethod(no_fast_path)
+        try:
+            baseline, baseline_result = measure(get_texts_baseline, document, default_lang, args.repeat)
+            reuse, _ = measure(LangSegmenter.getTexts, document, default_lang, args.repeat)
+        finally:
+            LangSegmenter.fast_path = fast_path
+        current, current_result = measure(LangSegmenter.getTexts, document, default_lang, args.repeat)
+
+        mismatched = sum(1 for a, b in zip(baseline_result, current_result) if a != b)
+        speedup = baseline / current
+        ok = ok and mismatched == 0 and (args.min_speedup <= 0 or speedup >= args.min_speedup)
+        print(
+            f"{mode}: {len(document)} 句 {n_chars} 字, 原实现 {baseline * 1000:.1f}ms, "
+            f"复用 LangSplitter {reuse * 1000:.1f}ms, 当前 {current * 1000:.1f}ms, "
+            f"加速比 {speedup:.1f}x, 结果不一致 {mismatched} 句"
+        )
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
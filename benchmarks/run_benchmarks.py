@@ -0,0 +1,323 @@
+"""
+离线基准测试: 用随机初始化的模型 (见 tiny_models.py) 在 CPU 上测量各阶段和端到端的延迟与吞吐, 结果写入 JSON.
+不需要预训练权重, 也不访问网络, 每个性能改动都可以在任意机器上复现和对比.
+
+python benchmarks/run_benchmarks.py --size tiny -o bench_tiny.json
+python benchmarks/run_benchmarks.py --size real -v v2ProPlus,v4 --threads 8 -o bench_real.json
+python benchmarks/run_benchmarks.py --size tiny --baseline bench_tiny.json --max_regression 0.2  # 超过 20% 变慢则返回 1
+
+阶段:
+    bert     BERT 替身, 一句文本
+    t2s      T2S 自回归解码, 一个 batch (固定 token 数, 由 early_stop_num 截断)
+    ref      参考音频处理: HuBERT 替身 + extract_latent + 线性谱
+    vits     SoVITS 解码 (v3/v4 为 decode_encp + CFM, 输出 mel)
+    vocoder  声码器 (仅 v3/v4)
+    e2e      一句文本的 bert + t2s + vits (+ vocoder), 参考音频视为已缓存
+G2P 依赖词典和外部模型, 这里直接使用随机的音素 ID, 不计入耗时.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+import torch
+
+from tiny_models import (
+    V3V4,
+    VERSIONS,
+    VOCODER_CONFIGS,
+    build_bert,
+    build_hubert,
+    build_sovits,
+    build_t2s,
+    build_vocoder,
+    random_audio,
+    refer_spec,
+)
+
+PHONE_ID_RANGE = (1, 300)  # v1/v2 符号表的公共部分
+BERT_VOCAB_SIZE = 21128
+SEMANTIC_HZ = 25
+SPEC_MIN, SPEC_MAX = -12, 2
+
+
+def summarize(times: list) -> dict:
+    ordered = sorted(times)
+    return {
+        "repeat": len(times),
+        "mean": sum(times) / len(times),
+        "p50": ordered[len(ordered) // 2],
+        "p90": ordered[min(len(ordered) - 1, int(round(0.9 * (len(ordered) - 1))))],
+        "min": ordered[0],
+        "max": ordered[-1],
+    }
+
+
+def measure(fn, args):
+    """
+    Run fn args.warmup + args.repeat times with the same seed, returns (summary of the timed runs, last result).
+    """
+    times = []
+    result = None
+    for i in range(args.warmup + args.repeat):
+        torch.manual_seed(args.seed)
+        t0 = time.perf_counter()
+        result = fn()
+        if i >= args.warmup:
+            times.append(time.perf_counter() - t0)
+    return summarize(times), result
+
+
+def random_text(n_phones: int) -> dict:
+    n_chars = math.ceil(n_phones / 2)
+    word2ph = torch.full((n_chars,), 2, dtype=torch.long)
+    word2ph[-1] = n_phones - 2 * (n_chars - 1)
+    return {
+        "phones": torch.randint(*PHONE_ID_RANGE, (n_phones,)),
+        "input_ids": torch.randint(0, BERT_VOCAB_SIZE, (1, n_chars)),
+        "word2ph": word2ph,
+    }
+
+
+def run_t2s(t2s, prompt: dict, texts: list, bert_features: list, args):
+    """
+    Batched T2S decoding as in TTS._predict_semantic, the reference text is prepended to every sentence.
+    Returns:
+        semantic tokens of each sentence, decoding stats.
+    """
+    x = [torch.cat([prompt["phones"], text["phones"]]) for text in texts]
+    bert = [torch.cat([prompt["bert"], feature], 1) for feature in bert_features]
+    x_lens = torch.LongTensor([item.shape[0] for item in x])
+    stats = {}
+    y_list, idx_list = t2s.infer_panel_batch_infer(
+        x,
+        x_lens,
+        prompt["semantic"].expand(len(x), -1),
+        bert,
+        top_k=15,
+        top_p=1,
+        temperature=1,
+        early_stop_num=args.tokens,
+        max_len=x_lens.max(),
+        repetition_penalty=1.35,
+        stats=stats,
+    )
+    stats["tokens"] = sum(int(idx) for idx in idx_list)
+    return [y[-idx:] for y, idx in zip(y_list, idx_list)], stats
+
+
+def run_vits(vits, version: str, codes: torch.Tensor, phones: torch.Tensor, prompt: dict, args) -> torch.Tensor:
+    """
+    SoVITS decoding. Returns the audio for v1/v2/v2Pro/v2ProPlus, the mel spectrogram for v3/v4
+    (CFM chunked as in TTS.using_vocoder_synthesis).
+    """
+    codes = codes.view(1, 1, -1)
+    phones = phones.unsqueeze(0)
+    if version not in V3V4:
+        sv_emb = [prompt["sv_emb"]] if getattr(vits, "is_v2pro", False) else None
+        return vits.decode(codes, phones, [prompt["spec"]], speed=1, sv_emb=sv_emb)[0][0]
+
+    fea_ref, ge = vits.decode_encp(prompt["semantic"].view(1, 1, -1), prompt["phones"].unsqueeze(0), prompt["spec"])
+    mel2 = prompt["mel"]
+    T_min = min(mel2.shape[2], fea_ref.shape[2])
+    mel2 = mel2[:, :, :T_min]
+    fea_ref = fea_ref[:, :, :T_min]
+    T_ref = VOCODER_CONFIGS[version]["T_ref"]
+    if T_min > T_ref:
+        mel2 = mel2[:, :, -T_ref:]
+        fea_ref = fea_ref[:, :, -T_ref:]
+        T_min = T_ref
+    chunk_len = VOCODER_CONFIGS[version]["T_chunk"] - T_min
+    fea_todo, ge = vits.decode_encp(codes, phones, prompt["spec"], ge, 1)
+
+    cfm_resss = []
+    for idx in range(0, fea_todo.shape[-1], chunk_len):
+        fea_todo_chunk = fea_todo[:, :, idx : idx + chunk_len]
+        fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
+        cfm_res = vits.cfm.inference(
+            fea, torch.LongTensor([fea.size(1)]), mel2, args.sample_steps, inference_cfg_rate=0
+        )
+        cfm_res = cfm_res[:, :, mel2.shape[2] :]
+        mel2 = cfm_res[:, :, -T_min:]
+        fea_ref = fea_todo_chunk[:, :, -T_min:]
+        cfm_resss.append(cfm_res)
+    cfm_res = torch.cat(cfm_resss, 2)
+    return (cfm_res + 1) / 2 * (SPEC_MAX - SPEC_MIN) + SPEC_MIN
+
+
+def bench_common(t2s, bert, prompt: dict, args) -> dict:
+    results = {}
+    text = random_text(args.phones)
+    results["bert"], _ = measure(lambda: bert(text["input_ids"], text["word2ph"]), args)
+
+    texts = [random_text(args.phones) for _ in range(args.batch_size)]
+    bert_features = [bert(text["input_ids"], text["word2ph"]) for text in texts]
+    results["t2s"], (_, stats) = measure(lambda: run_t2s(t2s, prompt, texts, bert_features, args), args)
+    results["t2s"].update(
+        batch_size=args.batch_size,
+        tokens=stats["tokens"],
+        tokens_per_second=stats["tokens"] / results["t2s"]["p50"],
+        prefill=stats.get("prefill", 0.0),
+        seconds_per_step=stats["decode"] / stats["steps"] if stats.get("steps") else 0.0,
+    )
+    return results
+
+
+def bench_version(version: str, t2s, bert, hubert, prompt: dict, args) -> dict:
+    results = {}
+    torch.manual_seed(args.seed)
+    vits = build_sovits(version, args.size)
+    vocoder = build_vocoder(version, args.size) if version in V3V4 else None
+    sr = VOCODER_CONFIGS[version]["sr"] if version in V3V4 else 32000
+
+    ref_32k = random_audio(args.ref_seconds, 32000)
+    ref_16k = random_audio(args.ref_seconds, 16000)
+
+    def prepare_ref():
+        codes = vits.extract_latent(hubert(ref_16k))
+        return codes, refer_spec(ref_32k, version)
+
+    results["ref"], (_, spec) = measure(prepare_ref, args)
+    prompt = dict(prompt, spec=spec)
+    if version in V3V4:
+        T_ref = VOCODER_CONFIGS[version]["T_ref"]
+        prompt["mel"] = torch.rand(1, 100, T_ref) * 2 - 1
+
+    text = random_text(args.phones)
+    codes = torch.randint(0, 1024, (args.tokens,))
+    results["vits"], output = measure(lambda: run_vits(vits, version, codes, text["phones"], prompt, args), args)
+    if vocoder is not None:
+        mel = output
+        results["vocoder"], audio = measure(lambda: vocoder(mel)[0][0], args)
+    else:
+        audio = output
+    audio_seconds = audio.shape[-1] / sr
+    results["vits"]["audio_seconds"] = audio_seconds
+    results["vits"]["rtf"] = results["vits"]["p50"] / audio_seconds
+    if vocoder is not None:
+        results["vocoder"]["rtf"] = results["vocoder"]["p50"] / audio_seconds
+
+    def e2e():
+        bert_feature = bert(text["input_ids"], text["word2ph"])
+        semantic, _ = run_t2s(t2s, prompt, [text], [bert_feature], args)
+        output = run_vits(vits, version, semantic[0], text["phones"], prompt, args)
+        return vocoder(output)[0][0] if vocoder is not None else output
+
+    results["e2e"], audio = measure(e2e, args)
+    results["e2e"]["audio_seconds"] = audio.shape[-1] / sr
+    results["e2e"]["rtf"] = results["e2e"]["p50"] / results["e2e"]["audio_seconds"]
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> bool:
+    """
+    Print the p50 change of every stage against a previous run, returns False if any stage regressed by more
+    than max_regression (a ratio, ignored when <= 0).
+    """
+    if baseline["meta"].get("size") != results["meta"]["size"]:
+        print(f"警告: 基准的模型规模 ({baseline['meta'].get('size')}) 与本次 ({results['meta']['size']}) 不同")
+    ok = True
+    for group, stages in results["results"].items():
+        for stage, data in stages.items():
+            old = baseline["results"].get(group, {}).get(stage)
+            if old is None:
+                continue
+            change = data["p50"] / old["p50"] - 1
+            regressed = max_regression > 0 and change > max_regression
+            ok = ok and not regressed
+            flag = "  <-- 变慢" if regressed else ""
+            print(f"{group}/{stage}: {old['p50'] * 1000:.1f}ms -> {data['p50'] * 1000:.1f}ms ({change:+.1%}){flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPT-SoVITS offline benchmark with randomly initialised models")
+    parser.add_argument("-v", "--versions", type=str, default="v2,v2ProPlus,v4", help=f"逗号分隔, 可选 {VERSIONS}")
+    parser.add_argument("--size", type=str, default="tiny", choices=["tiny", "real"], help="模型规模")
+    parser.add_argument("--threads", type=int, default=0, help="torch 线程数, 0 为默认值")
+    parser.add_argument("--repeat", type=int, default=5, help="每个阶段计时的次数")
+    parser.add_argument("--warmup", type=int, default=1, help="每个阶段计时前的预热次数")
+    parser.add_argument("--seed", type=int, default=1234, help="随机种子, 模型初始化与每次运行都使用")
+    parser.add_argument("--phones", type=int, default=60, help="每句文本的音素数")
+    parser.add_argument("--tokens", type=int, default=150, help="T2S 每句生成的语义 token 数 (early_stop_num)")
+    parser.add_argument("-b", "--batch_size", type=int, default=4, help="t2s 阶段的 batch 大小")
+    parser.add_argument("--ref_seconds", type=float, default=5.0, help="参考音频时长")
+    parser.add_argument("--sample_steps", type=int, default=32, help="v3/v4 的 CFM 采样步数")
+    parser.add_argument("-o", "--output", type=str, default="", help="结果 JSON 的保存路径")
+    parser.add_argument("--baseline", type=str, default="", help="与之前保存的结果 JSON 对比")
+    parser.add_argument(
+        "--max_regression", type=float, default=0.0, help="与基准相比变慢超过该比例时返回 1, 0 为不检查"
+    )
+    args = parser.parse_args()
+
+    versions = [v.strip() for v in args.versions.split(",") if v.strip()]
+    for version in versions:
+        if version not in VERSIONS:
+            parser.error(f"未知的版本: {version}")
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    output = {
+        "meta": {
+            "size": args.size,
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "threads": torch.get_num_threads(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    with torch.inference_mode():
+        torch.manual_seed(args.seed)
+        t2s = build_t2s(args.size)
+        bert = build_bert(args.size)
+        hubert = build_hubert(args.size)
+        n_prompt_phones = args.phones // 2
+        prompt = {
+            "phones": torch.randint(*PHONE_ID_RANGE, (n_prompt_phones,)),
+            "bert": torch.zeros(1024, n_prompt_phones),
+            "semantic": torch.randint(0, 1024, (1, int(args.ref_seconds * SEMANTIC_HZ))),
+            "sv_emb": torch.rand(1, 20480),
+        }
+
+        print(f"############ common ({args.size}) ############")
+        output["results"]["common"] = bench_common(t2s, bert, prompt, args)
+        for version in versions:
+            print(f"############ {version} ({args.size}) ############")
+            output["results"][version] = bench_version(version, t2s, bert, hubert, prompt, args)
+
+    print("\n" + "=" * 60)
+    for group, stages in output["results"].items():
+        for stage, data in stages.items():
+            extra = ""
+            if "tokens_per_second" in data:
+                extra = f", {data['tokens_per_second']:.1f} tokens/s, {data['seconds_per_step'] * 1000:.2f}ms/step"
+            elif "rtf" in data:
+                extra = f", RTF {data['rtf']:.3f}"
+            print(f"{group}/{stage}: p50 {data['p50'] * 1000:.1f}ms, mean {data['mean'] * 1000:.1f}ms{extra}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n" + "=" * 60)
+        if not compare(output, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+随机初始化的 T2S / SoVITS / CFM / 声码器, 以及形状正确的 BERT / HuBERT 替身, 供离线基准测试使用.
+
+模型结构来自仓库自带的配置 (GPT_SoVITS/configs/s1.yaml, s2.json, s2v2Pro.json, s2v2ProPlus.json,
+BigVGAN/configs/bigvgan_v2_24khz_100band_256x.json), 不需要任何预训练权重, 也不访问网络.
+size="real" 与正式模型的规模一致, size="tiny" 缩小层数与通道数, 用于快速的回归检查.
+"""
+
+import copy
+import json
+import os
+import sys
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in [root_dir, os.path.join(root_dir, "GPT_SoVITS")]:
+    if path not in sys.path:
+        sys.path.append(path)
+
+import torch
+import yaml
+from torch import nn
+
+from AR.models.t2s_model import Text2SemanticDecoder
+from BigVGAN.bigvgan import BigVGAN
+from BigVGAN.env import AttrDict
+from f5_tts.model import DiT
+from module.mel_processing import spectrogram_torch
+from module.models import CFM, Generator, SynthesizerTrn, SynthesizerTrnV3
+
+configs_dir = os.path.join(root_dir, "GPT_SoVITS", "configs")
+bigvgan_config_path = os.path.join(root_dir, "GPT_SoVITS", "BigVGAN", "configs", "bigvgan_v2_24khz_100band_256x.json")
+
+VERSIONS = ["v1", "v2", "v2Pro", "v2ProPlus", "v3", "v4"]
+V3V4 = ["v3", "v4"]
+SOVITS_CONFIGS = {
+    "v1": "s2.json",
+    "v2": "s2.json",
+    "v2Pro": "s2v2Pro.json",
+    "v2ProPlus": "s2v2ProPlus.json",
+    "v3": "s2.json",
+    "v4": "s2.json",
+}
+# 与 TTS.init_vocoder 一致
+VOCODER_CONFIGS = {
+    "v3": {"sr": 24000, "T_ref": 468, "T_chunk": 934, "upsample_rate": 256},
+    "v4": {"sr": 48000, "T_ref": 500, "T_chunk": 1000, "upsample_rate": 480},
+}
+V4_VOCODER = dict(
+    initial_channel=100,
+    resblock="1",
+    resblock_kernel_sizes=[3, 7, 11],
+    resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
+    upsample_rates=[10, 6, 2, 2, 2],
+    upsample_initial_channel=512,
+    upsample_kernel_sizes=[20, 12, 4, 4, 4],
+    gin_channels=0,
+    is_bias=True,
+)
+
+# 各规模在配置文件基础上覆盖的参数
+SIZES = {
+    "real": {
+        "t2s": {},
+        "sovits": {},
+        "dit": dict(dim=1024, depth=22, heads=16, ff_mult=2, conv_layers=4),
+        "vocoder": {},
+        "bert": dict(dim=1024, layers=24, heads=16),
+        "hubert": dict(dim=768, layers=12, heads=12),
+    },
+    "tiny": {
+        "t2s": dict(embedding_dim=256, hidden_dim=256, head=8, linear_units=1024, n_layer=4),
+        # MRTE 固定使用 192 通道, inter/hidden_channels 不能缩小
+        "sovits": dict(
+            filter_channels=256,
+            n_layers=2,
+            upsample_initial_channel=128,
+            resblock_kernel_sizes=[3],
+            resblock_dilation_sizes=[[1, 3, 5]],
+        ),
+        "dit": dict(dim=256, depth=4, heads=4, ff_mult=2, conv_layers=1),
+        "vocoder": dict(upsample_initial_channel=128, resblock_kernel_sizes=[3], resblock_dilation_sizes=[[1, 3, 5]]),
+        "bert": dict(dim=1024, layers=2, heads=16),
+        "hubert": dict(dim=768, layers=2, heads=12),
+    },
+}
+
+
+def load_s1_config(size: str = "real") -> dict:
+    with open(os.path.join(configs_dir, "s1.yaml"), "r") as f:
+        config = yaml.safe_load(f)
+    config["model"].update(SIZES[size]["t2s"])
+    return config
+
+
+def load_s2_config(version: str, size: str = "real") -> dict:
+    with open(os.path.join(configs_dir, SOVITS_CONFIGS[version]), "r") as f:
+        config = json.load(f)
+    config["model"].update(SIZES[size]["sovits"])
+    return config
+
+
+def build_t2s(size: str = "real") -> Text2SemanticDecoder:
+    config = load_s1_config(size)
+    model = Text2SemanticDecoder(config, top_k=config["inference"]["top_k"])
+    return model.eval()
+
+
+def build_sovits(version: str, size: str = "real") -> nn.Module:
+    """
+    SynthesizerTrn (v1/v2/v2Pro/v2ProPlus) or SynthesizerTrnV3 (v3/v4), built as in TTS.init_vits_weights.
+    For size != "real" the CFM of v3/v4 is replaced by a smaller DiT.
+    """
+    config = load_s2_config(version, size)
+    kwargs = copy.deepcopy(config["model"])
+    kwargs["version"] = version
+    model_cls = SynthesizerTrnV3 if version in V3V4 else SynthesizerTrn
+    model = model_cls(
+        config["data"]["filter_length"] // 2 + 1,
+        config["train"]["segment_size"] // config["data"]["hop_length"],
+        n_speakers=config["data"]["n_speakers"],
+        **kwargs,
+    )
+    if version in V3V4 and size != "real":
+        model.cfm = CFM(100, DiT(**SIZES[size]["dit"], text_dim=512))
+    if hasattr(model, "enc_q"):
+        # 推理不使用后验编码器
+        del model.enc_q
+    return model.eval()
+
+
+def build_vocoder(version: str, size: str = "real") -> nn.Module:
+    """
+    BigVGAN (v3) or HiFiGAN Generator (v4), weight norm removed as in TTS.init_vocoder.
+    """
+    if version == "v3":
+        with open(bigvgan_config_path, "r") as f:
+            h = AttrDict(json.load(f))
+        h.update(SIZES[size]["vocoder"])
+        vocoder = BigVGAN(h, use_cuda_kernel=False)
+    elif version == "v4":
+        vocoder = Generator(**{**V4_VOCODER, **SIZES[size]["vocoder"]})
+    else:
+        raise ValueError(f"{version} has no separate vocoder")
+    vocoder.remove_weight_norm()
+    return vocoder.eval()
+
+
+class StubBert(nn.Module):
+    """
+    Stand-in for chinese-roberta-wwm-ext-large: a transformer encoder of the same width over random character
+    embeddings, expanded to phone level like TextPreprocessor.get_bert_feature.
+    """
+
+    def __init__(self, dim: int = 1024, layers: int = 24, heads: int = 16, vocab_size: int = 21128):
+        super().__init__()
+        self.embedding = nn.Embedding(vocab_size, dim)
+        layer = nn.TransformerEncoderLayer(dim, heads, dim * 4, dropout=0.0, batch_first=True)
+        self.encoder = nn.TransformerEncoder(layer, layers)
+
+    def forward(self, input_ids: torch.LongTensor, word2ph: torch.LongTensor) -> torch.Tensor:
+        """
+        Args:
+            input_ids: (1, n_chars)
+            word2ph: (n_chars,), phones per character.
+        Returns:
+            phone level features, (dim, n_phones)
+        """
+        hidden = self.encoder(self.embedding(input_ids))[0]
+        return hidden.repeat_interleave(word2ph, dim=0).T
+
+
+class StubHubert(nn.Module):
+    """
+    Stand-in for chinese-hubert-base: 16kHz audio -> (1, 768, frames) SSL features at 50Hz
+    (window 400, hop 320 like the HuBERT feature extractor).
+    """
+
+    def __init__(self, dim: int = 768, layers: int = 12, heads: int = 12):
+        super().__init__()
+        self.feature_extractor = nn.Conv1d(1, 512, 400, stride=320)
+        self.feature_projection = nn.Linear(512, dim)
+        layer = nn.TransformerEncoderLayer(dim, heads, dim * 4, dropout=0.0, batch_first=True)
+        self.encoder = nn.TransformerEncoder(layer, layers)
+
+    def forward(self, wav_16k: torch.Tensor) -> torch.Tensor:
+        features = self.feature_extractor(wav_16k.view(1, 1, -1)).transpose(1, 2)
+        hidden = self.encoder(self.feature_projection(features))
+        return hidden.transpose(1, 2)
+
+
+def build_bert(size: str = "real") -> StubBert:
+    return StubBert(**SIZES[size]["bert"]).eval()
+
+
+def build_hubert(size: str = "real") -> StubHubert:
+    return StubHubert(**SIZES[size]["hubert"]).eval()
+
+
+def random_audio(seconds: float, sr: int) -> torch.Tensor:
+    return (torch.rand(int(seconds * sr)) * 2 - 1) * 0.5
+
+
+def refer_spec(audio_32k: torch.Tensor, version: str) -> torch.Tensor:
+    """
+    Linear spectrogram of a 32kHz reference audio, as in TTS._get_ref_spec.
+    """
+    config = load_s2_config(version)["data"]
+    return spectrogram_torch(
+        audio_32k.unsqueeze(0),
+        config["filter_length"],
+        config["sampling_rate"],
+        config["hop_length"],
+        config["win_length"],
+        center=False,
+    )
@@ -0,0 +1,242 @@
+"""
+流式音频编码器: 一个响应只创建一个编码器, 分片 PCM 依次送入, 编码好的数据随时取出.
+
+- ogg: 进程内 libsndfile (soundfile) 编码, 整个响应只有一个 Ogg 流 (采样率支持时使用 Opus, 否则 Vorbis)
+- aac / mp3: 整个响应只启动一个 ffmpeg 进程, PCM 写入 stdin, 编码结果从 stdout 读出
+
+encoder = create_encoder("ogg", 32000)
+for chunk in chunks:
+    yield encoder.encode(chunk)
+yield encoder.finish()
+"""
+
+import queue
+import subprocess
+import threading
+
+import numpy as np
+import soundfile as sf
+
+OPUS_SAMPLE_RATES = {8000, 12000, 16000, 24000, 48000}
+FFMPEG_FORMATS = {
+    # media_type: (编码器, 输出格式, 16位比特率, 32位比特率)
+    "aac": ("aac", "adts", "128k", "256k"),
+    "mp3": ("libmp3lame", "mp3", "128k", "320k"),
+}
+STREAMING_MEDIA_TYPES = ["ogg", *FFMPEG_FORMATS.keys()]
+
+
+class StreamEncoder:
+    """
+    Encoder state kept for the whole response.
+    encode() takes mono np.int16/np.int32 PCM and returns the bytes encoded so far (possibly empty),
+    finish() flushes the encoder and returns the remaining bytes. close() releases the encoder without flushing.
+    """
+
+    media_type: str = ""
+
+    def encode(self, data: np.ndarray) -> bytes:
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        # 客户端断开时生成器可能不会执行到 finish, 确保不残留 ffmpeg 进程
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class _PageBuffer:
+    """
+    Write-only file object for soundfile, the pages written so far are taken out with take().
+    Ogg is written sequentially, seeking back into pages already taken out is not supported.
+    """
+
+    def __init__(self):
+        self._data = bytearray()
+        self._base = 0
+        self._pos = 0
+
+    def write(self, data) -> int:
+        offset = self._pos - self._base
+        self._data[offset : offset + len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def read(self, size=-1) -> bytes:
+        return b""
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self._base + len(self._data)
+        if offset < self._base:
+            raise ValueError("cannot seek into data already sent")
+        self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        data = bytes(self._data)
+        self._base += len(self._data)
+        self._data.clear()
+        return data
+
+
+class OggEncoder(StreamEncoder):
+    media_type = "ogg"
+    # 分块写入, 避免 libsndfile 编码很长的音频时栈溢出
+    # See: https://github.com/RVC-Boss/GPT-SoVITS/issues/1199
+    block_frames = 1 << 16
+
+    def __init__(self, rate: int, subtype: str = None):
+        if subtype is None:
+            subtype = "OPUS" if rate in OPUS_SAMPLE_RATES and "OPUS" in sf.available_subtypes("OGG") else "VORBIS"
+        self.subtype = subtype
+        self._buffer = _PageBuffer()
+        self._file = sf.SoundFile(self._buffer, mode="w", samplerate=rate, channels=1, format="OGG", subtype=subtype)
+
+    def encode(self, data: np.ndarray) -> bytes:
+        for start in range(0, len(data), self.block_frames):
+            self._file.write(data[start : start + self.block_frames])
+        return self._buffer.take()
+
+    def finish(self) -> bytes:
+        self._file.close()
+        return self._buffer.take()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class FFmpegEncoder(StreamEncoder):
+    """
+    One ffmpeg process per response, a reader thread collects its output so that writing PCM never blocks on a full pipe.
+    """
+
+    def __init__(self, media_type: str, rate: int, sample_width: int = 2, bit_rate: str = None):
+        codec, fmt, bit_rate_16, bit_rate_32 = FFMPEG_FORMATS[media_type]
+        self.media_type = media_type
+        if bit_rate is None:
+            bit_rate = bit_rate_32 if sample_width == 4 else bit_rate_16
+        self._process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-loglevel",
+                "error",
+                "-f",
+                "s32le" if sample_width == 4 else "s16le",  # 输入有符号小端整数PCM
+                "-ar",
+                str(rate),  # 设置采样率
+                "-ac",
+                "1",  # 单声道
+                "-i",
+                "pipe:0",  # 从管道读取输入
+                "-c:a",
+                codec,
+                "-b:a",
+                bit_rate,  # 比特率
+                "-vn",  # 不包含视频
+                "-flush_packets",
+                "1",  # 编码出的数据立即写出
+                "-f",
+                fmt,
+                "pipe:1",  # 将输出写入管道
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._output: queue.Queue = queue.Queue()
+        # 读线程已结束 (输出队列中的 None 已取出)
+        self._eof = False
+        # 读线程不持有编码器本身, 编码器被回收时 __del__ 能结束 ffmpeg
+        self._reader = threading.Thread(
+            target=self._read,
+            args=(self._process.stdout, self._output),
+            name=f"ffmpeg_{media_type}_reader",
+            daemon=True,
+        )
+        self._reader.start()
+
+    @staticmethod
+    def _read(stdout, output: queue.Queue):
+        while True:
+            data = stdout.read1(65536)
+            if not data:
+                break
+            output.put(data)
+        output.put(None)
+
+    def _drain(self, block: bool = False) -> bytes:
+        chunks = []
+        while not self._eof:
+            try:
+                data = self._output.get(block=block)
+            except queue.Empty:
+                break
+            if data is None:
+                self._eof = True
+                break
+            chunks.append(data)
+        return b"".join(chunks)
+
+    def encode(self, data: np.ndarray) -> bytes:
+        self._process.stdin.write(data.tobytes())
+        self._process.stdin.flush()
+        return self._drain()
+
+    def finish(self) -> bytes:
+        self._process.stdin.close()
+        data = self._drain(block=True)
+        returncode = self._process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {returncode} while encoding {self.media_type}")
+        return data
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        for pipe in [self._process.stdin, self._process.stdout]:
+            try:
+                pipe.close()
+            except (OSError, ValueError):
+                pass
+
+
+def create_encoder(media_type: str, rate: int, sample_width: int = 2) -> StreamEncoder:
+    """
+    Args:
+        media_type: str, one of STREAMING_MEDIA_TYPES.
+        sample_width: int, 2 for np.int16 PCM, 4 for np.int32 PCM.
+    """
+    if media_type == "ogg":
+        return OggEncoder(rate)
+    if media_type in FFMPEG_FORMATS:
+        return FFmpegEncoder(media_type, rate, sample_width)
+    raise ValueError(f"media_type: {media_type} is not supported")
+
+
+def encode_audio(media_type: str, data: np.ndarray, rate: int) -> bytes:
+    """
+    Encode a whole audio at once.
+    """
+    with create_encoder(media_type, rate, data.dtype.itemsize) as encoder:
+        return encoder.encode(data) + encoder.finish()
@@ -0,0 +1,144 @@
+"""
+api_v2 压测脚本: 以不同并发数向 /tts 发送请求, 统计吞吐和延迟.
+
+python tools/load_test_api.py -u http://127.0.0.1:9880/tts -r archive_jingyuan_1.wav \
+    -pt "我是「罗浮」云骑将军景元。" -pl zh -n 32 -c 1,4,16
+
+对比 `python api_v2.py` 与 `python api_v2.py -bs` 的结果即可看出跨请求批处理的收益.
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_TEXTS = [
+    "先帝创业未半而中道崩殂，今天下三分，益州疲弊，此诚危急存亡之秋也。",
+    "然侍卫之臣不懈于内，忠志之士忘身于外者，盖追先帝之殊遇，欲报之于陛下也。",
+    "诚宜开张圣听，以光先帝遗德，恢弘志士之气，不宜妄自菲薄，引喻失义，以塞忠谏之路也。",
+    "宫中府中，俱为一体，陟罚臧否，不宜异同。",
+]
+
+
+def send_request(url: str, payload: dict, timeout: float) -> dict:
+    """
+    Send one POST /tts request.
+    Returns:
+        dict with status, ttfb (time to the first audio byte), latency and the response size.
+    """
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    ttfb = None
+    size = 0
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = response.status
+            while True:
+                chunk = response.read(4096)
+                if not chunk:
+                    break
+                if ttfb is None:
+                    ttfb = time.perf_counter() - t0
+                size += len(chunk)
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = -1
+    latency = time.perf_counter() - t0
+    return {"status": status, "ttfb": ttfb if ttfb is not None else latency, "latency": latency, "bytes": size}
+
+
+def run_level(url: str, payloads: list, concurrency: int, timeout: float) -> dict:
+    results = []
+    lock = threading.Lock()
+
+    def task(payload):
+        result = send_request(url, payload, timeout)
+        with lock:
+            results.append(result)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(task, payloads))
+    elapsed = time.perf_counter() - t0
+
+    ok = [r for r in results if r["status"] == 200]
+    latency = np.array([r["latency"] for r in ok]) if ok else np.zeros(1)
+    ttfb = np.array([r["ttfb"] for r in ok]) if ok else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": len(results) - len(ok),
+        "elapsed": elapsed,
+        "throughput": len(ok) / elapsed,
+        "latency_p50": float(np.percentile(latency, 50)),
+        "latency_p95": float(np.percentile(latency, 95)),
+        "ttfb_p50": float(np.percentile(ttfb, 50)),
+        "ttfb_p95": float(np.percentile(ttfb, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="api_v2 load test")
+    parser.add_argument("-u", "--url", type=str, default="http://127.0.0.1:9880/tts", help="/tts 接口地址")
+    parser.add_argument("-r", "--ref_audio_path", type=str, default="", help="参考音频路径(服务端路径)")
+    parser.add_argument("-pt", "--prompt_text", type=str, default="", help="参考音频的文本")
+    parser.add_argument("-pl", "--prompt_lang", type=str, default="zh", help="参考音频的语种")
+    parser.add_argument("-vp", "--voice_profile", type=str, default="", help="预编译音色(服务端路径), 代替参考音频")
+    parser.add_argument("-t", "--texts", type=str, default="", help="待合成文本文件, 每行一条, 默认使用内置文本")
+    parser.add_argument("-tl", "--text_lang", type=str, default="zh", help="待合成文本的语种")
+    parser.add_argument("-n", "--num_requests", type=int, default=32, help="每个并发档位的请求数")
+    parser.add_argument("-c", "--concurrency", type=str, default="1,4,16", help="并发档位, 逗号分隔")
+    parser.add_argument("-s", "--streaming", action="store_true", default=False, help="使用流式响应")
+    parser.add_argument("--timeout", type=float, default=600, help="单个请求超时(秒)")
+    parser.add_argument("-o", "--output", type=str, default="", help="结果写入 json 文件")
+    args = parser.parse_args()
+
+    texts = DEFAULT_TEXTS
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    payloads = []
+    for i in range(args.num_requests):
+        payload = {
+            "text": texts[i % len(texts)],
+            "text_lang": args.text_lang,
+            "ref_audio_path": args.ref_audio_path,
+            "prompt_text": args.prompt_text,
+            "prompt_lang": args.prompt_lang,
+            "text_split_method": "cut5",
+            "media_type": "wav",
+            "streaming_mode": args.streaming,
+        }
+        if args.voice_profile:
+            payload["voice_profile"] = args.voice_profile
+        payloads.append(payload)
+
+    # 预热: 加载参考音色并触发首次推理
+    send_request(args.url, payloads[0], args.timeout)
+
+    report = []
+    print("concurrency  ok/total  req/s   p50(s)  p95(s)  ttfb_p50(s)  ttfb_p95(s)")
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        result = run_level(args.url, payloads, concurrency, args.timeout)
+        report.append(result)
+        print(
+            f"{result['concurrency']:>11}  {result['ok']:>3}/{result['requests']:<4}  {result['throughput']:6.2f}  "
+            f"{result['latency_p50']:6.2f}  {result['latency_p95']:6.2f}  {result['ttfb_p50']:11.2f}  {result['ttfb_p95']:11.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
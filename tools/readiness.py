@@ -0,0 +1,77 @@
+"""
+启动预热与就绪状态, api.py 与 api_v2.py 共用.
+
+/health/live 只表示进程在运行; /health/ready 在预热完成后才返回 200, 负载均衡器据此决定何时转发流量.
+预热的第一次合成用时即冷启动时第一个请求的延迟, 与预热后第一个真实请求的延迟一起报告.
+"""
+
+import threading
+import time
+
+
+class WarmupState:
+    def __init__(self):
+        self.status = "starting"
+        self.error: str = None
+        self.timings: dict = {}
+        self.warmup_seconds: float = None
+        self.first_request_seconds: float = None
+        self._start_time: float = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def begin(self):
+        self.status = "warming_up"
+        self._start_time = time.perf_counter()
+
+    def finish(self, timings: dict = None):
+        """
+        Args:
+            timings: dict, {warm-up item: seconds} in the order they ran, the first one is the cold latency.
+        """
+        if self._start_time is not None:
+            self.warmup_seconds = time.perf_counter() - self._start_time
+            print(f"Warm-up finished in {self.warmup_seconds:.3f}s")
+            for name, seconds in (timings or {}).items():
+                print(f"  {name}: {seconds:.3f}s")
+        self.timings = dict(timings or {})
+        self.status = "ready"
+
+    def fail(self, error: str):
+        self.error = error
+        if self._start_time is not None:
+            self.warmup_seconds = time.perf_counter() - self._start_time
+        self.status = "failed"
+        print(f"Warm-up failed: {error}")
+
+    @property
+    def cold_latency(self) -> float:
+        return next(iter(self.timings.values()), None)
+
+    def record_request(self, seconds: float):
+        """
+        Called with the latency of every successful request, only the first one after warm-up is kept.
+        """
+        if self.first_request_seconds is not None or not self.ready:
+            return
+        with self._lock:
+            if self.first_request_seconds is not None:
+                return
+            self.first_request_seconds = seconds
+        message = f"First request after warm-up: {seconds:.3f}s"
+        if self.cold_latency is not None:
+            message += f" (first synthesis during warm-up: {self.cold_latency:.3f}s)"
+        print(message)
+
+    def report(self) -> dict:
+        return {
+            "status": self.status,
+            "error": self.error,
+            "warmup_seconds": self.warmup_seconds,
+            "warmup_timings": self.timings,
+            "cold_latency": self.cold_latency,
+            "first_request_seconds": self.first_request_seconds,
+        }